@@ -0,0 +1,478 @@
+# =============================================================================
+# ベンチマーク (benchmarks/bench_apps.py)
+# -----------------------------------------------------------------------------
+# 付箋アプリ(sticky_notes.py)と定型文管理アプリ(teikei_kanri.py)の、
+# 「保存・読み込み・一覧の更新」にかかる時間を、件数を変えながら測るスクリプト。
+# 画面は表示しない(Tk のメインウィンドウは隠し、Flet の page は代わりの軽い物を使う)。
+#
+# 測る内容:
+#   sticky_notes     … StickyNotesApp の save_notes / load_notes / update_note_list / update_stats
+#                      (画面を作れない環境では、この4つは飛ばす)
+#   note_stores      … 保存先(JournalJsonStore / SqliteNoteStore)の全件保存・差分保存・読み込み
+#   teikei_kanri     … TemplateManager の load_templates / read_file(flet が無い環境では飛ばす)
+#   teikei_core      … TemplateStore の目録の読み直し・read_file(文字コードが混ざったフォルダ)
+#
+# 結果は JSON で出力する。コミットごとに保存しておき、--compare で前の結果と比べられる。
+#
+# 実行方法(リポジトリの一番上のフォルダで):
+#   python benchmarks/bench_apps.py                        … すべての件数で測り、結果を画面に出す
+#   python benchmarks/bench_apps.py --quick -o bench.json  … 少ない件数で手早く測り、ファイルに保存
+#   python benchmarks/bench_apps.py --compare old.json     … 前の結果より遅くなった項目を表示する
+#                                                            (遅くなった項目があれば終了コード 1)
+# =============================================================================
+
+
+# ===== 1. ライブラリを読み込む =================================================
+
+import argparse      # コマンドライン引数を解釈する標準機能
+import gc            # 測る直前にゴミ集め(ガベージコレクション)を済ませ、測定のぶれを減らす
+import json          # 結果を JSON で書き出す・前の結果を読むための標準機能
+import os            # 作業フォルダの移動(付箋アプリは今のフォルダに保存する)に使う
+import platform      # 結果に OS・Python の情報を書き残すための標準機能
+import statistics    # 中央値を求めるための標準機能
+import subprocess    # 結果に今のコミット(git rev-parse HEAD)を書き残すための標準機能
+import sys           # 上のフォルダのアプリを import できるようにするための標準機能
+import tempfile      # 測定用の付箋・テンプレートを置く一時フォルダを作る標準機能
+import time          # 時間を測る(time.perf_counter)標準機能
+from pathlib import Path
+
+# このスクリプトの1つ上(リポジトリの一番上)にあるアプリを import できるようにする
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import sticky_notes  # noqa: E402  (sys.path を足した後で読み込む)
+import teikei_core   # noqa: E402
+
+SCHEMA_VERSION = 1                             # 結果の JSON の形式の番号
+DEFAULT_SIZES = [100, 1000, 10000, 50000]      # 測る件数(付箋の枚数・テンプレートのファイル数)
+QUICK_SIZES = [100, 1000]                      # --quick のときの件数
+ENCODINGS = ["utf-8", "utf-8-sig", "cp932"]    # テンプレートの文字コード(順番に混ぜる)
+READ_SAMPLE = 200                              # read_file で開くファイルの数(フォルダ全体から均等に選ぶ)
+
+
+# ===== 2. 時間を測る共通処理 ===================================================
+
+def measure(run, repeat, setup=None):
+    """
+    run() を repeat 回動かし、1回ごとの時間(ミリ秒)のリストを返す。
+    setup() を渡すと、毎回 run() の前に呼ぶ(setup の時間は数えない)。
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def result(suite, case, size, times):
+    """測った時間のリストを、結果の JSON の1件(辞書)にまとめる。"""
+    return {
+        "suite": suite,
+        "case": case,
+        "size": size,
+        "repeat": len(times),
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+
+# ===== 3. 測定用のデータを作る =================================================
+
+def make_notes_data(size):
+    """付箋 size 枚ぶんの保存用データ(JournalJsonStore.save に渡す形)を作る。"""
+    colors = ["#FFFF99", "#FFB6C1", "#ADD8E6", "#90EE90"]
+    notes = []
+    for i in range(1, size + 1):
+        notes.append({
+            "id": i,
+            "title": f"付箋 {i}",
+            "content": f"買い物リスト {i}\n牛乳・卵・パン\n" + "メモの本文です。" * 10,
+            "color": colors[i % len(colors)],
+            "x": 100 + i % 500,
+            "y": 100 + i % 300,
+            "timestamp": "2024-01-01T09:00:00",
+        })
+    return {"next_id": size + 1, "notes": notes}
+
+
+def make_template_folder(folder, size):
+    """
+    folder に size 個のテンプレートを作る。
+    文字コードは ENCODINGS を順番に使い、Windows のメモ帳などで作ったファイルが混ざった状態にする。
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(size):
+        text = f"お世話になっております。{i} 番の定型文です。\n{{{{顧客名}}}}様\nよろしくお願いいたします。\n"
+        encoding = ENCODINGS[i % len(ENCODINGS)]
+        (folder / f"template-{i:05d}.txt").write_bytes(text.encode(encoding))
+
+
+def sample(names):
+    """
+    names から READ_SAMPLE 個を均等に選ぶ。
+    1件ずつ開く時間がフォルダの大きさでどう変わるかを見るので、全ファイルは読まない。
+    """
+    step = max(1, len(names) // READ_SAMPLE)
+    return list(names[::step][:READ_SAMPLE])
+
+
+# ===== 4. 付箋アプリ ===========================================================
+
+def bench_note_stores(workdir, sizes, repeat):
+    """保存先(JSON + ジャーナル / SQLite)だけを測る。画面を使わないので、どの環境でも動く。"""
+    results = []
+    for size in sizes:
+        data = make_notes_data(size)
+        # 1枚だけ変わったときの差分保存(ふだんの自動保存)で書き込む内容
+        upserts = {1: {"id": 1, "title": "変更した付箋", "timestamp": "2024-01-02T09:00:00"}}
+        for kind in ("journal", "sqlite"):
+            folder = workdir / f"stores-{kind}-{size}"
+            folder.mkdir()
+            if kind == "sqlite":
+                store = sticky_notes.SqliteNoteStore(str(folder / "notes.db"))
+            else:
+                store = sticky_notes.JournalJsonStore(str(folder / "notes.json"))
+            try:
+                times = measure(lambda: store.save(data), repeat)
+                results.append(result("note_stores", f"{kind}_save", size, times))
+                times = measure(lambda: store.save_changes(size + 1, upserts, set()), repeat)
+                results.append(result("note_stores", f"{kind}_save_changes", size, times))
+                times = measure(store.load, repeat)
+                results.append(result("note_stores", f"{kind}_load", size, times))
+            finally:
+                store.close()
+    return results
+
+
+def open_tk_root():
+    """
+    隠した Tk のメインウィンドウを作って返す。
+    画面が無い環境(DISPLAY が無い Linux のサーバーなど)では None を返す。
+    """
+    try:
+        root = sticky_notes.tk.Tk()
+    except sticky_notes.tk.TclError:
+        return None
+    root.withdraw()  # ウィンドウは表示しない
+    return root
+
+
+def wait_for_writer(app, root):
+    """付箋アプリの書き込みスレッド(BackgroundWriter)の仕事がすべて終わるまで待つ。"""
+    while app.writer.outstanding:
+        root.update()  # root.after() で予約された結果の受け取りを動かす
+        time.sleep(0.0005)
+
+
+def bench_sticky_notes(root, workdir, sizes, repeat):
+    """StickyNotesApp のメソッドを、隠した Tk のウィンドウの上で測る。"""
+    results = []
+    for size in sizes:
+        folder = workdir / f"notes-{size}"
+        empty = folder / "empty"
+        empty.mkdir(parents=True)
+        data_path = str(folder / "sticky_notes_data.json")
+        store = sticky_notes.JournalJsonStore(data_path)
+        store.save(make_notes_data(size))
+        store.close()
+
+        apps = []
+
+        def new_app():
+            # 空のフォルダで起動したアプリに、付箋が入った保存先を持たせる
+            # (load_notes だけを測るため。StickyNotesApp は今のフォルダに保存する)
+            for app in apps:
+                app.writer.close()
+                app.store.close()
+            apps.clear()
+            for child in root.winfo_children():
+                child.destroy()
+            os.chdir(empty)
+            app = sticky_notes.StickyNotesApp(root)
+            app.store.close()
+            app.store = sticky_notes.JournalJsonStore(data_path)
+            app.writer.poll_ms = 1  # 書き込みの終わりをすぐに受け取る(待ち時間を測らないため)
+            apps.append(app)
+
+        # 読み込み(一覧の行をすべて作るところまで含む)
+        times = measure(lambda: apps[0].load_notes(), repeat, setup=new_app)
+        results.append(result("sticky_notes", "load_notes", size, times))
+        app = apps[0]
+
+        # 一覧の更新(何も変わっていないときに、全行を調べ直す時間)
+        times = measure(app.update_note_list, repeat)
+        results.append(result("sticky_notes", "update_note_list", size, times))
+        times = measure(app.update_stats, repeat)
+        results.append(result("sticky_notes", "update_stats", size, times))
+
+        # 全件保存(書き込みスレッドが書き終えるまで)
+        def save_all():
+            app.save_notes()
+            wait_for_writer(app, root)
+        times = measure(save_all, repeat)
+        results.append(result("sticky_notes", "save_notes", size, times))
+
+        # 1枚だけ変わったときの保存(ふだんの自動保存と同じ流れ)
+        note = app.notes[1]
+
+        def save_one():
+            note.mark_dirty("title")
+            app.save_now()
+            wait_for_writer(app, root)
+        times = measure(save_one, repeat)
+        results.append(result("sticky_notes", "save_notes_dirty", size, times))
+
+        app.writer.close()
+        app.store.close()
+        os.chdir(ROOT)
+    return results
+
+
+# ===== 5. 定型文管理アプリ =====================================================
+
+def bench_teikei_core(workdir, sizes, repeat):
+    """TemplateStore(画面を使わない部分)の目録の読み直しと read_file を測る。"""
+    results = []
+    for size in sizes:
+        template_dir = workdir / f"templates-core-{size}" / "template-files"
+        make_template_folder(template_dir, size)
+        cache_dirs = iter(range(10 ** 6))
+        stores = []
+
+        def new_store():
+            # 目録が無い状態(初めての起動・キャッシュを消したとき)から始める。
+            # 前のストアの目録は、後でタイマーが書き出さないよう、ここで書き出しておく
+            for old in stores:
+                old.save_indexes()
+            cache_dir = template_dir.parent / f"cache-{next(cache_dirs)}"
+            stores[:] = [teikei_core.TemplateStore(template_dir, cache_dir)]
+
+        # 目録が無いときの一覧の読み込み(全ファイルの stat)
+        times = measure(lambda: stores[0].index_for("").refresh(), repeat, setup=new_store)
+        results.append(result("teikei_core", "refresh_cold", size, times))
+        store = stores[0]
+        store.index_for("").save()
+        # 目録があり、フォルダが変わっていないときの一覧の読み込み
+        times = measure(lambda: store.index_for("").refresh(), repeat)
+        results.append(result("teikei_core", "refresh_warm", size, times))
+
+        paths = [template_dir / name for name in sample(store.index_for("").names)]
+
+        def read_all(target):
+            for path in paths:
+                target.read_file(path)
+
+        # 文字コードを判定しながら読む(キャッシュが空のストアで)
+        def fresh_store():
+            new_store()
+            stores[0].index_for("").refresh()
+        times = measure(lambda: read_all(stores[0]), repeat, setup=fresh_store)
+        results.append(result("teikei_core", "read_file_cold", size, times))
+        # 2回目以降(内容のキャッシュから返す)
+        times = measure(lambda: read_all(stores[0]), repeat)
+        results.append(result("teikei_core", "read_file_cached", size, times))
+        stores[0].save_indexes()
+    return results
+
+
+class StubPage:
+    """
+    Flet の page の代わり。画面には何も送らず、TemplateManager が使う属性とメソッドだけを持つ。
+    (部品そのもの(ft.ListView など)は本物の flet のものを使う)
+    """
+
+    def __init__(self):
+        self.title = ""
+        self.padding = 0
+        self.overlay = []
+        self.snack_bar = None
+        self.controls = []
+
+    def add(self, *controls):
+        self.controls.extend(controls)
+
+    def update(self, *controls):
+        pass
+
+    def run_task(self, handler, *args):
+        raise RuntimeError("ベンチマークでは非同期モードを使わない")
+
+
+def bench_teikei_kanri(teikei_kanri, workdir, sizes, repeat):
+    """TemplateManager の load_templates / select_template を、代わりの page の上で測る。"""
+    results = []
+    for size in sizes:
+        base = workdir / f"templates-gui-{size}"
+        template_dir = base / "template-files"
+        make_template_folder(template_dir, size)
+        cache_dir = base / ".teikei_cache"
+        managers = []
+
+        def new_manager():
+            # 目録を消してから起動し、起動直後の読み直し(別スレッド)と索引作りが終わるまで待つ
+            for manager in managers:
+                manager.watcher.stop()
+                manager.save_indexes()
+            managers.clear()
+            for path in sorted(cache_dir.rglob("*"), reverse=True):
+                path.unlink() if path.is_file() else path.rmdir()
+            manager = teikei_kanri.TemplateManager(StubPage(), template_dir=template_dir, cache_dir=cache_dir)
+            while not (manager.timer.finished and manager.search_index.built):
+                time.sleep(0.001)
+            managers.append(manager)
+
+        # 一覧の読み込み(目録は起動時に作り終えているので、差分が無いときの時間)
+        times = measure(lambda: managers[0].load_templates(), repeat, setup=new_manager)
+        results.append(result("teikei_kanri", "load_templates", size, times))
+        manager = managers[0]
+        names = sample(manager.index.names)
+
+        def clear_cache():
+            # 内容のキャッシュを空にし、毎回ディスクから読む(文字コードは目録に記録済み)
+            manager.content_cache = teikei_core.ContentCache(manager.content_cache.max_bytes)
+
+        # 一覧のクリックと同じ流れ(read_file で読み、右側のテキスト欄に表示)で開く。
+        # 画面側の処理も含むので、teikei_core の read_file_cold / read_file_cached とは別の項目にする
+        def select_all():
+            for name in names:
+                manager.select_template(name)
+        times = measure(select_all, repeat, setup=clear_cache)
+        results.append(result("teikei_kanri", "select_template", size, times))
+        manager.watcher.stop()
+        manager.save_indexes()
+    return results
+
+
+# ===== 6. 結果の出力と比較 =====================================================
+
+def git_commit():
+    """今のコミットのハッシュ値を返す(git が使えなければ None)。"""
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(report, baseline, threshold):
+    """
+    前の結果 baseline と比べ、(表示する行のリスト, 遅くなった項目の数) を返す。
+    中央値が threshold 倍を超えて遅くなった項目を「遅くなった」とみなす。
+    """
+    old = {(r["suite"], r["case"], r["size"]): r for r in baseline["results"]}
+    lines = []
+    regressions = 0
+    for r in report["results"]:
+        before = old.get((r["suite"], r["case"], r["size"]))
+        if before is None or before["median_ms"] <= 0:
+            continue
+        ratio = r["median_ms"] / before["median_ms"]
+        mark = ""
+        if ratio > threshold:
+            regressions += 1
+            mark = "  ← 遅くなった"
+        lines.append(
+            f"{r['suite']:<14} {r['case']:<22} {r['size']:>6}  "
+            f"{before['median_ms']:>10.2f}ms → {r['median_ms']:>10.2f}ms  x{ratio:.2f}{mark}"
+        )
+    return lines, regressions
+
+
+# ===== 7. 実行の入口 ===========================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="付箋アプリと定型文管理アプリのベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", help="測る件数(既定: 100 1000 10000 50000)")
+    parser.add_argument("--quick", action="store_true", help="少ない件数(100 1000)で手早く測る")
+    parser.add_argument("--repeat", type=int, default=5, help="1項目を何回測るか(既定: 5)")
+    parser.add_argument(
+        "--only", choices=["notes", "templates"], help="片方のアプリだけを測る"
+    )
+    parser.add_argument("-o", "--output", help="結果の JSON を書き出すファイル(省略すると画面に出す)")
+    parser.add_argument("--compare", help="比べる前の結果の JSON ファイル")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25,
+        help="中央値が何倍を超えたら「遅くなった」とみなすか(既定: 1.25)",
+    )
+    parser.add_argument(
+        "--require-all", action="store_true",
+        help="測るはずの対象を1つでも飛ばしたら(DISPLAY や flet が無いなど)終了コード 1 にする(CI 用)",
+    )
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    report = {
+        "schema": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeat": args.repeat,
+        "results": [],
+        "skipped": [],
+    }
+
+    def progress(message):
+        print(message, file=sys.stderr, flush=True)
+
+    with tempfile.TemporaryDirectory(prefix="teikei-bench-") as tmp:
+        workdir = Path(tmp)
+        if args.only in (None, "notes"):
+            progress("note_stores …")
+            report["results"] += bench_note_stores(workdir, sizes, args.repeat)
+            root = open_tk_root()
+            if root is None:
+                report["skipped"].append({"suite": "sticky_notes", "reason": "Tk の画面を作れない(DISPLAY が無い)"})
+            else:
+                progress("sticky_notes …")
+                try:
+                    report["results"] += bench_sticky_notes(root, workdir, sizes, args.repeat)
+                finally:
+                    os.chdir(ROOT)
+                    root.destroy()
+        if args.only in (None, "templates"):
+            # テンプレートは 1 フォルダ 10000 件までにする(50000 個のファイル作りは測定より時間がかかる)
+            template_sizes = [size for size in sizes if size <= 10000]
+            progress("teikei_core …")
+            report["results"] += bench_teikei_core(workdir, template_sizes, args.repeat)
+            try:
+                import teikei_kanri
+            except ImportError as ex:
+                report["skipped"].append({"suite": "teikei_kanri", "reason": f"読み込めない: {ex}"})
+            else:
+                progress("teikei_kanri …")
+                report["results"] += bench_teikei_kanri(teikei_kanri, workdir, template_sizes, args.repeat)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    status = 0
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        lines, regressions = compare(report, baseline, args.threshold)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if regressions:
+            print(f"{regressions} 項目が遅くなりました(x{args.threshold} 超)", file=sys.stderr)
+            status = 1
+    if args.require_all and report["skipped"]:
+        # 結果の JSON は書き出したうえで失敗にする(何が測れなかったかをアーティファクトで確かめられる)
+        for skipped in report["skipped"]:
+            print(f"飛ばした対象: {skipped['suite']}({skipped['reason']})", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
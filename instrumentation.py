@@ -0,0 +1,243 @@
+# =============================================================================
+# 処理時間の計測 (instrumentation.py)
+# -----------------------------------------------------------------------------
+# 付箋アプリ(sticky_notes.py)と定型文管理アプリ(teikei_kanri.py)の「よく呼ばれる処理」
+# (保存・読み込み・一覧の更新など)に時間を測る仕掛けを付け、
+#   ・1秒あたりの呼び出し回数
+#   ・最近の所要時間の分布(ヒストグラム)と中央値・95パーセンタイル・最大
+# を集計するモジュール。どちらのアプリも、--profile を付けて起動したとき
+# (または環境変数で有効にしたとき)だけこのファイルを読み込む。ふだんの起動には影響しない。
+#
+# 呼び出しの記録は「トレースファイル」(Chrome のトレース形式の JSON)に書き出せる。
+# Chrome の chrome://tracing や https://ui.perfetto.dev で開くと、
+# どの処理がどのスレッドでいつ・どれだけ時間を使ったかを時間軸の上で見られる。
+#
+# コードを読む順番:
+#   1) Instrumentation.instrument() … クラスのメソッドを「時間を測る版」に差し替える
+#   2) Instrumentation.record()     … 1回の呼び出しを集計とトレースに記録する
+#   3) MethodStats                  … 処理ごとの回数・所要時間の集計(直近の分だけを持つ)
+#   4) report() / dump_trace()      … 計測パネルの表示と、トレースファイルの書き出し
+#
+# Python 標準ライブラリだけで動く。
+# =============================================================================
+
+
+# ===== 1. ライブラリを読み込む =================================================
+
+import functools            # 差し替えたメソッドに、元のメソッドの名前や説明を引き継ぐ標準機能
+import inspect              # メソッドが async def(コルーチン関数)かどうかを調べる標準機能
+import json                 # トレースファイルを JSON で書き出す標準機能
+import os                   # トレースに入れるプロセス番号(pid)を得る標準機能
+import threading            # 複数のスレッドから同時に記録されても壊れないよう鍵をかける標準機能
+import time                 # 時間を測る(time.perf_counter)標準機能
+from collections import deque  # 古いものから捨てる「長さに上限のあるリスト」
+
+# 所要時間のヒストグラムの区切り(ミリ秒)。「0.1ms 未満」「0.1〜0.5ms」…「1000ms 以上」の10区間
+BUCKET_EDGES_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+# ===== 2. 計測の本体 ===========================================================
+
+class Instrumentation:
+    """
+    メソッドの呼び出しにかかった時間を集計し、トレースとして記録するクラス。
+    集計は直近 window 秒ぶんだけを持つ(古い呼び出しは捨てる)ので、長く動かしてもメモリが増え続けない。
+    """
+
+    def __init__(self, app_name, trace_path=None, window=60.0, rate_window=5.0, max_events=200_000):
+        """
+        - app_name    : トレースに表示するアプリの名前
+        - trace_path  : 終了時などにトレースを書き出すファイル(None なら dump_trace() に渡したときだけ)
+        - window      : ヒストグラムなどの集計に使う、直近の秒数
+        - rate_window : 「1秒あたりの回数」を求めるのに使う、直近の秒数
+        - max_events  : トレースに残す呼び出しの数の上限(超えたら古いものから捨てる)
+        """
+        self.app_name = app_name
+        self.trace_path = trace_path
+        self.window = window
+        self.rate_window = rate_window
+        self.started_at = time.perf_counter()  # トレースの時刻の基準
+        self.stats = {}                        # {処理の名前: MethodStats}
+        self.events = deque(maxlen=max_events)  # トレースの呼び出しの記録(Chrome のトレース形式の辞書)
+        self.thread_names = {}                 # {スレッド番号: スレッド名}(トレースのスレッドの表示名)
+        self.lock = threading.Lock()
+
+    # ----- 2-1. メソッドの差し替え -----
+    def instrument(self, cls, names):
+        """
+        クラス cls のメソッド names を、時間を測る版に差し替える。
+        クラスそのものを書き換えるので、差し替える前に作ったボタンの command= などからの呼び出しも測れる。
+        すでに差し替え済みのメソッド(親クラスで差し替えたものを受け継いでいる場合)はそのままにする。
+        """
+        for name in names:
+            func = getattr(cls, name, None)
+            if func is None or getattr(func, "instrumented", False):
+                continue
+            setattr(cls, name, self.wrap(func))
+
+    def wrap(self, func):
+        """関数 func を、呼ばれるたびに所要時間を記録する関数で包んで返す。"""
+        label = func.__qualname__  # 例: "StickyNotesApp.save_notes"
+
+        if inspect.iscoroutinefunction(func):
+            # async def のメソッドは、await で待っている時間も含めて測る
+            @functools.wraps(func)
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.record(label, started, time.perf_counter())
+            timed_async.instrumented = True
+            return timed_async
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(label, started, time.perf_counter())
+        timed.instrumented = True
+        return timed
+
+    # ----- 2-2. 記録 -----
+    def record(self, name, started, ended):
+        """
+        処理 name の1回の呼び出し(started 〜 ended。どちらも time.perf_counter() の値)を記録する。
+        メソッドの差し替え以外(イベントループの遅れなど)を記録するときにも使う。
+        """
+        thread = threading.current_thread()
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = MethodStats()
+            stats.add(ended, (ended - started) * 1000, self.window)
+            self.thread_names.setdefault(thread.ident, thread.name)
+            # "X" は「始まりと長さを持つ処理」を表す。時刻はマイクロ秒で書く
+            self.events.append({
+                "name": name,
+                "ph": "X",
+                "ts": round((started - self.started_at) * 1e6, 1),
+                "dur": round((ended - started) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": thread.ident,
+            })
+
+    def reset(self):
+        """集計とトレースを空にする(計測パネルの「リセット」)。"""
+        with self.lock:
+            self.stats.clear()
+            self.events.clear()
+
+    # ----- 2-3. 表示と書き出し -----
+    def snapshot(self):
+        """
+        処理ごとの集計を、所要時間の合計が大きい順のリストで返す。
+        各要素は {"name", "calls", "per_sec", "p50_ms", "p95_ms", "max_ms", "histogram"} の辞書。
+        """
+        now = time.perf_counter()
+        with self.lock:
+            rows = [
+                stats.summary(name, now, self.window, self.rate_window)
+                for name, stats in self.stats.items()
+            ]
+        rows.sort(key=lambda row: row["total_ms"], reverse=True)
+        return rows
+
+    def report(self):
+        """計測パネルに表示する文字列(表の形)を作って返す。"""
+        lines = [
+            f"直近 {self.window:.0f} 秒の集計(回/秒 は直近 {self.rate_window:.0f} 秒)",
+            f"{'処理':<40} {'回数':>7} {'回/秒':>7} {'中央値':>9} {'95%':>9} {'最大':>9}",
+        ]
+        rows = self.snapshot()
+        for row in rows:
+            lines.append(
+                f"{row['name']:<40} {row['calls']:>7} {row['per_sec']:>7.1f} "
+                f"{row['p50_ms']:>7.2f}ms {row['p95_ms']:>7.2f}ms {row['max_ms']:>7.2f}ms"
+            )
+            lines.append("    " + format_histogram(row["histogram"]))
+        if not rows:
+            lines.append("(まだ記録がありません)")
+        return "\n".join(lines)
+
+    def dump_trace(self, path=None):
+        """
+        記録した呼び出しを、Chrome のトレース形式の JSON ファイルに書き出し、書き出したパスを返す。
+        path を省略すると、作るときに渡した trace_path に書く。
+        """
+        path = path or self.trace_path
+        if path is None:
+            raise ValueError("トレースの書き出し先が指定されていません")
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        # "M" はメタデータ(プロセス名・スレッド名の表示)
+        meta = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.app_name}}]
+        for tid, name in thread_names.items():
+            meta.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        return path
+
+
+# ===== 3. 処理ごとの集計 =======================================================
+
+class MethodStats:
+    """
+    1つの処理の呼び出し回数と、直近の呼び出しの (終わった時刻, 所要ミリ秒) を持つクラス。
+    古い呼び出しは add() のたびに捨てるので、持っているのは常に直近 window 秒ぶん。
+    """
+
+    def __init__(self, max_samples=10_000):
+        self.calls = 0                             # 起動(またはリセット)からの呼び出し回数
+        self.samples = deque(maxlen=max_samples)   # [(終わった時刻, 所要ミリ秒), ...] 古い順
+
+    def add(self, ended, duration_ms, window):
+        """1回の呼び出しを加え、window 秒より古い呼び出しを捨てる。"""
+        self.calls += 1
+        self.samples.append((ended, duration_ms))
+        while self.samples and self.samples[0][0] < ended - window:
+            self.samples.popleft()
+
+    def summary(self, name, now, window, rate_window):
+        """直近 window 秒の集計を辞書にして返す(Instrumentation.snapshot() の1行)。"""
+        durations = sorted(ms for ended, ms in self.samples if ended >= now - window)
+        recent = sum(1 for ended, _ in self.samples if ended >= now - rate_window)
+        histogram = [0] * (len(BUCKET_EDGES_MS) + 1)
+        for ms in durations:
+            histogram[bucket_of(ms)] += 1
+        return {
+            "name": name,
+            "calls": self.calls,
+            "per_sec": recent / rate_window,
+            "p50_ms": percentile(durations, 0.50),
+            "p95_ms": percentile(durations, 0.95),
+            "max_ms": durations[-1] if durations else 0.0,
+            "total_ms": sum(durations),
+            "histogram": histogram,
+        }
+
+
+def bucket_of(ms):
+    """所要時間 ms が、ヒストグラムの何番目の区間に入るかを返す。"""
+    for i, edge in enumerate(BUCKET_EDGES_MS):
+        if ms < edge:
+            return i
+    return len(BUCKET_EDGES_MS)
+
+
+def percentile(sorted_values, ratio):
+    """小さい順に並んだ値から、下から ratio(0〜1)の位置の値を返す(空なら 0)。"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def format_histogram(histogram):
+    """ヒストグラムを「<0.1ms:3 <0.5ms:10 …」の形の1行にする(0 件の区間は省く)。"""
+    labels = [f"<{edge:g}ms" for edge in BUCKET_EDGES_MS] + [f"≥{BUCKET_EDGES_MS[-1]:g}ms"]
+    parts = [f"{label}:{count}" for label, count in zip(labels, histogram) if count]
+    return " ".join(parts) or "-"
@@ -55,13 +55,58 @@ import json
 
 import os
 # ↑ OS（ファイルシステム）を操作するための機能を提供する標準ライブラリ。
-#   ここでは「ファイルが存在するかどうか」のチェックに使う。
+#   ここでは「ファイルが存在するかどうか」のチェックや、ファイルの置き換えに使う。
+
+import tempfile
+# ↑ 一時ファイルを安全に作るための標準ライブラリ。
+#   保存時に「いったん一時ファイルへ書き、完成したら本物と入れ替える」ために使う。
+
+import sqlite3
+# ↑ Python に標準で付いている軽量データベース SQLite を使うためのライブラリ。
+#   「--storage sqlite」で起動したとき、付箋を1件ずつ更新できる保存先として使う。
+
+import argparse
+# ↑ コマンドライン引数（python sticky_notes.py --storage sqlite など）を解釈する標準ライブラリ。
+
+import re
+# ↑ 「正規表現」で文字列のパターンを探す標準ライブラリ。
+#   ウィンドウの geometry()（"300x400+120+80" の形の文字列）から位置を取り出すのに使う。
+
+import bisect
+# ↑ 並んだリストの「どこに入れれば順番が崩れないか」を高速に探す標準ライブラリ。
+#   付箋一覧に行を追加するとき、ID順の正しい位置を見つけるのに使う。
+
+import unicodedata
+# ↑ 文字の種類（全角・半角など）を扱う標準ライブラリ。
+#   検索で「ＡＢＣ」と「abc」、「ｶﾀｶﾅ」と「カタカナ」を同じ文字として扱うために使う。
+
+import time
+# ↑ 経過時間を測るための標準ライブラリ。
+#   自動保存をまとめる仕組み（SaveScheduler）で「最初の変更から何秒経ったか」を測る。
+
+import threading
+import queue
+# ↑ スレッド（同時に動く別の処理の流れ）と、スレッド間で安全にデータを受け渡す「待ち行列」の標準ライブラリ。
+#   ファイルへの書き込みを別スレッドで行い、書き込み中も画面が固まらないようにするために使う。
 
 from datetime import datetime
 # ↑ 日付と時刻を扱うための標準ライブラリ。
 #   付箋の更新時刻を記録するのに使う。
 
 
+# ============================================================
+# 共通の関数
+# ============================================================
+
+def make_preview(content):
+    """本文から、一覧に表示するプレビュー（最初の25文字、改行はスペース）を作る。"""
+    # 本文が長い場合は最初の25文字＋「...」で表示
+    # スライス記法 [開始:終了] で部分文字列を取得できる
+    preview = content[:25] + "..." if len(content) > 25 else content
+    # 改行をスペースに置換（一覧では1行で見せるため）
+    return preview.replace("\n", " ")
+
+
 # ============================================================
 # クラス定義1：個別の付箋を管理する StickyNote クラス
 # ============================================================
@@ -72,7 +117,21 @@ class StickyNote:
     """個別の付箋を表示するウィンドウ"""
     # ↑ このクラスの役割を示す説明文（docstring）。
 
-    def __init__(self, parent, note_id, title="無題の付箋", content="", color="#FFFF99", x=100, y=100):
+    # 保存データの項目名と、それを入れておく属性名の対応表。
+    # 変更された項目だけを保存するときに、項目名から値を取り出すのに使う。
+    RECORD_ATTRS = {
+        "title": "title_text",
+        "content": "content_text",
+        "color": "color",
+        "x": "x",
+        "y": "y",
+        "timestamp": "timestamp",
+    }
+    # 位置の項目。動かしただけの変更は、内容の変更とは別に数える（mark_moved）
+    POSITION_FIELDS = ("x", "y")
+
+    def __init__(self, parent, note_id, title="無題の付箋", content="", color="#FFFF99", x=100, y=100,
+                 timestamp=None, preview=None):
         """
         コンストラクタ（クラスから実体を作るときに自動で呼ばれる初期化処理）。
 
@@ -84,6 +143,10 @@ class StickyNote:
         - content : 付箋の本文（省略時は空文字）
         - color   : 付箋の背景色（省略時は薄い黄色 #FFFF99）
         - x, y    : ウィンドウを表示する画面上の座標（省略時は100,100）
+        - timestamp : 最後に変更された日時（省略時は今の日時）
+        - preview : 一覧に表示する本文の先頭部分。
+                    content に None を渡すと本文は「まだ読み込んでいない」扱いになり、
+                    最初に必要になったとき保存先から読み込む（起動を速くするため）
 
         引数の「=」付きはデフォルト値で、呼び出し時に省略できる。
         """
@@ -93,13 +156,46 @@ class StickyNote:
         self.note_id = note_id        # この付箋のID
         self.color = color            # 付箋の背景色
         self.title_text = title       # 付箋のタイトル（文字列）
-        self.content_text = content   # 付箋の本文（文字列）
+        self._content = None          # 付箋の本文。None なら未読み込み（content_text から使う）
+        self.preview = preview or ""  # 一覧に表示する本文の先頭部分
+        if content is not None:
+            self.content_text = content   # 付箋の本文（文字列）。プレビューも一緒に作られる
         self.x = x                    # ウィンドウのX座標（横位置）
         self.y = y                    # ウィンドウのY座標（縦位置）
         self.window = None            # 付箋のウィンドウ。最初は未作成なのでNone（無し）。
         self.is_open = False          # ウィンドウが開いているか？ 最初は閉じている。
         self.is_new = (content == "") # 新規作成かどうか（本文が空なら新規とみなす）。
         # ↑ (content == "") は比較式。一致すればTrue、しなければFalseが返る。
+        self.timestamp = timestamp or datetime.now().isoformat()  # 最後に変更された日時
+
+        # ----- 変更の記録（保存するときに「何が変わったか」を知るため） -----
+        self.version = 0              # 内容（タイトル・本文・色）の変更のたびに1増える版番号
+        self.moves = 0                # 位置の変更のたびに1増える番号（更新日時や版番号は変えない）
+        self.dirty_fields = set()     # 前回の保存以降に変わった項目名の集合
+        self.persisted = False        # 保存先に書き込み済みか（読み込んだ付箋は True にする）
+
+    @property
+    def content_text(self):
+        """
+        付箋の本文。
+        起動時は本文を読み込まずにおき、ウィンドウを開くときや検索するときなど、
+        最初に必要になった時点で保存先から読み込む（遅延読み込み）。
+        """
+        # @property を付けると、note.content_text のように変数と同じ書き方で呼び出せる
+        if self._content is None:
+            self._content = self.parent.store.load_body(self.note_id)
+        return self._content
+
+    @content_text.setter
+    def content_text(self, content):
+        """本文を書き換えるときは、一覧用のプレビューも一緒に作り直す。"""
+        self._content = content
+        self.preview = make_preview(content)
+
+    @property
+    def content_loaded(self):
+        """本文を読み込み済みか（まだなら False）。"""
+        return self._content is not None
 
     def create_window(self):
         """付箋ウィンドウを作成する処理。"""
@@ -127,6 +223,9 @@ class StickyNote:
         self.window.title(f"付箋 - {self.title_text}")
         # geometry でウィンドウのサイズと位置を設定。 "幅x高さ+X+Y" の形式。
         self.window.geometry(f"300x400+{self.x}+{self.y}")
+        # 表示された直後の <Configure> は、ウィンドウマネージャーが置いた位置を知らせるだけで
+        # 利用者が動かしたわけではないので、1回目は位置の記録に使わない（開いただけで保存しないため）
+        self.configured = False
         # configure で各種設定を変更。bg = 背景色。
         self.window.configure(bg=self.color)
         self.is_open = True  # ウィンドウが開いた状態としてマーク
@@ -279,6 +378,35 @@ class StickyNote:
         # デフォルトの破棄ではなく、self.close_note を呼ぶように変える。
         self.window.protocol("WM_DELETE_WINDOW", self.close_note)
 
+        # ウィンドウが動いたり大きさが変わったりしたときに呼ばれるイベント。
+        # 位置をここで覚えておけば、保存のたびにウィンドウへ問い合わせなくて済む。
+        self.window.bind("<Configure>", self.on_configure)
+
+    def on_configure(self, event):
+        """ウィンドウが移動・リサイズされたときに呼ばれ、位置を x / y に覚えておく。"""
+        # Toplevel に bind すると中の部品（入力欄など）の Configure も届くので、ウィンドウ本体の分だけを見る
+        if event.widget is not self.window:
+            return
+        if not self.configured:
+            self.configured = True
+            return
+        x, y = self.window_position()
+        changed = [name for name, old, new in (("x", self.x, x), ("y", self.y, y)) if old != new]
+        if changed:
+            self.x, self.y = x, y
+            # 動かしたこの付箋だけを「変更あり」にする（保存は動かし終わってからまとめて行われる）
+            self.mark_moved(*changed)
+
+    def window_position(self):
+        """
+        ウィンドウの位置 (x, y) を、geometry() で指定するときと同じ基準で返す。
+        winfo_x() / winfo_y() はタイトルバーなどの枠の分だけずれることがあるので、
+        Tk が覚えている geometry()（"300x400+120+80" の形。左にはみ出すと "+-5"）から取り出す。
+        どちらも Tk が覚えている値を返すだけなので軽い。
+        """
+        x, y = re.findall(r"[+-](-?\d+)", self.window.geometry())[-2:]
+        return int(x), int(y)
+
     def on_text_change(self, event=None):
         """
         本文のテキストが変更されたときに呼ばれる処理。
@@ -290,25 +418,108 @@ class StickyNote:
         if content:
             # 何か文字があれば「新規」フラグを下ろす
             self.is_new = False
-        # 親アプリに自動保存を依頼
-        self.parent.auto_save()
+        # 矢印キーなど、本文が変わらないキー操作では保存しない
+        if content != self.content_text:
+            self.content_text = content
+            # 変更を記録し、親アプリに自動保存を依頼
+            # （実際の保存は入力が落ち着いてからまとめて行われる）
+            self.mark_dirty("content")
 
     def on_title_change(self, event=None):
         """タイトルが変更されたときに呼ばれる処理。"""
         # 入力欄の文字を取得し、前後の空白を削除
         new_title = self.title_entry.get().strip()
         if new_title:
-            # 入力があればタイトルを更新
-            self.title_text = new_title
-            self.window.title(f"付箋 - {new_title}")
             self.is_new = False
         else:
             # 空ならデフォルト「無題の付箋」に戻す
-            self.title_text = "無題の付箋"
-            self.window.title(f"付箋 - 無題の付箋")
-        # メイン画面のリストと自動保存も更新
-        self.parent.update_note_list()
-        self.parent.auto_save()
+            new_title = "無題の付箋"
+        # タイトルが変わらないキー操作では保存しない
+        if new_title == self.title_text:
+            return
+        self.title_text = new_title
+        self.window.title(f"付箋 - {new_title}")
+        # 変更を記録して自動保存を依頼（メイン画面のリストも保存のタイミングでまとめて更新される）
+        self.mark_dirty("title")
+
+    def mark_dirty(self, *fields):
+        """
+        指定した項目（"title" など）を「変更あり」として記録し、自動保存を依頼する。
+        *fields は「いくつでも引数を受け取れる」書き方で、タプルとして受け取る。
+        """
+        self.dirty_fields.update(fields)
+        self.version += 1
+        self.timestamp = datetime.now().isoformat()
+        self.parent.auto_save(self.note_id)
+
+    def mark_moved(self, *fields):
+        """
+        位置（"x" / "y"）の変更を記録し、自動保存を依頼する。
+        ウィンドウを動かしただけで内容は変わっていないので、更新日時と版番号はそのままにする。
+        """
+        self.dirty_fields.update(fields)
+        self.moves += 1
+        self.parent.auto_save(self.note_id)
+
+    def saved_version(self):
+        """保存するときの版 (内容の版番号, 位置の変更の番号) を返す。mark_saved() に渡して使う。"""
+        return self.version, self.moves
+
+    def pending_changes(self):
+        """
+        まだ保存していない変更を (版, 保存用の辞書) の形で返す。版は saved_version() と同じ形。
+        保存用の辞書には、変わった項目だけが入る（まだ一度も保存していない付箋は全項目）。
+        """
+        if self.persisted:
+            fields = self.dirty_fields
+        else:
+            fields = self.RECORD_ATTRS.keys()
+        record = {"id": self.note_id}
+        for name in fields:
+            # getattr(オブジェクト, "属性名") は、名前の文字列から属性の値を取り出す関数
+            record[name] = getattr(self, self.RECORD_ATTRS[name])
+        if len(record) > 1:
+            record["timestamp"] = self.timestamp
+        return self.saved_version(), record
+
+    def mark_saved(self, version):
+        """
+        保存が成功したときに呼ばれる（version は保存した時点の saved_version()）。
+        保存した時点から新しい変更が無ければ、変更の記録を消す。
+        内容と位置は別々に数えているので、保存中に動かしただけなら位置の記録は残す（その逆も同じ）。
+        """
+        self.persisted = True
+        edits, moves = version
+        if self.version == edits:
+            self.dirty_fields.intersection_update(self.POSITION_FIELDS)
+        if self.moves == moves:
+            self.dirty_fields.difference_update(self.POSITION_FIELDS)
+
+    def sync_from_widgets(self):
+        """
+        ウィンドウの入力欄を内部の値に取り込み、変わった項目を「変更あり」にする。
+        閉じる直前やアプリ終了時に、キー入力以外の変更（マウスでの貼り付けなど）も拾うために使う。
+        位置は on_configure() で動くたびに覚えているので、ここでは取り込まない。
+        """
+        if not (self.window and self.is_open):
+            return
+        try:
+            title = self.get_title()
+            content = self.get_content()
+        except:
+            return
+        changed = [
+            name
+            for name, old, new in (
+                ("title", self.title_text, title),
+                ("content", self.content_text, content),
+            )
+            if old != new
+        ]
+        self.title_text = title
+        self.content_text = content
+        if changed:
+            self.mark_dirty(*changed)
 
     def is_empty(self):
         """
@@ -316,7 +527,11 @@ class StickyNote:
         戻り値：True なら空、False なら中身がある。
         """
         title = self.get_title()
-        content = self.get_content()
+        if self.content_loaded or self.is_open:
+            content = self.get_content()
+        else:
+            # 本文を読み込んでいなければ、プレビューで判定する（空の本文はプレビューも空）
+            content = self.preview
 
         # タイトルが「無題の付箋」または「付箋 ◯」というデフォルトのものか？
         # startswith("付箋 ") はタイトルが "付箋 " で始まるかを返す。
@@ -353,16 +568,11 @@ class StickyNote:
         return self.content_text
 
     def get_position(self):
-        """付箋ウィンドウの現在位置（X, Y座標）を取得する。"""
-        if self.window and self.is_open:
-            try:
-                # update() で最新の状態に更新してから位置取得
-                self.window.update()
-                # winfo_x() / winfo_y() でウィンドウの座標を取得
-                self.x = self.window.winfo_x()
-                self.y = self.window.winfo_y()
-            except:
-                pass
+        """
+        付箋ウィンドウの現在位置（X, Y座標）を取得する。
+        位置はウィンドウが動くたびに on_configure() で更新されているので、覚えている値を返すだけ。
+        （以前は window.update() でイベント処理を回してから座標を問い合わせていた）
+        """
         # タプル（複数値の組）として返す
         return self.x, self.y
 
@@ -376,8 +586,8 @@ class StickyNote:
             self.color = color[1]
             self.update_colors()  # 画面の色を反映
             self.is_new = False
-            self.parent.save_notes()
-            self.parent.update_note_list()
+            self.mark_dirty("color")
+            self.parent.save_now()
             messagebox.showinfo("完了", "色を変更しました")
 
     def update_colors(self):
@@ -406,7 +616,8 @@ class StickyNote:
     def save_this_note(self):
         """この付箋だけを保存する処理（保存ボタン用）。"""
         self.is_new = False
-        self.parent.save_notes()
+        self.sync_from_widgets()
+        self.parent.save_now()
         # メッセージボックスで完了を通知
         messagebox.showinfo("保存完了", f"「{self.get_title()}」を保存しました")
 
@@ -421,12 +632,9 @@ class StickyNote:
                     self.window.destroy()
                 except:
                     pass
-            # 親アプリの notes 辞書からこの付箋を削除。
-            # pop の第2引数 None は「キーが無くてもエラーを出さない」という意味。
-            self.parent.notes.pop(self.note_id, None)
-            self.parent.save_notes()
-            self.parent.update_note_list()
-            self.parent.update_stats()
+            # 親アプリの notes 辞書からこの付箋を削除（保存先からも消える）
+            self.parent.forget_note(self.note_id)
+            self.parent.save_now()
 
     def close_note(self):
         """
@@ -434,14 +642,8 @@ class StickyNote:
         - 中身が空のときは確認なしで自動削除
         - 中身があれば保存して閉じる（データは残る）
         """
-        # 閉じる前に現在の内容を内部変数にコピー
-        if self.window and self.is_open:
-            try:
-                self.title_text = self.get_title()
-                self.content_text = self.get_content()
-                self.get_position()
-            except:
-                pass
+        # 閉じる前に現在の内容を内部変数にコピー（変わった項目は保存対象になる）
+        self.sync_from_widgets()
 
         # 空の付箋かチェック
         if self.is_empty():
@@ -451,14 +653,12 @@ class StickyNote:
                     self.window.destroy()
                 except:
                     pass
-            self.parent.notes.pop(self.note_id, None)
-            self.parent.save_notes()
-            self.parent.update_note_list()
-            self.parent.update_stats()
+            self.parent.forget_note(self.note_id)
+            self.parent.save_now()
             return  # ここで関数を抜ける
 
-        # 中身あり → 保存して閉じる
-        self.parent.save_notes()
+        # 中身あり → 保留中の自動保存も含めて、今すぐ保存して閉じる
+        self.parent.save_now()
 
         if self.window:
             try:
@@ -469,7 +669,7 @@ class StickyNote:
         # ウィンドウ参照をクリアし、閉じた状態としてマーク
         self.window = None
         self.is_open = False
-        self.parent.update_note_list()
+        self.parent.update_note_list([self.note_id])
 
     def show(self):
         """付箋ウィンドウを表示する（既に開いていれば最前面に持ってくる）。"""
@@ -485,7 +685,8 @@ class StickyNote:
 
         # まだ作られていなければ新規作成
         self.create_window()
-        self.parent.update_note_list()
+        # 一覧ではこの付箋の行（状態の列）だけを更新する
+        self.parent.update_note_list([self.note_id])
 
     def is_window_open(self):
         """ウィンドウが現在開いているかどうかを返す。"""
@@ -508,10 +709,14 @@ class StickyNote:
 class StickyNotesApp:
     """付箋アプリケーションのメインクラス（アプリ全体の司令塔）。"""
 
-    def __init__(self, root):
+    def __init__(self, root, autosave_delay_ms=800, storage="json", virtual_list=False):
         """
         コンストラクタ。
         root は tk.Tk() で作られたメインウィンドウ。
+        autosave_delay_ms は「入力が止まってから何ミリ秒後に自動保存するか」。
+        storage は保存先の種類。"json"（既定）か "sqlite" を指定する。
+        virtual_list=True にすると、付箋一覧を「見えている行だけ作る」方式で表示する
+        （付箋が数万枚あっても一覧が重くならない）。
         """
         self.root = root
         self.root.title("付箋アプリ - メイン画面")  # ウィンドウのタイトル
@@ -525,12 +730,38 @@ class StickyNotesApp:
         self.next_id = 1
         # 保存ファイル名（このアプリと同じフォルダに作られる）
         self.data_file = "sticky_notes_data.json"
+        self.db_file = "sticky_notes_data.db"
+        # 保存先の読み書き係。
+        #   json   : 変更点だけを追記ファイル（ジャーナル）に書き、ときどき本体へまとめる
+        #   sqlite : 変更された付箋の行だけを書き換える（付箋が多くても保存が軽い）
+        if storage == "sqlite":
+            self.store = SqliteNoteStore(self.db_file, legacy_json_path=self.data_file)
+        else:
+            self.store = JournalJsonStore(self.data_file)
+        # 削除されたが、まだ保存先に反映していない付箋IDの集合
+        self.deleted_ids = set()
+        # 付箋一覧の表示方式（True なら create_widgets で VirtualNoteList を使う）
+        self.use_virtual_list = virtual_list
+        # 全文検索用の索引と、今の検索条件
+        self.search_index = NoteSearchIndex()
+        self.search_query = ""     # 検索ボックスの文字
+        self.filter_ids = None     # 検索に一致した付箋IDの集合（None なら絞り込みなし）
+        # 自動保存の予約係。キー入力のたびに保存せず、入力が落ち着いたら1回だけ保存する。
+        self.save_scheduler = SaveScheduler(
+            root, self.on_scheduled_save, idle_ms=autosave_delay_ms
+        )
+        # 保存先への書き込み係。実際の書き込みは専用のスレッドで行い、画面を固めない
+        self.writer = BackgroundWriter(root)
+        self.save_error = None     # 直近の保存で起きたエラー（成功すれば None に戻る）
 
         # 画面部品の作成
         self.create_widgets()
         # 既存データの読み込み（前回保存した付箋を復元）
         self.load_notes()
 
+        # メインウィンドウの×ボタンでも、保留中の自動保存を書き出してから終了する
+        self.root.protocol("WM_DELETE_WINDOW", self.on_app_close)
+
     def create_widgets(self):
         """メインウィンドウのUI（画面）を組み立てる。"""
 
@@ -653,23 +884,60 @@ class StickyNotesApp:
         # pady=(上, 下) で上下別々に余白指定可能
         list_label.pack(pady=(10, 5))
 
+        # ----- 検索ボックス（入力するたびに一覧を絞り込む） -----
+        search_frame = tk.Frame(self.root)
+        search_frame.pack(fill=tk.X, padx=10)
+        tk.Label(search_frame, text="🔍 検索:", font=("メイリオ", 9)).pack(side=tk.LEFT)
+        # StringVar は入力欄の文字と連動する変数。trace_add("write", ...) で
+        # 「文字が変わったら呼ぶ関数」を登録できる（貼り付けや日本語入力の確定も拾える）。
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.on_search_change())
+        tk.Entry(
+            search_frame,
+            textvariable=self.search_var,
+            font=("メイリオ", 10),
+            relief=tk.SOLID,
+            borderwidth=1
+        ).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        # ヒット件数を表示するラベル
+        self.search_result_label = tk.Label(search_frame, text="", font=("メイリオ", 8), fg="gray")
+        self.search_result_label.pack(side=tk.LEFT)
+
         # ----- 付箋リスト本体（スクロール可能な表） -----
         list_container = tk.Frame(self.root)
         list_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
 
-        scrollbar = tk.Scrollbar(list_container)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        columns = ("id", "title", "preview", "status", "color", "time")
 
-        # Treeview = 表形式のリスト表示部品（ttkに含まれる）。
-        # 列を持つ表として使うと、Excelのような一覧が作れる。
-        self.note_tree = ttk.Treeview(
-            list_container,
-            columns=("id", "title", "preview", "status", "color", "time"),
-            show="headings",  # 列ヘッダーを表示する設定
-            yscrollcommand=scrollbar.set,
-            selectmode="extended",  # Ctrl/Shiftで複数選択を可能にする
-            height=12               # 表示行数
-        )
+        # 一覧の行を付箋ごとに覚えておくための辞書など（update_note_list で使う）。
+        # 毎回すべての行を消して作り直すのではなく、変わった行だけを書き換えるために使う。
+        self.tree_items = {}      # {付箋ID: Treeview の行ID}
+        self.row_values = {}      # {付箋ID: 今表示している各列の値（タプル）}
+        self.row_order = []       # 表示中の付箋IDを昇順に並べたリスト
+        self.color_tags = set()   # tag_configure 済みの色の集合
+
+        if self.use_virtual_list:
+            # 仮想スクロール版：見えている行ぶんの Treeview の行だけを作り、
+            # スクロールに合わせて中身を入れ替える（スクロールバーも VirtualNoteList が作る）
+            self.virtual_list = VirtualNoteList(list_container, columns, self.note_row, rows=12)
+            self.note_tree = self.virtual_list.tree
+        else:
+            self.virtual_list = None
+
+            scrollbar = tk.Scrollbar(list_container)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+            # Treeview = 表形式のリスト表示部品（ttkに含まれる）。
+            # 列を持つ表として使うと、Excelのような一覧が作れる。
+            self.note_tree = ttk.Treeview(
+                list_container,
+                columns=columns,
+                show="headings",  # 列ヘッダーを表示する設定
+                yscrollcommand=scrollbar.set,
+                selectmode="extended",  # Ctrl/Shiftで複数選択を可能にする
+                height=12               # 表示行数
+            )
+            scrollbar.config(command=self.note_tree.yview)
 
         # 各列のヘッダー（見出し）の文字を設定
         self.note_tree.heading("id", text="ID")
@@ -688,7 +956,6 @@ class StickyNotesApp:
         self.note_tree.column("time", width=80)
 
         self.note_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.note_tree.yview)
 
         # ダブルクリックで付箋を開くようイベント設定
         # <Double-1> = 左ボタンのダブルクリック
@@ -712,8 +979,8 @@ class StickyNotesApp:
         )
         help_label.pack(pady=5)
 
-        # 画面下のフッター
-        footer = tk.Label(
+        # 画面下のフッター（自動保存の回数もここに表示する）
+        self.footer_label = tk.Label(
             self.root,
             text="© 2024 Sticky Notes App | 自動保存: 有効",
             font=("メイリオ", 8),
@@ -721,7 +988,7 @@ class StickyNotesApp:
             bg="#f5f5f5"
         )
         # side=tk.BOTTOM で下に配置
-        footer.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
+        self.footer_label.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
 
     def add_note(self):
         """新しい付箋を追加する。"""
@@ -737,11 +1004,13 @@ class StickyNotesApp:
         note.create_window()
         # 辞書に登録（キー：ID、値：付箋オブジェクト）
         self.notes[self.next_id] = note
+        # 検索の索引にも登録する（検索中なら、一致するかどうかもここで判定される）
+        self.reindex_notes([self.next_id])
+        # 統計とリスト（新しい付箋の行だけ）を更新
+        self.update_stats()
+        self.update_note_list([self.next_id])
         # 次に使うIDを1つ増やす
         self.next_id += 1
-        # 統計とリストを更新
-        self.update_stats()
-        self.update_note_list()
         # ※新規作成時には保存しない。中身が無いまま閉じれば消える設計。
 
     def show_all_notes(self):
@@ -758,7 +1027,8 @@ class StickyNotesApp:
             count += 1  # 「count = count + 1」と同じ意味
 
         messagebox.showinfo("完了", f"{count}個の付箋を開きました")
-        self.update_note_list()
+        # 一覧の行は note.show() が1行ずつ更新済みなので、統計だけ更新する
+        self.update_stats()
 
     def show_closed_notes(self):
         """閉じている付箋だけを開く。"""
@@ -778,59 +1048,73 @@ class StickyNotesApp:
         else:
             messagebox.showinfo("完了", f"{count}個の閉じた付箋を開きました")
 
-        self.update_note_list()
+        self.update_stats()
+
+    def selected_note_ids(self):
+        """一覧で選択されている付箋のIDをリストで返す。"""
+        if self.virtual_list is not None:
+            # 仮想スクロール版は、画面外の行も含めた選択を自分で覚えている
+            return sorted(self.virtual_list.selected)
+        # selection() で現在選択中の項目（複数可）を取得し、
+        # 項目から値を取り出して、最初の値（ID）を整数に変換
+        return [
+            int(self.note_tree.item(item)["values"][0])
+            for item in self.note_tree.selection()
+        ]
 
     def open_selected_notes(self):
         """リストで選択している付箋を開く。"""
-        # selection() で現在選択中の項目（複数可）を取得
-        selection = self.note_tree.selection()
-        if not selection:
+        selected_ids = self.selected_note_ids()
+        if not selected_ids:
             # 警告ダイアログ
             messagebox.showwarning("警告", "付箋を選択してください")
             return
 
         count = 0
-        # 選択された各項目について処理
-        for item in selection:
-            # 項目から値を取り出して、最初の値（ID）を整数に変換
-            note_id = int(self.note_tree.item(item)["values"][0])
+        # 選択された各付箋について処理
+        for note_id in selected_ids:
             # 「in」演算子で辞書にそのキーが含まれるかチェック
             if note_id in self.notes:
                 self.notes[note_id].show()
                 count += 1
 
         messagebox.showinfo("完了", f"{count}個の付箋を開きました")
-        self.update_note_list()
+        self.update_stats()
 
     def on_note_double_click(self, event):
         """リストの項目がダブルクリックされたときの処理。"""
-        selection = self.note_tree.selection()
-        if not selection:
-            return
+        if self.virtual_list is not None:
+            # 仮想スクロール版は、ダブルクリックした位置の付箋を開く
+            note_id = self.virtual_list.id_at(event.y)
+            if note_id is None:
+                return
+        else:
+            selection = self.note_tree.selection()
+            if not selection:
+                return
 
-        # selection[0] は選択リストの最初の項目（リストは0から始まる）
-        item = selection[0]
-        note_id = int(self.note_tree.item(item)["values"][0])
+            # selection[0] は選択リストの最初の項目（リストは0から始まる）
+            item = selection[0]
+            note_id = int(self.note_tree.item(item)["values"][0])
 
         if note_id in self.notes:
             self.notes[note_id].show()
-            self.update_note_list()
+            self.update_stats()
 
     def delete_selected_notes(self):
         """選択された複数の付箋を一括削除する。"""
-        selection = self.note_tree.selection()
-        if not selection:
+        selected_ids = self.selected_note_ids()
+        if not selected_ids:
             messagebox.showwarning("警告", "付箋を選択してください")
             return
 
         # len() で選択数を取得
-        count = len(selection)
+        count = len(selected_ids)
         if not messagebox.askyesno("確認", f"{count}個の付箋を削除しますか？"):
             return  # 「いいえ」なら何もしない
 
         # 各選択項目について削除処理
-        for item in selection:
-            note_id = int(self.note_tree.item(item)["values"][0])
+        for note_id in selected_ids:
             if note_id in self.notes:
                 note = self.notes[note_id]
                 # ウィンドウが開いていたら閉じる
@@ -839,17 +1123,24 @@ class StickyNotesApp:
                         note.window.destroy()
                     except:
                         pass
-                # 辞書から削除
-                self.notes.pop(note_id, None)
+                # 辞書から削除（保存先からも消える）
+                self.forget_note(note_id)
 
-        # 削除後の状態を保存・表示更新
-        self.save_notes()
-        self.update_note_list()
-        self.update_stats()
+        # 削除後の状態を保存・表示更新（一覧の行は forget_note で削除済み）
+        self.save_now()
         messagebox.showinfo("完了", f"{count}個の付箋を削除しました")
 
     def show_context_menu(self, event):
         """右クリックされたときコンテキストメニューを表示する。"""
+        if self.virtual_list is not None:
+            note_id = self.virtual_list.id_at(event.y)
+            if note_id is not None:
+                # クリックした付箋が未選択なら、その付箋だけを選択する
+                if note_id not in self.virtual_list.selected:
+                    self.virtual_list.select_only(note_id)
+                self.context_menu.post(event.x_root, event.y_root)
+            return
+
         # クリックされた位置の項目を特定
         item = self.note_tree.identify_row(event.y)
         if item:
@@ -859,117 +1150,405 @@ class StickyNotesApp:
             # post でメニューを画面に表示する。座標はマウスの位置。
             self.context_menu.post(event.x_root, event.y_root)
 
-    def update_note_list(self):
-        """付箋一覧（Treeview）の表示内容を最新の状態に更新する。"""
-        # 一旦、表示されている全項目を消す
-        for item in self.note_tree.get_children():
-            self.note_tree.delete(item)
-
-        # sorted で辞書をキー（ID）の昇順に並べ替えてから表示
-        # items() はキーと値の組を取り出す
-        for note_id, note in sorted(self.notes.items()):
-            title = note.get_title()
-            content = note.get_content()
-            # 本文が長い場合は最初の25文字＋「...」で表示
-            # スライス記法 [開始:終了] で部分文字列を取得できる
-            preview = content[:25] + "..." if len(content) > 25 else content
-            # 改行をスペースに置換（一覧では1行で見せるため）
-            preview = preview.replace("\n", " ")
+    def update_note_list(self, note_ids=None):
+        """
+        付箋一覧（Treeview）の表示内容を最新の状態に更新する。
+        note_ids に付箋IDの集まりを渡すと、その付箋の行だけを調べて更新する。
+        省略すると全付箋を調べるが、その場合も表示が変わった行だけを書き換える。
+        """
+        if self.virtual_list is not None:
+            # 仮想スクロール版は、並び順を直して見えている行だけを描き直す
+            if note_ids is None:
+                self.virtual_list.set_ids(self.visible_note_ids())
+            else:
+                self.virtual_list.refresh(note_ids)
+            return
+
+        if note_ids is None:
+            # 表示中の行と付箋の両方を調べる（| は集合の和：どちらかに含まれるID）
+            note_ids = set(self.notes) | set(self.tree_items)
+
+        # sorted でIDの昇順に処理する（新しい行を末尾へ順に追加できる）
+        for note_id in sorted(note_ids):
+            note = self.notes.get(note_id)
+            if note is None or not self.matches_filter(note_id):
+                # 削除された付箋・検索に一致しない付箋 → 行が残っていれば消す
+                self.remove_note_row(note_id)
+                continue
+
+            values = self.note_row_values(note)
             color_hex = note.color
-            # 現在時刻を「時:分」形式に整形
-            time_str = datetime.now().strftime("%H:%M")
-
-            # 付箋が開いているかで状態表示を変える
-            is_open = note.is_window_open()
-            # if-else を1行で書く三項演算子
-            status = "🟢 開" if is_open else "⚪ 閉"
-
-            # insert で1行追加。values にタプルで各列の値を渡す。
-            # tags は色付けなどに使う識別タグ。
-            self.note_tree.insert(
-                "",                # 親項目（""=ルート）
-                tk.END,            # 末尾に追加
-                values=(note_id, title, preview, status, color_hex, time_str),
-                tags=(color_hex,)  # 末尾のカンマはタプル(1要素)を作るため必要
-            )
+            self.ensure_color_tag(color_hex)
+
+            item = self.tree_items.get(note_id)
+            if item is None:
+                # まだ行が無い → ID順の正しい位置に1行追加
+                # bisect_left は「順番を崩さずに入れられる位置」を返す
+                index = bisect.bisect_left(self.row_order, note_id)
+                self.row_order.insert(index, note_id)
+                # insert で1行追加。values にタプルで各列の値を渡す。
+                # tags は色付けなどに使う識別タグ。
+                self.tree_items[note_id] = self.note_tree.insert(
+                    "",                # 親項目（""=ルート）
+                    index,             # 挿入位置（ID順）
+                    values=values,
+                    tags=(color_hex,)  # 末尾のカンマはタプル(1要素)を作るため必要
+                )
+            elif self.row_values[note_id] != values:
+                # 表示内容が変わった行だけを書き換える
+                self.note_tree.item(item, values=values, tags=(color_hex,))
+            self.row_values[note_id] = values
 
+    def note_row(self, note_id):
+        """
+        仮想スクロール版の一覧から呼ばれる。(各列の値, 色) を返す。
+        付箋が無い（または検索に一致しない）ときは None。
+        """
+        note = self.notes.get(note_id)
+        if note is None or not self.matches_filter(note_id):
+            return None
+        return self.note_row_values(note), note.color
+
+    def note_row_values(self, note):
+        """付箋1枚ぶんの、一覧に表示する各列の値をタプルで返す。"""
+        # ウィジェットに問い合わせず、付箋が覚えているプレビュー（本文の変更時に作り直される）を使う。
+        # 本文そのものを使わないので、一覧の表示だけなら本文を読み込まなくてよい。
+        preview = note.preview
+        # 更新日時（"2026-01-15T14:23:45..."）の「時:分」の部分だけを取り出す
+        time_str = note.timestamp[11:16]
+        # 付箋が開いているかで状態表示を変える。
+        # is_window_open() は Tk への問い合わせになるので、覚えている is_open を使う。
+        # if-else を1行で書く三項演算子
+        status = "🟢 開" if note.is_open else "⚪ 閉"
+        return (note.note_id, note.title_text, preview, status, note.color, time_str)
+
+    def ensure_color_tag(self, color_hex):
+        """その色のタグがまだ設定されていなければ、行の背景色として設定する（色ごとに1回だけ）。"""
+        if color_hex not in self.color_tags:
             # tag_configure でその色のタグを持つ行に背景色を設定
             self.note_tree.tag_configure(color_hex, background=color_hex)
+            self.color_tags.add(color_hex)
+
+    def remove_note_row(self, note_id):
+        """付箋一覧から、その付箋の行を1行だけ削除する。"""
+        if self.virtual_list is not None:
+            self.virtual_list.refresh([note_id])
+            return
+        item = self.tree_items.pop(note_id, None)
+        if item is None:
+            return
+        self.note_tree.delete(item)
+        self.row_values.pop(note_id, None)
+        index = bisect.bisect_left(self.row_order, note_id)
+        if index < len(self.row_order) and self.row_order[index] == note_id:
+            del self.row_order[index]
+
+    # ----- 検索 -----
+
+    def matches_filter(self, note_id):
+        """その付箋が今の検索条件に一致する（一覧に表示する）かどうか。"""
+        return self.filter_ids is None or note_id in self.filter_ids
+
+    def visible_note_ids(self):
+        """一覧に表示する付箋IDの集合（検索中なら一致した付箋だけ）。"""
+        if self.filter_ids is None:
+            return set(self.notes)
+        return self.filter_ids & set(self.notes)
+
+    def on_search_change(self):
+        """検索ボックスの文字が変わるたびに呼ばれ、一覧を絞り込む。"""
+        query = self.search_var.get()
+        if query == self.search_query:
+            return
+        self.search_query = query
+
+        if query.strip():
+            # 初めて検索したときに、全付箋から索引を作る（起動を遅くしないため）
+            if not self.search_index.built:
+                self.search_result_label.config(text="索引を作成中…")
+                # update_idletasks() で、索引を作る前にラベルの表示だけ先に反映する
+                self.search_result_label.update_idletasks()
+                self.search_index.build(
+                    (note_id, note.title_text, note.content_text)
+                    for note_id, note in self.notes.items()
+                )
+            self.filter_ids = self.search_index.search(query)
+            self.search_result_label.config(text=f"{len(self.filter_ids)} 件")
+        else:
+            self.filter_ids = None
+            self.search_result_label.config(text="")
+
+        if self.virtual_list is not None:
+            self.virtual_list.set_ids(self.visible_note_ids())
+        else:
+            # 表示するかどうかが変わった行だけを追加・削除する（^ は集合の対称差）
+            self.update_note_list(set(self.tree_items) ^ self.visible_note_ids())
+
+    def reindex_notes(self, note_ids):
+        """変更された付箋の分だけ、検索の索引と絞り込み結果を更新する。"""
+        if not self.search_index.built:
+            return
+        for note_id in note_ids:
+            note = self.notes.get(note_id)
+            if note is None:
+                continue
+            self.search_index.update(note_id, note.title_text, note.content_text)
+            # 検索中なら、編集によって一致する・しないが変わったかを調べ直す
+            if self.filter_ids is not None:
+                if self.search_index.matches(note_id, self.search_query):
+                    self.filter_ids.add(note_id)
+                else:
+                    self.filter_ids.discard(note_id)
+        if self.filter_ids is not None:
+            self.search_result_label.config(text=f"{len(self.filter_ids)} 件")
 
     def update_stats(self):
         """画面上部の統計情報（総数・開・閉）を更新する。"""
         total = len(self.notes)
         # ジェネレータ式でTrueの個数を数える書き方。
-        # 「note.is_window_open() がTrueなら1」とみなして合計する。
-        opened = sum(1 for note in self.notes.values() if note.is_window_open())
+        # 「note.is_open がTrueなら1」とみなして合計する。
+        # （is_window_open() は付箋ごとに Tk へ問い合わせるので、覚えている値を使う）
+        opened = sum(1 for note in self.notes.values() if note.is_open)
         closed = total - opened
         # config で既存ラベルの文字列を変更
         self.stats_label.config(
             text=f"📊 総数: {total} 個 | 開: {opened} 個 | 閉: {closed} 個"
         )
 
-    def auto_save(self):
-        """自動保存（変更があるたびに静かに保存する）。"""
-        self.save_notes()
-        self.update_note_list()
+    def auto_save(self, note_id=None):
+        """
+        自動保存の依頼を受け付ける（変更があるたびに呼ばれる）。
+        ここではすぐに保存せず、SaveScheduler に「保存が必要」と伝えるだけ。
+        入力が idle_ms ミリ秒止まったところで on_scheduled_save が1回だけ呼ばれる。
+        """
+        self.save_scheduler.request(note_id)
+
+    def save_now(self, note_id=None):
+        """
+        保留中の自動保存をまとめて、今すぐ保存と表示更新を行う。
+        note_id を渡すと、その付箋も「変更あり」として保存対象に含める。
+        """
+        if note_id is not None:
+            self.save_scheduler.mark_dirty(note_id)
+        self.save_scheduler.flush(force=True)
+
+    def forget_note(self, note_id):
+        """
+        付箋を notes 辞書から取り除き、次の保存で保存先からも削除されるよう記録する。
+        pop の第2引数 None は「キーが無くてもエラーを出さない」という意味。
+        """
+        note = self.notes.pop(note_id, None)
+        # まだ一度も保存していない付箋は、保存先から消す必要がない
+        if note is not None and note.persisted:
+            self.deleted_ids.add(note_id)
+        # 検索の索引と一覧からも、その付箋だけを消す
+        self.search_index.remove(note_id)
+        if self.filter_ids is not None:
+            self.filter_ids.discard(note_id)
+        self.remove_note_row(note_id)
+
+    def on_scheduled_save(self, dirty_ids):
+        """
+        SaveScheduler から呼ばれる実際の保存処理。
+        dirty_ids は前回の保存以降に変更された付箋IDの集合。
+        """
+        self.save_notes(dirty_ids)
+        # 検索の索引と一覧は、変更された付箋の分だけを更新する
+        self.reindex_notes(dirty_ids)
+        self.update_note_list(dirty_ids)
         self.update_stats()
+        self.update_save_report()
+
+    def update_save_report(self):
+        """フッターに「保存した回数」と「まとめて省略できた保存の数」を表示する。"""
+        scheduler = self.save_scheduler
+        self.footer_label.config(
+            text=(
+                f"© 2024 Sticky Notes App | 自動保存: 有効"
+                f"（保存 {scheduler.save_count} 回 / まとめた変更 {scheduler.merged_count} 件）"
+            )
+        )
+
+    def on_app_close(self):
+        """メインウィンドウを閉じるとき、保留中の自動保存を書き出してから終了する。"""
+        # 開いている付箋の入力欄の内容を取り込む（位置は動かすたびに記録済み）
+        for note in self.notes.values():
+            if note.is_window_open():
+                note.sync_from_widgets()
+        self.save_scheduler.flush()
+        # 書き込みスレッドに残っている保存を最後まで終わらせ、その結果を受け取る
+        self.writer.close()
+        # 書き込み中に削除された付箋の削除や、失敗した分の書き直しは、結果を受け取ったときに
+        # 保存し直すよう予約されている。タイマーはもう動かないので、最後の1回をこの場で書き込む
+        # （スレッドを止めた後の BackgroundWriter は、その場で書き込む）
+        if self.save_scheduler.pending or self.save_scheduler.dirty_ids or self.deleted_ids:
+            self.save_scheduler.flush(force=True)
+        if self.save_error is not None:
+            # 終了するとこの後は知らせる場所がないので、ここだけはダイアログで伝える
+            messagebox.showerror("エラー", f"保存に失敗しました: {self.save_error}")
+        # ジャーナルに溜まった変更を本体ファイルへまとめてから閉じる
+        self.store.close()
+        self.root.destroy()
 
     def manual_save(self):
         """手動保存（ボタン押下時。完了メッセージを出す）。"""
-        self.save_notes()
+        self.save_now()
         messagebox.showinfo("保存完了", f"{len(self.notes)}個の付箋を保存しました")
 
-    def save_notes(self):
-        """付箋データをJSONファイルに保存する。"""
+    def save_notes(self, dirty_ids=None):
+        """
+        付箋データを保存先に書き出す。
+        dirty_ids（変更された付箋IDの集合）が渡され、保存先が1件ずつの更新に
+        対応していれば、変更された付箋の変わった項目だけを書き込む。
+        それ以外は全件を書き直す。
+
+        ここ（メインスレッド）では保存する内容の写しを作るだけで、
+        ファイルへの書き込みは BackgroundWriter のスレッドが行う。
+        """
+        try:
+            if dirty_ids is not None and self.store.incremental:
+                self.save_changed_notes(dirty_ids)
+            else:
+                self.save_all_notes()
+        except Exception as e:
+            # 写しを作る途中の失敗（本文が読めないなど）も、書き込みの失敗と同じように知らせる
+            self.on_save_failed(e, dirty_ids)
+
+    def on_save_done(self, saved):
+        """
+        書き込みが成功したとき、メインスレッドで呼ばれる。
+        - saved : 書き込んだ (付箋, 版番号) の組のリスト
+        """
+        for note, version in saved:
+            note.mark_saved(version)
+            if self.notes.get(note.note_id) is not note:
+                # 書き込み中に削除された付箋は、保存先からも消えるよう削除を予約し直す
+                self.deleted_ids.add(note.note_id)
+                self.save_scheduler.request()
+        if self.save_error is not None:
+            # 前回の失敗の表示を、いつものフッターに戻す
+            self.save_error = None
+            self.footer_label.config(fg="gray")
+            self.update_save_report()
+
+    def on_save_failed(self, error, dirty_ids, emptied=()):
+        """
+        書き込みに失敗したとき、メインスレッドで呼ばれる。
+        保存の途中でダイアログを出して画面を止めないよう、フッターに赤字で知らせる。
+        - dirty_ids : 書き込めなかった付箋IDの集合
+        - emptied   : 空になったので保存先から消そうとした付箋
+        """
+        self.save_error = error
+        # 保存できなかった付箋は、次の保存でもう一度書き込めるよう予約し直す
+        if dirty_ids:
+            self.save_scheduler.dirty_ids.update(dirty_ids)
+        for note in emptied:
+            # 削除できなかったので、保存先にはまだ残っている
+            note.persisted = True
+        self.footer_label.config(
+            text=f"⚠ 保存に失敗しました: {error}（次の保存でもう一度書き込みます）",
+            fg="red"
+        )
+
+    def save_all_notes(self):
+        """全付箋をまとめて保存する（付箋ごとの保存に対応していない保存先で使う）。"""
         # 保存用のデータ構造を辞書で組み立てる
         data = {
             "next_id": self.next_id,  # 次のID
             "notes": []                # 付箋情報のリスト（あとで詰める）
         }
 
+        saved = []  # 保存する (付箋, 版番号) の組
         # 各付箋について保存用の辞書を作って data["notes"] に追加
         for note_id, note in self.notes.items():
             # 空の付箋はファイルに残さない
             if note.is_empty():
                 continue  # for ループの今の周回をスキップ
-
-            x, y = note.get_position()  # タプルを2つの変数に分けて受け取る
             # append でリストの末尾に要素を追加
-            data["notes"].append({
-                "id": note_id,
-                "title": note.get_title(),
-                "content": note.get_content(),
-                "color": note.color,
-                "x": x,
-                "y": y,
-                # isoformat() は日時を「2024-01-29T12:34:56」のような形式に変換
-                "timestamp": datetime.now().isoformat()
-            })
+            data["notes"].append(self.note_record(note))
+            saved.append((note, note.saved_version()))
 
-        # ----- ファイル書き込み -----
-        try:
-            # with 文を使うと、処理後にファイルが自動で閉じられる（推奨）。
-            # "w" は書き込みモード。encoding="utf-8" で日本語を正しく保存。
-            with open(self.data_file, "w", encoding="utf-8") as f:
-                # json.dump で Python の辞書を JSON文字列に変換しファイルに書き込む。
-                # ensure_ascii=False で日本語を文字化けせず保存。
-                # indent=2 で人間にも読みやすいよう整形。
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            # 例外（書き込み失敗など）が起きたらメッセージで知らせる
-            messagebox.showerror("エラー", f"保存に失敗しました: {e}")
+        deleted = set(self.deleted_ids)
 
-    def load_notes(self):
-        """保存されたJSONファイルから付箋データを読み込む。"""
-        # ファイルが無ければ何もしない（初回起動時など）
-        if not os.path.exists(self.data_file):
-            return
+        def done():
+            self.on_save_done(saved)
+            self.deleted_ids -= deleted
+
+        # data はここで作った新しい辞書で、この後メインスレッドからは書き換えない
+        self.writer.submit(
+            lambda: self.store.save(data),
+            done,
+            lambda error: self.on_save_failed(error, {note.note_id for note, _ in saved}),
+        )
+
+    def save_changed_notes(self, dirty_ids):
+        """変更された付箋の変わった項目と、削除された付箋だけを保存先に反映する。"""
+        upserts = {}                     # 追加・更新する付箋 {ID: 保存用の辞書}
+        saved = []                       # 保存する (付箋, 版番号) の組
+        deleted = set(self.deleted_ids)  # 削除する付箋IDの集合
+        emptied = []                     # 空になったので保存先から消す付箋
+        for note_id in dirty_ids:
+            note = self.notes.get(note_id)
+            if note is None:
+                # 削除済みの付箋（必要なら deleted_ids に入っている）
+                continue
+            if note.is_empty():
+                # 空になった付箋は保存先に残さない。次に中身が入ったら全項目を保存し直す
+                if note.persisted:
+                    deleted.add(note_id)
+                    note.persisted = False
+                    emptied.append(note)
+                continue
+            version, record = note.pending_changes()
+            if len(record) > 1:  # "id" 以外に変わった項目がある
+                upserts[note_id] = record
+                saved.append((note, version))
+
+        next_id = self.next_id
+
+        def done():
+            self.on_save_done(saved)
+            # 反映できた削除だけを「未反映」の集合から取り除く
+            self.deleted_ids -= deleted
+
+        # upserts の中身は pending_changes() が作った新しい辞書なので、
+        # 書き込みスレッドに渡した後にメインスレッドの変更が混ざることはない
+        self.writer.submit(
+            lambda: self.store.save_changes(next_id, upserts, deleted),
+            done,
+            lambda error: self.on_save_failed(error, dirty_ids, emptied),
+        )
 
+    def note_record(self, note):
+        """1枚の付箋を、保存用の辞書（全項目）に変換する。"""
+        x, y = note.get_position()  # タプルを2つの変数に分けて受け取る
+        return {
+            "id": note.note_id,
+            "title": note.get_title(),
+            "content": note.get_content(),
+            "color": note.color,
+            "x": x,
+            "y": y,
+            "timestamp": note.timestamp
+        }
+
+    def load_notes(self):
+        """
+        保存先から付箋データを読み込む。
+        読み込むのはタイトル・色・位置・プレビューなどの情報だけで、本文は読まない。
+        本文の量が増えても、起動時間が長くならないようにするため。
+        """
         try:
-            # "r" は読み込みモード
-            with open(self.data_file, "r", encoding="utf-8") as f:
-                # json.load でファイルからPythonの辞書/リストに変換
-                data = json.load(f)
+            # 本体ファイルが壊れていれば、1世代前のバックアップ(.bak)から読み込まれる
+            data = self.store.load()
+            # ファイルが無ければ何もしない（初回起動時など）
+            if data is None:
+                return
+            if self.store.loaded_from_backup:
+                messagebox.showwarning(
+                    "警告",
+                    "保存ファイルが壊れていたため、バックアップから復元しました"
+                )
 
             # get(キー, デフォルト) でキーが無くてもエラーにならず取得できる
             self.next_id = data.get("next_id", 1)
@@ -983,13 +1562,18 @@ class StickyNotesApp:
                     self,
                     note_id,
                     title=note_data.get("title", "無題の付箋"),
-                    content=note_data.get("content", ""),
+                    # 本文は読み込まずに None（必要になったときに読み込む）。
+                    # 保存先が本文も返した場合（古い形式など）はそのまま使う。
+                    content=note_data.get("content"),
                     color=note_data.get("color", "#FFFF99"),
                     x=note_data.get("x", 100),
-                    y=note_data.get("y", 100)
+                    y=note_data.get("y", 100),
+                    timestamp=note_data.get("timestamp"),
+                    preview=note_data.get("preview")
                 )
-                # 既存データなので「新規」フラグはオフ
+                # 既存データなので「新規」フラグはオフ。保存先にも書き込み済み。
                 note.is_new = False
+                note.persisted = True
                 self.notes[note_id] = note
 
             # 読み込み後に統計とリストを更新
@@ -1000,20 +1584,1322 @@ class StickyNotesApp:
             messagebox.showerror("エラー", f"読み込みに失敗しました: {e}")
 
 
+# ============================================================
+# クラス定義3：自動保存をまとめる SaveScheduler クラス
+# ============================================================
+# キー入力のたびにJSONを書き直すと、付箋が多いときに入力が重くなる。
+# そこで「保存の予約」だけを受け付け、入力が止まってから1回だけ保存する。
+# このように連続したイベントを1回にまとめる手法を「デバウンス」と呼ぶ。
+
+class SaveScheduler:
+    """保存要求をまとめて、一定時間入力が止まったら1回だけ保存を実行する。"""
+
+    def __init__(self, root, save_callback, idle_ms=800, max_wait_ms=5000):
+        """
+        - root          : after() でタイマーを予約するための tkinter のウィンドウ
+        - save_callback : 実際に保存する関数。変更された付箋IDの集合を受け取る
+        - idle_ms       : 最後の要求からこの時間（ミリ秒）入力がなければ保存する
+        - max_wait_ms   : 入力が続いていても、最初の要求からこの時間がたてば必ず保存する
+        """
+        self.root = root
+        self.save_callback = save_callback
+        self.idle_ms = idle_ms
+        self.max_wait_ms = max_wait_ms
+
+        self.dirty_ids = set()     # 前回の保存以降に変更された付箋IDの集合
+        self.pending = False       # 保存待ちの要求があるか
+        self._after_id = None      # root.after() の予約ID（キャンセルに使う）
+        self._first_request = None # 保存待ちになった最初の時刻
+
+        # 統計（フッターに表示する）
+        self.request_count = 0     # 受け付けた保存要求の数
+        self.save_count = 0        # 実際に保存した回数
+        self.merged_count = 0      # 他の要求とまとめられて省略された要求の数
+
+    def request(self, note_id=None):
+        """保存要求を受け付け、タイマーを（再）予約する。"""
+        if note_id is not None:
+            self.dirty_ids.add(note_id)
+        self.request_count += 1
+
+        now = time.monotonic()
+        if self.pending:
+            # すでに保存待ちの要求がある → 今回の要求はそれにまとめる
+            self.merged_count += 1
+        else:
+            self.pending = True
+            self._first_request = now
+
+        # 前回の予約を取り消して、待ち時間を延長する
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+
+        # 入力が続いても max_wait_ms を超えて保存が遅れないよう、待ち時間を縮める
+        waited_ms = (now - self._first_request) * 1000
+        delay_ms = max(0, min(self.idle_ms, self.max_wait_ms - waited_ms))
+        self._after_id = self.root.after(int(delay_ms), self._on_timer)
+
+    def mark_dirty(self, note_id):
+        """保存は予約せず、次の保存で書き出す付箋IDとして記録だけする。"""
+        self.dirty_ids.add(note_id)
+
+    def _on_timer(self):
+        """予約した時間になったら呼ばれる。"""
+        self._after_id = None
+        self.flush()
+
+    def flush(self, force=False):
+        """
+        保存待ちの要求を今すぐ実行する（付箋を閉じるときやアプリ終了時に使う）。
+        force=True なら、保存待ちがなくても保存を実行する。
+        戻り値：保存を実行したら True。
+        """
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+        if not self.pending and not force:
+            return False
+
+        # 保存中に新しい要求が来ても取りこぼさないよう、先に状態をリセットする
+        dirty_ids = self.dirty_ids
+        self.dirty_ids = set()
+        self.pending = False
+        self._first_request = None
+        self.save_count += 1
+        self.save_callback(dirty_ids)
+        return True
+
+
+# ============================================================
+# クラス定義4：見えている行だけを作る VirtualNoteList クラス
+# ============================================================
+# Treeview は行が数万行になると、追加・スクロール・削除のどれもが重くなる。
+# そこで「画面に見えている行数ぶん」だけ Treeview の行を作っておき、
+# スクロールされたら行の中身（どの付箋を表示するか）だけを入れ替える。
+# 表示する付箋の並び（order）や選択状態（selected）は Python 側で持つので、
+# 画面外の付箋も含めて複数選択できる。
+
+class VirtualNoteList:
+    """付箋一覧を、見えている範囲の行だけで表示する仮想スクロール版の表。"""
+
+    def __init__(self, container, columns, get_row, rows=12):
+        """
+        - container : 表とスクロールバーを置く枠
+        - columns   : 列名のタプル
+        - get_row   : 付箋IDを受け取り (各列の値, 色) を返す関数。付箋が無ければ None
+        - rows      : 最初に用意する行数（ウィンドウの大きさに合わせて増減する）
+        """
+        self.get_row = get_row
+        self.order = []          # 表示する付箋IDを昇順に並べたリスト（全件ぶん）
+        self.offset = 0          # 一番上に表示している付箋の、order 内での位置
+        self.selected = set()    # 選択されている付箋IDの集合（画面外も含む）
+        self.anchor = None       # Shift+クリックで範囲選択するときの起点の付箋ID
+        self.slots = []          # 使い回す Treeview の行IDのリスト（上から順）
+        self.slot_index = {}     # {行ID: 上から何番目か}
+        self.slot_ids = []       # 各行に今表示している付箋ID（空いている行は None）
+        self.slot_values = []    # 各行に今表示している値（変わった行だけ書き換えるため）
+        self.color_tags = set()  # tag_configure 済みの色の集合
+
+        # スクロールバーは Treeview ではなく、このクラスの yview() を動かす
+        self.scrollbar = tk.Scrollbar(container, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree = ttk.Treeview(
+            container,
+            columns=columns,
+            show="headings",
+            selectmode="extended",
+            height=rows
+        )
+        self.resize(rows)
+
+        # クリック・キー操作・ホイールは、画面外の行も扱えるよう自分で処理する。
+        # 処理した関数が "break" を返すと、Treeview 標準の処理は行われない。
+        self.tree.bind("<Button-1>", lambda e: self.on_click(e, "single"))
+        self.tree.bind("<Control-Button-1>", lambda e: self.on_click(e, "toggle"))
+        self.tree.bind("<Shift-Button-1>", lambda e: self.on_click(e, "range"))
+        self.tree.bind("<Up>", lambda e: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self.move_selection(-len(self.slots)))
+        self.tree.bind("<Next>", lambda e: self.move_selection(len(self.slots)))
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)          # Windows / macOS
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))  # Linux（上）
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))   # Linux（下）
+        self.tree.bind("<Configure>", self.on_configure)
+
+    # ----- 行の用意 -----
+
+    def resize(self, rows):
+        """使い回す行の数を rows 行にそろえる。"""
+        rows = max(1, rows)
+        while len(self.slots) < rows:
+            item = self.tree.insert("", tk.END, values=())
+            self.tree.detach(item)  # 付箋を表示するまでは画面から外しておく
+            self.slot_index[item] = len(self.slots)
+            self.slots.append(item)
+            self.slot_ids.append(None)
+            self.slot_values.append(None)
+        while len(self.slots) > rows:
+            item = self.slots.pop()
+            self.slot_index.pop(item)
+            self.slot_ids.pop()
+            self.slot_values.pop()
+            self.tree.delete(item)
+        self.render()
+
+    def on_configure(self, event):
+        """ウィンドウの大きさが変わったら、見える行数に合わせて行を増減する。"""
+        # rowheight はテーマによって決まる1行の高さ。取れないときは 20 ピクセルとみなす
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        # 見出し1行ぶんを引いた高さに、何行入るかを計算する（// は切り捨ての割り算）
+        rows = (event.height - row_height - 4) // row_height
+        if rows != len(self.slots):
+            self.resize(rows)
+
+    # ----- データの更新 -----
+
+    def set_ids(self, note_ids):
+        """表示する付箋IDをまとめて入れ替える（起動時など）。"""
+        self.order = sorted(note_ids)
+        # 無くなった付箋は選択からも外す（& は集合の共通部分）
+        self.selected &= set(self.order)
+        self.render()
+
+    def refresh(self, note_ids):
+        """指定した付箋だけ、追加・削除・表示内容の変化を反映する。"""
+        for note_id in note_ids:
+            index = bisect.bisect_left(self.order, note_id)
+            present = index < len(self.order) and self.order[index] == note_id
+            exists = self.get_row(note_id) is not None
+            if exists and not present:
+                self.order.insert(index, note_id)
+            elif present and not exists:
+                del self.order[index]
+                self.selected.discard(note_id)
+        # 見えている行だけを描き直す（値が変わっていない行には触らない）
+        self.render()
+
+    # ----- 描画 -----
+
+    def render(self):
+        """offset から見えている行数ぶんの付箋を、使い回す行に表示する。"""
+        total = len(self.order)
+        # offset が範囲外にならないよう調整する
+        self.offset = min(max(self.offset, 0), max(0, total - len(self.slots)))
+
+        visible_selection = []
+        for i, item in enumerate(self.slots):
+            index = self.offset + i
+            row = self.get_row(self.order[index]) if index < total else None
+            if row is None:
+                # 表示する付箋が無い行は画面から外す
+                if self.slot_ids[i] is not None:
+                    self.tree.detach(item)
+                    self.slot_ids[i] = None
+                    self.slot_values[i] = None
+                continue
+
+            note_id = self.order[index]
+            values, color_hex = row
+            if color_hex not in self.color_tags:
+                self.tree.tag_configure(color_hex, background=color_hex)
+                self.color_tags.add(color_hex)
+            if self.slot_ids[i] is None:
+                # 外していた行を i 番目の位置に戻す
+                self.tree.move(item, "", i)
+            if self.slot_values[i] != values:
+                self.tree.item(item, values=values, tags=(color_hex,))
+                self.slot_values[i] = values
+            self.slot_ids[i] = note_id
+            if note_id in self.selected:
+                visible_selection.append(item)
+
+        self.tree.selection_set(visible_selection)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        """スクロールバーのつまみの位置と長さを、全体のうち見えている割合に合わせる。"""
+        total = len(self.order)
+        if total == 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.offset / total
+        last = min(1.0, (self.offset + len(self.slots)) / total)
+        self.scrollbar.set(first, last)
+
+    # ----- スクロール -----
+
+    def yview(self, *args):
+        """
+        スクロールバーから呼ばれる。
+        ("moveto", "0.5")            … つまみをドラッグ：全体の50%の位置へ
+        ("scroll", "1", "units")     … 矢印をクリック：1行ずつ
+        ("scroll", "1", "pages")     … つまみの外をクリック：1画面ずつ
+        """
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.order))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, len(self.slots) - 1)
+            self.offset += amount
+        self.render()
+
+    def scroll_by(self, rows):
+        """rows 行ぶんスクロールする（マイナスなら上へ）。"""
+        self.offset += rows
+        self.render()
+        return "break"
+
+    def on_mousewheel(self, event):
+        """マウスホイール（Windows / macOS）。delta が正なら上へ回した。"""
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    # ----- 選択 -----
+
+    def id_at(self, y):
+        """画面のY座標にある行の付箋IDを返す。行が無ければ None。"""
+        item = self.tree.identify_row(y)
+        if not item or item not in self.slot_index:
+            return None
+        return self.slot_ids[self.slot_index[item]]
+
+    def select_only(self, note_id):
+        """その付箋だけを選択する。"""
+        self.selected = {note_id}
+        self.anchor = note_id
+        self.render()
+
+    def on_click(self, event, mode):
+        """
+        行のクリック。mode は次のどれか：
+        "single" … その付箋だけを選択 / "toggle" … Ctrl+クリックで選択を追加・解除
+        "range"  … Shift+クリックで、起点からクリックした付箋までをまとめて選択
+        """
+        # 見出し（列の幅変更など）のクリックは Treeview 標準の処理に任せる
+        if self.tree.identify_region(event.x, event.y) not in ("cell", "tree"):
+            return None
+        self.tree.focus_set()
+        note_id = self.id_at(event.y)
+        if note_id is None:
+            return "break"
+
+        if mode == "toggle":
+            # ^= は「入っていれば外す、無ければ入れる」（集合の対称差）
+            self.selected ^= {note_id}
+            self.anchor = note_id
+        elif mode == "range" and self.anchor is not None:
+            start = bisect.bisect_left(self.order, self.anchor)
+            end = bisect.bisect_left(self.order, note_id)
+            if start > end:
+                start, end = end, start
+            self.selected = set(self.order[start:end + 1])
+        else:
+            self.selected = {note_id}
+            self.anchor = note_id
+        self.render()
+        return "break"
+
+    def move_selection(self, step):
+        """上下キーで選択を step 行ぶん動かし、必要ならスクロールして見える位置に出す。"""
+        if not self.order:
+            return "break"
+        if self.anchor is not None:
+            index = bisect.bisect_left(self.order, self.anchor) + step
+        else:
+            index = self.offset
+        index = min(max(index, 0), len(self.order) - 1)
+
+        # 選択した行が画面外なら、見える位置までスクロールする
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + len(self.slots):
+            self.offset = index - len(self.slots) + 1
+        self.select_only(self.order[index])
+        return "break"
+
+
+# ============================================================
+# クラス定義5：全文検索の索引 NoteSearchIndex クラス
+# ============================================================
+# 付箋を1枚ずつ「検索語を含むか」調べると、付箋が5万枚あると時間がかかる。
+# そこで本の巻末の索引のように「文字の並び → それを含む付箋ID」の表を先に作っておく。
+# 日本語は英語のように空白で単語が区切られないので、単語ではなく
+# 「1文字」と「隣り合う2文字」（文字 n-gram）を索引の見出しにする。
+#   例：「買い物」→ 1文字：買 / い / 物、2文字：買い / い物
+# 「買い物リスト」で検索するときは、2文字の見出し（買い・い物・物リ…）すべてに
+# 載っている付箋だけを候補にし、最後に本当に含むかを確かめる。
+
+class NoteSearchIndex:
+    """付箋のタイトルと本文から作る、文字 n-gram の転置インデックス。"""
+
+    def __init__(self):
+        self.postings = {}   # {文字の並び: それを含む付箋IDの集合}
+        self.grams = {}      # {付箋ID: その付箋から取り出した文字の並びの集合}
+        self.texts = {}      # {付箋ID: 検索用に正規化したタイトル＋本文}
+        self.built = False   # 全付箋の索引を作り終えたか
+
+    @staticmethod
+    def normalize(text):
+        """全角英数・半角カナなどをそろえ（NFKC）、大文字と小文字の区別をなくす。"""
+        return unicodedata.normalize("NFKC", text).casefold()
+
+    @staticmethod
+    def split_grams(text):
+        """文字列から、1文字と隣り合う2文字の並びを集合で取り出す。"""
+        grams = set()
+        # 空白をまたぐ並びは検索に使わないので、空白で区切った語ごとに取り出す
+        for word in text.split():
+            grams.update(word)
+            grams.update(word[i:i + 2] for i in range(len(word) - 1))
+        return grams
+
+    def build(self, items):
+        """(付箋ID, タイトル, 本文) の並びから、索引をまとめて作る。"""
+        for note_id, title, content in items:
+            self.update(note_id, title, content)
+        self.built = True
+
+    def update(self, note_id, title, content):
+        """1枚の付箋の索引を作り直す。変わった文字の並びの分だけを付け替える。"""
+        text = self.normalize(title + "\n" + content)
+        if self.texts.get(note_id) == text:
+            return
+        new_grams = self.split_grams(text)
+        old_grams = self.grams.get(note_id, set())
+        # なくなった並びからこの付箋を外す（- は集合の差）
+        for gram in old_grams - new_grams:
+            ids = self.postings[gram]
+            ids.discard(note_id)
+            if not ids:
+                del self.postings[gram]
+        # 新しく現れた並びにこの付箋を加える
+        for gram in new_grams - old_grams:
+            self.postings.setdefault(gram, set()).add(note_id)
+        self.grams[note_id] = new_grams
+        self.texts[note_id] = text
+
+    def remove(self, note_id):
+        """削除された付箋を索引から取り除く。"""
+        for gram in self.grams.pop(note_id, ()):
+            ids = self.postings[gram]
+            ids.discard(note_id)
+            if not ids:
+                del self.postings[gram]
+        self.texts.pop(note_id, None)
+
+    def search(self, query):
+        """
+        検索語を含む付箋IDの集合を返す。
+        空白で区切った複数の語は、すべてを含む付箋だけを返す（AND 検索）。
+        """
+        result = None
+        for term in self.normalize(query).split():
+            # 1文字の語はその文字、2文字以上の語は隣り合う2文字の並びを見出しにする
+            if len(term) == 1:
+                keys = {term}
+            else:
+                keys = {term[i:i + 2] for i in range(len(term) - 1)}
+            posting_sets = [self.postings.get(key) for key in keys]
+            if any(ids is None for ids in posting_sets):
+                return set()
+            # 小さい集合から順に共通部分をとると速い
+            posting_sets.sort(key=len)
+            candidates = posting_sets[0].intersection(*posting_sets[1:])
+            # 3文字以上の語は、2文字の並びが全部あっても順番が違う場合があるので確かめる
+            if len(term) > 2:
+                candidates = {note_id for note_id in candidates if term in self.texts[note_id]}
+            result = candidates if result is None else result & candidates
+            if not result:
+                return set()
+        return result if result is not None else set()
+
+    def matches(self, note_id, query):
+        """1枚の付箋が検索語をすべて含むかを調べる（編集された付箋の再判定に使う）。"""
+        text = self.texts.get(note_id, "")
+        return all(term in text for term in self.normalize(query).split())
+
+
+# ============================================================
+# クラス定義6：壊れにくい保存を行う AtomicJsonStore クラス
+# ============================================================
+# open(..., "w") で直接書き込むと、書き込み途中でアプリやPCが落ちたときに
+# ファイルが中途半端な状態（空や途中まで）で残り、全付箋が失われてしまう。
+# そこで次の手順で保存する：
+#   1. 同じフォルダの一時ファイルに全データを書く
+#   2. fsync でディスクへ確実に書き出す
+#   3. 今の本体ファイルを .bak（1世代前のバックアップ）に回す
+#   4. os.replace で一時ファイルを本体ファイル名に置き換える（一瞬で切り替わる）
+# どの時点で落ちても、本体か .bak のどちらかに完全なデータが残る。
+
+class AtomicJsonStore:
+    """JSONファイルを一時ファイル経由で安全に保存・読み込みするクラス。"""
+
+    # 変更された付箋だけの保存には対応していない（毎回全件を書き直す）
+    incremental = False
+
+    def __init__(self, path):
+        self.path = path                     # 本体ファイルのパス
+        self.backup_path = path + ".bak"     # 1世代前のバックアップ
+        self.loaded_from_backup = False      # 直前の load() がバックアップを使ったか
+        # 本体ファイルが正常だと確認できているか。
+        # 壊れた本体を .bak に回してしまわないよう、確認できたときだけ世代を回す。
+        self._main_is_valid = False
+
+    def load(self):
+        """
+        保存データを読み込んで辞書で返す。ファイルが無ければ None を返す。
+        本体ファイルが壊れている（または無い）ときは .bak を読み込む。
+        """
+        self.loaded_from_backup = False
+        if not os.path.exists(self.path) and not os.path.exists(self.backup_path):
+            return None
+
+        try:
+            data = self._read(self.path)
+        except (OSError, ValueError):
+            # 本体が読めない → バックアップを試す。バックアップも無ければ元のエラーを伝える
+            if not os.path.exists(self.backup_path):
+                raise
+            data = self._read(self.backup_path)
+            self.loaded_from_backup = True
+            self._main_is_valid = False
+            return data
+
+        self._main_is_valid = True
+        return data
+
+    def save(self, data):
+        """辞書 data を一時ファイル → fsync → os.replace の順で安全に保存する。"""
+        # separators で区切り文字の空白を省き、ファイルを小さく・書き込みを速くする
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # mkstemp は他と重ならない名前の一時ファイルを作り、(番号, パス) を返す
+        fd, tmp_path = tempfile.mkstemp(prefix=".sticky_notes_", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()             # Python内部のバッファをOSへ渡す
+                os.fsync(f.fileno())  # OSのキャッシュからディスクへ確実に書き出す
+
+            # 正常な本体ファイルを1世代前のバックアップとして残す
+            if self._main_is_valid and os.path.exists(self.path):
+                os.replace(self.path, self.backup_path)
+            # 完成した一時ファイルを本体の名前に置き換える（途中状態が見えない）
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            # 失敗したら一時ファイルを片付けてから、エラーを呼び出し元へ伝える
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._main_is_valid = True
+        self._fsync_directory(directory)
+
+    def close(self):
+        """後片付け（JSON保存では開きっぱなしのものが無いので何もしない）。"""
+        pass
+
+    def _read(self, path):
+        """1つのファイルを読み込み、付箋データとして正しい形か確認する。"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        # 途中で切れたファイルなどは辞書にならないので、壊れているとみなす
+        if not isinstance(data, dict):
+            raise ValueError(f"付箋データの形式が正しくありません: {path}")
+        return data
+
+    def _fsync_directory(self, directory):
+        """ファイル名の入れ替え自体もディスクに記録させる（Windows では不要なので省略）。"""
+        if os.name != "posix":
+            return
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+
+# ============================================================
+# クラス定義7：変更点だけを追記する JournalJsonStore クラス
+# ============================================================
+# AtomicJsonStore は安全だが、1文字の変更でも全付箋を書き直す。
+# そこで、普段は「どの付箋のどの項目が変わったか」だけを
+# ジャーナル（sticky_notes_data.json.journal）に1行ずつ追記する。
+# 追記が一定数たまったら、本体ファイル（スナップショット）に全体をまとめ直し、
+# ジャーナルを空にする（これを「コンパクション」と呼ぶ）。
+# 読み込み時は「スナップショット → ジャーナルを先頭から順に適用」で最新状態に戻す。
+#
+# ジャーナルは1行1件の JSON（JSON Lines 形式）：
+#   {"op":"put","id":3,"fields":{"title":"買い物","timestamp":"..."}} … 項目の追加・更新
+#   {"op":"del","id":3}                                             … 付箋の削除
+#   {"op":"meta","next_id":5}                                       … 次のIDの更新
+#
+# 起動を速くするため、本文はスナップショットに入れず、別の本文ファイル
+# （sticky_notes_data.json.bodies.世代番号）に UTF-8 のまま並べて書く。
+# スナップショットには各付箋の「本文ファイルの何バイト目から何バイトか」だけを記録するので、
+# 起動時に読むのはタイトル・色・位置・プレビューだけで済み、本文は開くときに1件ずつ読む。
+
+class JournalJsonStore:
+    """スナップショット（JSON）と変更ジャーナル（JSON Lines）で付箋を保存するクラス。"""
+
+    # 変更された付箋だけの保存（save_changes）に対応している
+    incremental = True
+
+    # スナップショットの形式の番号（2 = 本文を別ファイルに分けた形式）
+    FORMAT_VERSION = 2
+
+    def __init__(self, path, compact_every=200):
+        """
+        - path          : 本体（スナップショット）ファイルのパス
+        - compact_every : ジャーナルがこの行数に達したら本体へまとめ直す
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.snapshot = AtomicJsonStore(path)  # 本体の安全な書き込みは AtomicJsonStore に任せる
+        self.compact_every = compact_every
+        # 保存先の内容の写し {付箋ID: 保存用の辞書}。
+        # 本文は "content"（ジャーナルで変わった本文）か、"body"（本文ファイル上の [位置, バイト数]）で持つ
+        self.records = {}
+        self.next_id = 1
+        self.journal_entries = 0   # ジャーナルに今たまっている行数
+        self.bodies_gen = 0        # 今のスナップショットが使っている本文ファイルの世代番号
+        # 書き込み側（compact）が古い本文を写すときに開いたままにしておく本文ファイル
+        self.bodies_file = None
+        # 本文の読み込み（load_body）専用に開いたままにしておく本文ファイル (世代番号, ファイル)。
+        # 書き込み側とは別に開くので、保存中・コンパクション中でも待たずに読める。メインスレッドだけが使う
+        self.reader = None
+        # 保存（save / save_changes / compact）どうしが重ならないようにする鍵。
+        # ファイルを書いている間ずっと持つので、本文の読み込みでは取らない。
+        # RLock は同じスレッドなら重ねて取れる（save → compact）
+        self.lock = threading.RLock()
+        # records と bodies_gen を書き換える一瞬だけ取る鍵。本文の読み込みは、この鍵で
+        # 「本文そのもの」か「世代番号と位置」を写し取ってから、鍵を放してファイルを読む
+        self.records_lock = threading.Lock()
+
+    @property
+    def loaded_from_backup(self):
+        """本体が壊れていてバックアップから読み込んだか（AtomicJsonStore の結果を返す）。"""
+        return self.snapshot.loaded_from_backup
+
+    def bodies_path(self, gen):
+        """世代番号 gen の本文ファイルのパスを返す。"""
+        return f"{self.path}.bodies.{gen}"
+
+    def load(self):
+        """
+        スナップショットを読み、ジャーナルを順に適用した最新の状態を返す。
+        返す付箋の辞書には本文を含めない（本文は load_body() で1件ずつ読む）。
+        """
+        with self.lock:
+            data = self.snapshot.load()
+            entries, torn = self._read_journal()
+            if data is None and not entries:
+                return None
+
+            data = data or {}
+            self.close_bodies()
+            self.close_reader()
+            with self.records_lock:
+                self.next_id = data.get("next_id", 1)
+                self.bodies_gen = data.get("bodies_gen", 0)
+                self.records = {record["id"]: record for record in data.get("notes", [])}
+                # 本文がスナップショットに入っていた古い形式なら、プレビューをここで作る
+                old_format = data.get("version", 1) < self.FORMAT_VERSION and bool(self.records)
+                for record in self.records.values():
+                    if "content" in record and "preview" not in record:
+                        record["preview"] = make_preview(record["content"])
+                for entry in entries:
+                    self._apply(entry)
+            self.journal_entries = len(entries)
+
+            # 書き込み途中で切れた行が残っていると、その後ろに追記できないのでまとめ直す。
+            # 古い形式も、次回から本文を読まずに起動できるよう新しい形式で書き直す。
+            if torn or old_format:
+                self.compact()
+
+            notes = [
+                {name: value for name, value in record.items() if name not in ("content", "body")}
+                for record in self.records.values()
+            ]
+            return {"next_id": self.next_id, "notes": notes}
+
+    def load_body(self, note_id):
+        """
+        付箋1枚ぶんの本文を返す。本文ファイルからは、その付箋の部分だけを読む。
+        書き込みスレッドが保存・コンパクションをしている最中でも待たないよう、保存用の鍵（lock）は取らない。
+        本文ファイルは一度書き終えたら変わらないので、写し取った「世代番号と位置」で読めば正しい本文になる。
+        読む前にその世代のファイルが消えていたら（その間に2回コンパクションされたとき）、写し取り直して読む。
+        """
+        while True:
+            with self.records_lock:
+                record = self.records.get(note_id)
+                if record is None:
+                    return ""
+                if "content" in record:
+                    return record["content"]
+                if "body" not in record:
+                    return ""
+                offset, length = record["body"]
+                gen = self.bodies_gen
+            try:
+                f = self._reader_for(gen)
+            except FileNotFoundError:
+                with self.records_lock:
+                    if self.bodies_gen == gen:
+                        raise  # 世代が変わっていないのにファイルが無い（外から消された）
+                continue
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+    def _reader_for(self, gen):
+        """世代番号 gen の本文ファイルを、読み込み専用に開いて返す（同じ世代なら開き直さない）。"""
+        if self.reader is None or self.reader[0] != gen:
+            self.close_reader()
+            # "rb" はバイナリ読み込み。バイト単位の位置（offset）で読むために使う
+            self.reader = (gen, open(self.bodies_path(gen), "rb"))
+        return self.reader[1]
+
+    def close_bodies(self):
+        """書き込み側が開いたままにしている本文ファイルを閉じる。"""
+        if self.bodies_file is not None:
+            self.bodies_file.close()
+            self.bodies_file = None
+
+    def close_reader(self):
+        """本文の読み込み用に開いたままにしている本文ファイルを閉じる。"""
+        if self.reader is not None:
+            self.reader[1].close()
+            self.reader = None
+
+    def _read_journal(self):
+        """
+        ジャーナルを読み込み、(変更のリスト, 途中で切れた行があったか) を返す。
+        最後の行は書き込み中に落ちて途中で切れていることがあるので、そこで読むのをやめる。
+        """
+        entries = []
+        if not os.path.exists(self.journal_path):
+            return entries, False
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    return entries, True
+        return entries, False
+
+    def _apply(self, entry):
+        """ジャーナルの1行ぶんの変更を、メモリ上の写し（records）に反映する。"""
+        op = entry.get("op")
+        if op == "put":
+            record = self.records.setdefault(entry["id"], {"id": entry["id"]})
+            record.update(entry["fields"])
+            if "content" in entry["fields"]:
+                # 本文が変わったので、本文ファイル上の古い本文はもう使わない
+                record.pop("body", None)
+                record["preview"] = make_preview(record["content"])
+        elif op == "del":
+            self.records.pop(entry["id"], None)
+        elif op == "meta":
+            self.next_id = entry["next_id"]
+
+    def save(self, data):
+        """全件保存。スナップショットを書き直し、ジャーナルを空にする。"""
+        with self.lock:
+            records = {}
+            for record in data.get("notes", []):
+                record = dict(record)
+                record["preview"] = make_preview(record.get("content", ""))
+                records[record["id"]] = record
+            with self.records_lock:
+                self.next_id = data.get("next_id", 1)
+                self.records = records
+            self.compact()
+
+    def save_changes(self, next_id, upserts, deleted_ids):
+        """
+        変更された項目だけをジャーナルに追記する。
+        - upserts     : {付箋ID: 変わった項目だけの辞書}
+        - deleted_ids : 削除する付箋IDの集合
+        """
+        with self.lock:
+            entries = []
+            if next_id != self.next_id:
+                entries.append({"op": "meta", "next_id": next_id})
+            for note_id, record in upserts.items():
+                fields = {name: value for name, value in record.items() if name != "id"}
+                entries.append({"op": "put", "id": note_id, "fields": fields})
+            for note_id in deleted_ids:
+                if note_id in self.records:
+                    entries.append({"op": "del", "id": note_id})
+            if not entries:
+                return
+
+            text = "".join(
+                json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+                for entry in entries
+            )
+            # "a" は追記モード。ファイルの末尾に書き足すだけなので、全体を書き直すより速い
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+
+            # ファイルに書けた変更だけをメモリ上の写しに反映する
+            with self.records_lock:
+                for entry in entries:
+                    self._apply(entry)
+            self.journal_entries += len(entries)
+
+            if self.journal_entries >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        メモリ上の写しをスナップショットとして書き出し、ジャーナルを空にする。
+        書く順番は「新しい世代の本文ファイル → スナップショット → ジャーナルを空に」。
+        スナップショットを書く前に落ちても、古いスナップショットと古い本文ファイルがそのまま残り、
+        ジャーナルを空にする前に落ちても、次回の読み込みで同じ変更がもう一度適用されるだけで済む。
+        """
+        with self.lock:
+            gen = self.bodies_gen + 1
+            notes = []
+            refs = {}  # {付箋ID: 新しい本文ファイル上の [位置, バイト数]}
+            with open(self.bodies_path(gen), "wb") as f:
+                for note_id, record in self.records.items():
+                    if "content" in record:
+                        body = record["content"].encode("utf-8")
+                    elif "body" in record:
+                        # 変わっていない本文は、古い本文ファイルからバイト列のまま写す
+                        offset, length = record["body"]
+                        if self.bodies_file is None:
+                            self.bodies_file = open(self.bodies_path(self.bodies_gen), "rb")
+                        self.bodies_file.seek(offset)
+                        body = self.bodies_file.read(length)
+                    else:
+                        body = b""
+                    refs[note_id] = [f.tell(), len(body)]
+                    f.write(body)
+                    meta = {name: value for name, value in record.items() if name not in ("content", "body")}
+                    meta["body"] = refs[note_id]
+                    notes.append(meta)
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.snapshot.save({
+                "version": self.FORMAT_VERSION,
+                "next_id": self.next_id,
+                "bodies_gen": gen,
+                "notes": notes,
+            })
+            # "w" で開くと中身が空になる
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_entries = 0
+
+            # メモリ上の写しも本文を持たず、新しい本文ファイルの位置だけを持つようにする。
+            # 本文の読み込みが「新しい世代番号と古い位置」を組み合わせないよう、まとめて入れ替える
+            with self.records_lock:
+                for note_id, record in self.records.items():
+                    record.pop("content", None)
+                    record["body"] = refs[note_id]
+                self.bodies_gen = gen
+            self.close_bodies()
+            # 1つ前の世代はバックアップ（.bak）のスナップショットが使うので残し、それより古い世代を消す
+            try:
+                os.remove(self.bodies_path(gen - 2))
+            except OSError:
+                pass
+
+    def close(self):
+        """アプリ終了時に、ジャーナルにたまった変更をスナップショットへまとめる。"""
+        with self.lock:
+            if self.journal_entries:
+                self.compact()
+            self.close_bodies()
+        self.close_reader()
+
+
+# ============================================================
+# クラス定義8：SQLite に保存する SqliteNoteStore クラス
+# ============================================================
+# JSON保存では、1文字入力するだけでも全付箋を書き直す必要がある。
+# SQLite なら付箋1枚を1行として持てるので、変更された行だけを書き換えればよい。
+# 付箋が何千枚あっても、保存の手間は「変更した付箋の数」にしか比例しない。
+# 本文は別の表（note_bodies）に分けてあり、起動時は notes 表（タイトル・色・位置・プレビュー）だけを読む。
+
+class SqliteNoteStore:
+    """付箋を SQLite データベースに1件ずつ保存するクラス。"""
+
+    # 変更された付箋だけの保存（save_changes）に対応している
+    incremental = True
+
+    # notes 表に保存する列名。SQL文に列名を埋め込むので、ここにある名前だけを許可する。
+    # 本文（content）は note_bodies 表に分けて保存する。
+    COLUMNS = ("title", "color", "x", "y", "timestamp", "preview")
+
+    def __init__(self, path, legacy_json_path=None):
+        """
+        - path             : データベースファイルのパス
+        - legacy_json_path : 移行元の JSON ファイル（初回だけ中身を取り込む）
+        """
+        self.path = path
+        self.loaded_from_backup = False  # AtomicJsonStore と使い方をそろえるための属性
+        # 保存は書き込みスレッド、本文の読み込みはメインスレッドから行うので、
+        # 別スレッドからの利用を許可し、代わりに鍵（lock）で同時に使わないようにする
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        # WAL モード：書き込み中でも読み込みができ、小さな書き込みが速くなる
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL では NORMAL でも電源断でデータベースが壊れない（直前の数件が消える可能性のみ）
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._upgrade_schema()
+        with self.conn:
+            self._create_tables()
+        if legacy_json_path:
+            self._migrate_from_json(legacy_json_path)
+        # 本文の読み込み（load_body）専用の接続。書き込み用の接続（conn）と鍵を使わないので、
+        # 書き込みスレッドが保存している最中でも待たずに読める（WAL では読み込みは書き込みを待たない）。
+        # query_only で、この接続からは書き込めないようにしておく
+        self.read_conn = sqlite3.connect(path, check_same_thread=False)
+        self.read_conn.execute("PRAGMA query_only=ON")
+
+    def _create_tables(self):
+        """
+        テーブルが無ければ作る。列の既定値は StickyNote の既定値と同じ。
+        トランザクションは呼び出し側で開始・確定する。
+        """
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notes (
+                id        INTEGER PRIMARY KEY,
+                title     TEXT    NOT NULL DEFAULT '無題の付箋',
+                color     TEXT    NOT NULL DEFAULT '#FFFF99',
+                x         INTEGER NOT NULL DEFAULT 100,
+                y         INTEGER NOT NULL DEFAULT 100,
+                timestamp TEXT    NOT NULL DEFAULT '',
+                preview   TEXT    NOT NULL DEFAULT ''
+            )
+            """
+        )
+        # 本文だけを入れる表。起動時には読まず、付箋を開くときに1件ずつ読む
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS note_bodies (
+                id      INTEGER PRIMARY KEY,
+                content TEXT    NOT NULL DEFAULT ''
+            )
+            """
+        )
+        # next_id や移行済みフラグなど、付箋以外の情報を入れる表
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def _upgrade_schema(self):
+        """
+        本文を notes 表に入れていた古いデータベースなら、本文を note_bodies 表へ移す。
+        途中で落ちても中途半端にならないよう、1回のトランザクションで行う。
+        """
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(notes)")]
+        if "content" not in columns:
+            return
+        rows = self.conn.execute(
+            "SELECT id, title, content, color, x, y, timestamp FROM notes"
+        ).fetchall()
+        # BEGIN を自分で書くと、表の作り直し（CREATE/DROP）も同じトランザクションに入る
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute("ALTER TABLE notes RENAME TO notes_v1")
+            self._create_tables()
+            self.conn.executemany(
+                "INSERT INTO notes (id, title, color, x, y, timestamp, preview) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (note_id, title, color, x, y, timestamp, make_preview(content))
+                    for note_id, title, content, color, x, y, timestamp in rows
+                ],
+            )
+            self.conn.execute("INSERT INTO note_bodies (id, content) SELECT id, content FROM notes_v1")
+            self.conn.execute("DROP TABLE notes_v1")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+    def _migrate_from_json(self, json_path):
+        """
+        初回だけ、これまでの sticky_notes_data.json の内容をデータベースへ取り込む。
+        元の JSON ファイルは消さずに残しておく（JSON保存に戻したいときのため）。
+        """
+        if self._get_meta("migrated_from") is not None:
+            return
+        data = None
+        if self.conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == 0:
+            json_store = JournalJsonStore(json_path)
+            data = json_store.load()
+            # JSON 側の読み込みは本文を含まないので、ここで1件ずつ本文を読み込んで一緒に移す
+            for record in (data or {}).get("notes", []):
+                record["content"] = json_store.load_body(record["id"])
+            json_store.close()
+        with self.conn:
+            if data:
+                self._write(data.get("next_id", 1), data.get("notes", []), ())
+            self._set_meta("migrated_from", os.path.basename(json_path))
+
+    def load(self):
+        """
+        全付箋を読み込み、AtomicJsonStore.load() と同じ形の辞書で返す。
+        本文は含めない（本文は load_body() で1件ずつ読む）。
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, title, color, x, y, timestamp, preview FROM notes ORDER BY id"
+            ).fetchall()
+            next_id = int(self._get_meta("next_id", 1))
+            if not rows and next_id == 1:
+                return None
+            notes = [
+                dict(zip(("id",) + self.COLUMNS, row))
+                for row in rows
+            ]
+            return {"next_id": next_id, "notes": notes}
+
+    def load_body(self, note_id):
+        """
+        付箋1枚ぶんの本文を返す。保存用の鍵は取らず、読み込み専用の接続で読む。
+        SQLite は確定済み（コミット済み）の内容だけを見せるので、保存の途中の状態が読まれることはない。
+        """
+        row = self.read_conn.execute(
+            "SELECT content FROM note_bodies WHERE id = ?", (note_id,)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def save(self, data):
+        """全件保存。data に無い付箋は削除し、ある付箋は追加・更新する。"""
+        with self.lock:
+            records = data.get("notes", [])
+            keep_ids = {record["id"] for record in records}
+            existing = {row[0] for row in self.conn.execute("SELECT id FROM notes")}
+            with self.conn:
+                self._write(data.get("next_id", 1), records, existing - keep_ids)
+
+    def save_changes(self, next_id, upserts, deleted_ids):
+        """
+        変更された付箋だけを保存する。
+        - upserts     : {付箋ID: 保存用の辞書}。行が無ければ追加、あれば更新（upsert）
+        - deleted_ids : 削除する付箋IDの集合
+        1回のトランザクションにまとめるので、途中で落ちても中途半端な状態にならない。
+        """
+        with self.lock:
+            with self.conn:
+                self._write(next_id, upserts.values(), deleted_ids)
+
+    def _write(self, next_id, records, deleted_ids):
+        """追加・更新・削除をまとめて実行する（呼び出し側でトランザクションを開始する）。"""
+        for record in records:
+            if "content" in record:
+                # 本文が変わったときは、本文の表とプレビューの列を一緒に書き換える
+                record = dict(record, preview=make_preview(record["content"]))
+                self.conn.execute(
+                    "INSERT INTO note_bodies (id, content) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET content = excluded.content",
+                    (record["id"], record["content"]),
+                )
+            # record に含まれる列だけを書き込む（含まれない列は既存の値・既定値のまま）
+            columns = ["id"] + [name for name in self.COLUMNS if name in record]
+            updates = ", ".join(f"{name} = excluded.{name}" for name in columns[1:])
+            conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            self.conn.execute(
+                f"INSERT INTO notes ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(id) {conflict}",
+                [record[name] for name in columns],
+            )
+        deleted = [(note_id,) for note_id in deleted_ids]
+        self.conn.executemany("DELETE FROM notes WHERE id = ?", deleted)
+        self.conn.executemany("DELETE FROM note_bodies WHERE id = ?", deleted)
+        self._set_meta("next_id", next_id)
+
+    def close(self):
+        """データベースとの接続を閉じる（アプリ終了時に呼ぶ）。"""
+        with self.lock:
+            self.conn.close()
+        self.read_conn.close()
+
+
+# ============================================================
+# クラス定義9：保存先への書き込みを別スレッドで行う BackgroundWriter クラス
+# ============================================================
+# ファイルへの書き込みは、ディスクが遅いときやネットワーク上のフォルダでは時間がかかる。
+# メインスレッド（画面の処理）で書き込むと、その間すべての付箋ウィンドウが固まってしまう。
+# そこで、メインスレッドは「保存する内容の写し」を待ち行列（queue）に入れるだけにして、
+# 実際の書き込みは専用のスレッドが順番に行う。
+# tkinter の画面はメインスレッドからしか触れないので、結果（成功・失敗）は
+# root.after() で定期的に受け取り、メインスレッドで後始末の関数を呼ぶ。
+
+class BackgroundWriter:
+    """保存先への書き込みを、専用のスレッドで順番に実行するクラス。"""
+
+    def __init__(self, root, poll_ms=50):
+        """
+        - root    : after() で結果の受け取りを予約するための tkinter のウィンドウ
+        - poll_ms : 書き込み中、何ミリ秒ごとに結果を確かめるか
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self.jobs = queue.Queue()     # メインスレッド → 書き込みスレッド：書き込む仕事
+        self.results = queue.Queue()  # 書き込みスレッド → メインスレッド：仕事の結果
+        self.outstanding = 0          # 結果をまだ受け取っていない仕事の数
+        self.closed = False           # close() でスレッドを止めたか（止めた後の仕事はその場で実行する）
+        self._after_id = None
+        # daemon=True のスレッドは、メインの処理が終わると一緒に終了する
+        self.thread = threading.Thread(target=self._run, name="note-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, write, done=None, failed=None):
+        """
+        書き込みを予約する（すぐに戻るので画面は止まらない）。
+        - write  : 書き込みスレッドで実行する関数
+        - done   : 成功したとき、メインスレッドで呼ぶ関数
+        - failed : 失敗したとき、例外を渡してメインスレッドで呼ぶ関数
+        close() の後（アプリ終了の直前）に予約された書き込みは、スレッドがもう無いのでその場で実行する。
+        """
+        self.outstanding += 1
+        if self.closed:
+            self.results.put((done, failed, self._call(write)))
+            self._deliver()
+            return
+        self.jobs.put((write, done, failed))
+        if self._after_id is None:
+            self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    def _run(self):
+        """書き込みスレッドの中身。仕事を1つずつ取り出して実行する（None が来たら終わる）。"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            write, done, failed = job
+            self.results.put((done, failed, self._call(write)))
+
+    def _call(self, write):
+        """書き込みを1つ実行し、失敗したらその例外を、成功したら None を返す。"""
+        try:
+            write()
+        except Exception as e:
+            return e
+        return None
+
+    def _poll(self):
+        """root.after() から呼ばれ、届いた結果を処理する。まだ仕事が残っていれば次も予約する。"""
+        self._after_id = None
+        self._deliver()
+        if self.outstanding:
+            self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    def _deliver(self):
+        """届いている結果をすべて取り出し、成功・失敗に応じた関数を呼ぶ（メインスレッドで実行）。"""
+        while True:
+            try:
+                done, failed, error = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.outstanding -= 1
+            if error is None:
+                if done:
+                    done()
+            elif failed:
+                failed(error)
+
+    def close(self):
+        """残っている書き込みをすべて終えてからスレッドを止め、結果を受け取る（アプリ終了時）。"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        self.jobs.put(None)
+        self.thread.join()
+        self.closed = True
+        self._deliver()
+
+
+# ============================================================
+# クラス定義10：処理時間を表示する ProfilerPanel クラス
+# ============================================================
+# 「--profile」を付けて起動したとき（または環境変数 STICKY_NOTES_PROFILE=1 のとき）だけ使う。
+# 保存・読み込み・一覧の更新などの主な処理に時間を測る仕掛けを付け（start_profiling）、
+# 1秒ごとに「回数・1秒あたりの回数・所要時間の分布」をこのパネルに表示する。
+# 集計そのものは instrumentation.py の Instrumentation クラスが行う。
+# 画面が重くなったとき、時間を使っているのがアプリの処理か、Tk 自身（描画など）かを
+# 見分けられるよう、イベントループの遅れ（予約した時刻からどれだけ遅れて動けたか）も記録する。
+
+# --profile でファイル名を省略したときのトレースファイル
+PROFILE_TRACE_FILE = "sticky_notes_trace.json"
+
+# 時間を測る処理の一覧 {クラス名: [メソッド名, ...]}
+PROFILED_METHODS = {
+    "StickyNotesApp": [
+        "save_notes", "save_all_notes", "save_changed_notes", "load_notes",
+        "update_note_list", "update_stats", "on_scheduled_save", "on_search_change",
+    ],
+    "StickyNote": ["get_position", "sync_from_widgets", "create_window"],
+    "JournalJsonStore": ["save", "save_changes", "load", "load_body", "compact"],
+    "SqliteNoteStore": ["save", "save_changes", "load", "load_body"],
+}
+
+
+def start_profiling(trace_path):
+    """
+    主な処理に時間を測る仕掛けを付け、集計係（Instrumentation）を返す。
+    StickyNotesApp を作る前に呼ぶ（クラスそのものを差し替えるため）。
+    """
+    # 計測のときだけ読み込む（ふだんの起動では読み込まない）
+    from instrumentation import Instrumentation
+    profiler = Instrumentation("付箋アプリ", trace_path)
+    for class_name, names in PROFILED_METHODS.items():
+        # globals() はこのファイルで定義した名前の辞書。クラス名の文字列からクラスを取り出す
+        profiler.instrument(globals()[class_name], names)
+    return profiler
+
+
+class ProfilerPanel:
+    """計測結果を表示する小さなウィンドウ。F12 キーで開き直せる。"""
+
+    LAG_PROBE_MS = 100   # イベントループの遅れを調べる間隔（ミリ秒）
+    REFRESH_MS = 1000    # 表示を更新する間隔（ミリ秒）
+
+    def __init__(self, root, profiler):
+        self.root = root
+        self.profiler = profiler
+        self.window = None
+        self.text = None
+        self.status = None
+        # どのウィンドウが前面にあっても F12 で開けるよう、bind_all で全体に割り当てる
+        root.bind_all("<F12>", lambda event: self.open())
+        self.open()
+        self.probe_expected = time.perf_counter() + self.LAG_PROBE_MS / 1000
+        root.after(self.LAG_PROBE_MS, self.probe_lag)
+
+    def open(self):
+        """パネルを開く（開いていれば前面に出す）。"""
+        if self.window is not None and self.window.winfo_exists():
+            self.window.lift()
+            return
+        self.window = tk.Toplevel(self.root)
+        self.window.title("計測パネル")
+        self.window.geometry("760x420")
+        buttons = tk.Frame(self.window)
+        buttons.pack(fill=tk.X, padx=5, pady=5)
+        tk.Button(buttons, text="トレースを保存", command=self.save_trace).pack(side=tk.LEFT)
+        tk.Button(buttons, text="リセット", command=self.profiler.reset).pack(side=tk.LEFT, padx=5)
+        self.status = tk.Label(buttons, text="", fg="gray")
+        self.status.pack(side=tk.LEFT, padx=5)
+        # 表の列がそろうよう、等幅フォントで表示する
+        self.text = tk.Text(self.window, font=("Courier", 9), wrap=tk.NONE)
+        self.text.pack(fill=tk.BOTH, expand=True)
+        self.refresh()
+
+    def refresh(self):
+        """集計を表示し直し、REFRESH_MS 後にもう一度呼ばれるよう予約する（パネルを閉じたら止まる）。"""
+        if self.window is None or not self.window.winfo_exists():
+            return
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", self.profiler.report())
+        self.window.after(self.REFRESH_MS, self.refresh)
+
+    def probe_lag(self):
+        """
+        予約した時刻からどれだけ遅れて呼ばれたかを、イベントループの遅れとして記録する。
+        遅れている間は、Tk が描画などで忙しいか、ほかの処理がメインスレッドを使っていた。
+        """
+        now = time.perf_counter()
+        if now > self.probe_expected:
+            self.profiler.record("Tk イベントループの遅れ", self.probe_expected, now)
+        self.probe_expected = now + self.LAG_PROBE_MS / 1000
+        self.root.after(self.LAG_PROBE_MS, self.probe_lag)
+
+    def save_trace(self):
+        """トレースファイルを書き出し、書き出した場所をパネルに表示する。"""
+        try:
+            path = self.profiler.dump_trace()
+        except OSError as e:
+            self.status.config(text=f"保存に失敗しました: {e}", fg="red")
+            return
+        self.status.config(text=f"{os.path.abspath(path)} に保存しました", fg="gray")
+
+
 # ============================================================
 # main 関数：このファイルを実行したとき最初に呼ばれる入口
 # ============================================================
 
 def main():
     """アプリケーションのエントリーポイント（プログラム開始地点）。"""
+    # コマンドライン引数の読み取り。例： python sticky_notes.py --storage sqlite
+    parser = argparse.ArgumentParser(description="付箋アプリ")
+    parser.add_argument(
+        "--storage",
+        choices=["json", "sqlite"],
+        default="json",
+        help="保存先の種類（既定: json。sqlite は付箋が多いときに保存が軽い）",
+    )
+    parser.add_argument(
+        "--virtual-list",
+        action="store_true",
+        help="付箋一覧を見えている行だけで表示する（付箋が数万枚あるとき向け）",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_TRACE_FILE,
+        metavar="TRACE_FILE",
+        help="主な処理の時間を測って計測パネルに表示し、終了時にトレースファイルへ書き出す"
+             f"（既定: {PROFILE_TRACE_FILE}。環境変数 STICKY_NOTES_PROFILE=1 でも可）",
+    )
+    args = parser.parse_args()
+    # 環境変数 STICKY_NOTES_PROFILE でも計測を有効にできる（1 なら既定のファイル、それ以外はファイル名）
+    trace_path = args.profile
+    env_profile = os.environ.get("STICKY_NOTES_PROFILE")
+    if trace_path is None and env_profile:
+        trace_path = PROFILE_TRACE_FILE if env_profile == "1" else env_profile
+    # 計測の仕掛けは、アプリ本体を作る前に付ける
+    profiler = start_profiling(trace_path) if trace_path else None
+
     # tk.Tk() でメインウィンドウのオブジェクトを作る（Tkinterの初期化）
     root = tk.Tk()
     # アプリ本体を作成。createされた瞬間にUIが組み立てられる。
-    app = StickyNotesApp(root)
+    app = StickyNotesApp(root, storage=args.storage, virtual_list=args.virtual_list)
+    if profiler is not None:
+        ProfilerPanel(root, profiler)
     # mainloop() でイベント待ち受けを開始。
     # これを呼ばないと画面が一瞬で閉じてしまう。
     # この関数は「ウィンドウが閉じられるまで」処理をブロックする。
     root.mainloop()
+    if profiler is not None:
+        # 終了したら、記録した呼び出しをトレースファイルに書き出す
+        print(f"トレースを {profiler.dump_trace()} に保存しました")
 
 
 # ============================================================
@@ -0,0 +1,1412 @@
+# =============================================================================
+# 定型文管理アプリの中核部分 (teikei_core.py)
+# -----------------------------------------------------------------------------
+# テンプレート(template-files フォルダの .txt)の一覧・読み込み(文字コード自動判定)・
+# 保存・作成・削除・検索・差し込み項目の展開を、画面(Flet)を使わずに行う部分。
+# 画面付きのアプリ(teikei_kanri.py)はこのファイルの TemplateStore を土台にしている。
+# Flet を読み込まないので、ほかのスクリプトから import したり、
+# コマンドラインからすぐに(数十ミリ秒で)呼び出したりできる。
+#
+# コードを読む順番:
+#   1) main()                  … コマンドライン(list/show/search/copy/render)の入口
+#   2) TemplateStore           … テンプレートの読み書き・作成・削除などの本体
+#   3) decode_text / TemplateIndex … 文字コードの判定と、一覧を速く出すための「目録」
+#   4) FolderWatcher            … フォルダの変化を見張る仕組み
+#   5) ContentCache             … 一度読んだテンプレートをメモリに置いておく仕組み
+#   6) TemplateSearchIndex      … テンプレートの中身を全文検索する索引の仕組み
+#   7) CompiledTemplate         … {{顧客名}} のような差し込み項目を埋める仕組み
+#
+# 実行方法(Python 標準ライブラリだけで動く。copy だけは pyperclip が必要):
+#   python teikei_core.py list                       … template-files の中身を表示
+#   python teikei_core.py list 営業 --recursive        … 営業フォルダの中を、入れ子のフォルダまで表示
+#   python teikei_core.py show 営業/お礼.txt           … 内容を表示
+#   python teikei_core.py search 納期 変更             … 中身を全文検索(空白区切りで AND)
+#   python teikei_core.py render お礼.txt --set 顧客名=山田  … 差し込み項目を埋めて表示
+#   python teikei_core.py render お礼.txt --csv 宛先.csv --out 出力  … CSV の行ごとに文章を作る
+#   python teikei_core.py copy お礼.txt --set 顧客名=山田    … 埋めた文章をクリップボードへコピー
+# =============================================================================
+
+
+# ===== 1. ライブラリ(外部の便利機能)を読み込む =================================
+
+from pathlib import Path    # ファイル/フォルダのパスをオブジェクトとして扱う Python 標準機能
+from pathlib import PurePosixPath  # zip の中のファイル名("/" 区切り)を安全かどうか調べるのに使う
+import os                   # フォルダの中身を速く列挙する scandir や、ファイルの置き換えに使う標準機能
+import json                 # 目録(キャッシュ)を JSON ファイルとして保存・読み込みする標準機能
+import bisect               # 名前順のリストのどこに入れればよいかを高速に探す標準機能
+import sys                  # 実行中の OS(Linux かどうか)を調べたり、エラーを表示したりする標準機能
+import threading            # フォルダの見張りを別の流れ(スレッド)で動かす標準機能
+import select               # 「変化の知らせが届くまで待つ」ために使う標準機能
+import struct               # inotify から届くバイト列を数値に分解する標準機能
+from collections import OrderedDict, Counter  # 順番を覚えている辞書(「最近使った順」の管理)と、数を数える辞書
+import heapq                # 点数の高いものから決まった数だけを速く取り出す標準機能
+import unicodedata          # 全角・半角などの違いをそろえる(検索で「ＡＢＣ」と「abc」を同じに扱う)標準機能
+import math                 # 検索結果の並べ替えの点数計算(log)に使う標準機能
+import hashlib              # 開いたときの内容の「指紋」(ハッシュ値)を作り、保存前に他の人の変更を見つける標準機能
+import zipfile              # テンプレートをまとめて1つの zip ファイルに書き出す・取り込む標準機能
+import time                 # zip に入れるファイルの更新時刻を変換する標準機能
+import re                   # 文章の中の {{顧客名}} のような差し込み項目を探す「正規表現」の標準機能
+import csv                  # 差し込み項目の値を CSV ファイルから1行ずつ読む標準機能
+import io                   # 文字列にした CSV を、ファイルのように csv に渡すための標準機能
+import datetime             # {{today}}(今日の日付)などの値を作る標準機能
+import argparse             # コマンドライン引数(python teikei_core.py list など)を解釈する標準機能
+
+# 何も指定しないときに使うテンプレートのフォルダ(このファイルと同じ場所の "template-files")
+DEFAULT_TEMPLATE_DIR = Path(__file__).resolve().parent / "template-files"
+
+
+# ===== 2. テンプレートの保存場所を扱うクラス ====================================
+
+class TemplateStore:
+    """
+    template-files フォルダの中のテンプレートを、画面を使わずに扱うクラス。
+    一覧(フォルダごとの目録)・読み込み(文字コード自動判定)・保存・作成・削除・
+    全文検索の索引・差し込み項目の解析結果のキャッシュをまとめて持つ。
+    画面付きの TemplateManager(teikei_kanri.py)は、このクラスを受け継いで画面の処理を足している。
+    """
+
+    ARCHIVE_MANIFEST = "teikei-manifest.json"  # zip の中の、各ファイルの文字コードを記録した目録のファイル名
+    INDEX_SAVE_DELAY = 2.0  # 読み込み・保存で目録が変わってから、まとめてファイルに書き出すまでの秒数
+
+    # ----- 2-1. 初期化 -----
+    def __init__(self, template_dir, cache_dir=None):
+        """
+        - template_dir : テンプレートを置くフォルダ(template-files)
+        - cache_dir    : 目録を保存するフォルダ。省略すると利用者ごとのキャッシュフォルダ(default_cache_dir())
+        """
+        self.template_dir = Path(template_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir(self.template_dir)
+        # 目録やキャッシュは、複数のスレッド(画面の操作とフォルダの見張りなど)から書き換えるので鍵をかける
+        self.lock = threading.RLock()
+        # フォルダごとの目録(ファイル名・サイズ・更新時刻・文字コード・中のフォルダ) {フォルダ: TemplateIndex}。
+        # フォルダは template-files から見た位置("" は template-files そのもの。例: "営業/挨拶")。
+        # 目録は必要になったフォルダの分だけ読む
+        self.indexes = {}
+        # 読み込んだテンプレートの内容のキャッシュ(合計 8MB まで)。同じファイルを何度も開くときに速くなる
+        self.content_cache = ContentCache(max_bytes=8 * 1024 * 1024)
+        # テンプレートの中身の全文検索用の索引(index_files() で作る)
+        self.search_index = TemplateSearchIndex()
+        # 差し込み項目({{顧客名}} など)を解析した結果のキャッシュ。ファイルの更新時刻が同じなら解析し直さない
+        self.compiler = TemplateCompiler(max_entries=256)
+        # write_file() で書き込み中のファイル(template-files から見た位置)。
+        # フォルダの見張りは、自分の保存で起きた変化を「他の場所での更新」と取り違えないよう、これを見て飛ばす
+        self.writing = set()
+        # 目録をまとめて書き出すタイマー(schedule_index_save() が動かす。動いていなければ None)
+        self.save_timer = None
+
+    # ----- 2-2. フォルダと目録 -----
+    def index_for(self, folder):
+        """フォルダの目録を返す。まだ読んでいなければ、保存しておいた目録を読み込む(フォルダ自体は読まない)。"""
+        with self.lock:
+            index = self.indexes.get(folder)
+            if index is None:
+                if folder:
+                    # フォルダごとの目録は、位置から作った短い名前のファイルに保存する
+                    digest = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:16]
+                    cache_path = self.cache_dir / "folders" / f"{digest}.json"
+                else:
+                    cache_path = self.cache_dir / "index.json"
+                index = TemplateIndex(self.folder_path(folder), cache_path)
+                self.indexes[folder] = index
+            return index
+
+    def folder_path(self, folder):
+        """template-files から見た位置 folder を、実際のフォルダのパスにする。"""
+        return self.template_dir / folder if folder else self.template_dir
+
+    def rel_path(self, filepath):
+        """ファイルのパスを、template-files から見た位置("営業/お礼.txt" など)にする。"""
+        return filepath.relative_to(self.template_dir).as_posix()
+
+    def file_index(self, filepath):
+        """ファイルが入っているフォルダの目録を返す。"""
+        folder, _, _ = self.rel_path(filepath).rpartition("/")
+        return self.index_for(folder)
+
+    def walk_templates(self):
+        """template-files の中の(入れ子のフォルダも含む)すべてのファイルの位置を順に返す。"""
+        for dirpath, dirnames, filenames in os.walk(self.template_dir):
+            # 隠しフォルダには入らない(dirnames を書き換えると、os.walk はそのフォルダを飛ばす)
+            dirnames[:] = [name for name in dirnames if is_template_name(name)]
+            folder = Path(dirpath).relative_to(self.template_dir).as_posix()
+            for filename in filenames:
+                if is_template_name(filename):
+                    yield join_path("" if folder == "." else folder, filename)
+
+    def list_folder(self, folder=""):
+        """
+        フォルダの中身を (中のフォルダ名のリスト, ファイル名のリスト) で返す(どちらも名前順)。
+        目録を使うので、フォルダが前回から変わっていなければフォルダを読み直さない。
+        """
+        index = self.index_for(folder)
+        with self.lock:
+            index.refresh()
+            index.save()
+            return list(index.dirs), list(index.names)
+
+    def schedule_index_save(self):
+        """
+        INDEX_SAVE_DELAY 秒後に、変更のあった目録をまとめて書き出す(すでに予定があれば何もしない)。
+        目録の書き出しはフォルダ全体の JSON を作り直すので、ファイルを1つ開くたびに書くと
+        ファイルが多いフォルダほど遅くなる。文字コードの記録などはメモリの上で済ませ、後でまとめて書く。
+        """
+        with self.lock:
+            if self.save_timer is not None:
+                return
+            self.save_timer = threading.Timer(self.INDEX_SAVE_DELAY, self.save_indexes)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def save_indexes(self):
+        """変更のあった目録をすべて書き出す(予定していた書き出しは取り消す)。終了する前にも呼ぶ。"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            for index in self.indexes.values():
+                index.save()
+
+    # ----- 2-3. 読み込み(文字コード自動判定) -----
+    def read_file(self, filepath):
+        """
+        日本語ファイルは作成環境によって文字コードが異なるため、
+        ファイルを1回だけバイト列として読み、そのバイト列から文字コードを判定して文字列にする。
+        判定した文字コードは目録に「サイズ・更新時刻」と一緒に記録し、
+        ファイルが変わっていなければ次からは判定を飛ばしてその文字コードで読む。
+        読めないファイルは OSError(見つからない・権限がないなど)か ValueError(文字コード)で知らせる。
+        (内容, 版) を返す。版は保存するときに、開いた後で他の人が変更していないかを調べるのに使う。
+        """
+        # キャッシュにあり、サイズも更新時刻も変わっていなければ、ディスクから読まずに返す
+        rel = self.rel_path(filepath)
+        stat = filepath.stat()
+        content = self.content_cache.get(rel, stat)
+        if content is not None:
+            return content, file_version(stat, content)
+
+        content, encoding, stat = self.decode_file(filepath)
+        # 判定した文字コードを目録に記録する(すでに同じ記録があれば何もしない)。
+        # ファイルへの書き出しは、ほかの変更とまとめて後で行う
+        index = self.file_index(filepath)
+        with self.lock:
+            index.set_encoding(filepath.name, encoding, stat)
+            if index.dirty:
+                self.schedule_index_save()
+        self.content_cache.put(rel, stat, content)
+        return content, file_version(stat, content)
+
+    def decode_file(self, filepath):
+        """
+        ファイルを1回だけ読み、(文字列, 文字コード, stat) を返す。
+        目録に記録した文字コードが使えればそれで読み、使えなければ decode_text() で判定する。
+        キャッシュや目録の保存は行わないので、全文検索の索引作りでまとめて読むときにも使える。
+        """
+        # "rb" はバイナリ(バイト列)で読むモード。開いたファイルの stat を使うので、
+        # 「調べたサイズ・更新時刻」と「読んだ中身」が食い違わない
+        with open(filepath, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+
+        index = self.file_index(filepath)
+        with self.lock:
+            encoding = index.cached_encoding(filepath.name, stat)
+        content = None
+        if encoding is not None:
+            try:
+                content = data.decode(encoding)
+            except UnicodeDecodeError:
+                encoding = None  # 記録が古かった場合は判定し直す
+        if content is None:
+            content, encoding = decode_text(data)
+        # read_text() と同じように、改行コード(\r\n や \r)を \n にそろえる
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+        return content, encoding, stat
+
+    # ----- 2-4. 保存・作成・削除 -----
+    def write_file(self, filepath, content, expected=None):
+        """
+        内容をファイルに書き込み、目録・キャッシュ・検索の索引も書いた内容に合わせる。書いた版を返す。
+        expected(開いたときの版)を渡すと、書く前にディスクの版と比べ、違えば SaveConflictError を出す。
+        """
+        if expected is not None:
+            self.check_conflict(filepath, expected)
+        rel = self.rel_path(filepath)
+        index = self.file_index(filepath)
+        # 書き込み中の印を付ける。ファイルを入れ替えた直後、目録を新しくする前に見張りの知らせが
+        # 届いても、見張り側はこの印を見て「自分の保存」だと分かる
+        with self.lock:
+            self.writing.add(rel)
+        try:
+            self.replace_file(filepath, content)
+            stat = filepath.stat()
+            # 目録のサイズ・更新時刻・文字コードも書き換えた内容に合わせる。
+            # 印は目録を新しくしたのと同じ鍵の中で外すので、見張りからは「書き込み中」か
+            # 「目録が新しい」のどちらかにしか見えない
+            with self.lock:
+                index.set_encoding(filepath.name, "utf-8", stat)
+                self.writing.discard(rel)
+                self.schedule_index_save()
+        finally:
+            with self.lock:
+                self.writing.discard(rel)  # 書き込みに失敗したときも印を外す
+        # 書いた内容をそのままキャッシュに入れておく(次に開くときディスクから読まずに済む)
+        self.content_cache.put(rel, stat, content)
+        self.search_index.update(rel, content)
+        return file_version(stat, content)
+
+    def check_conflict(self, filepath, expected):
+        """ディスクのファイルが、開いたときの版 expected から変わっていれば SaveConflictError を出す。"""
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            raise SaveConflictError(f"'{filepath.name}' は開いた後に他の場所で削除されています") from None
+        size, mtime_ns, digest = expected
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return  # サイズも更新時刻も開いたときのまま
+        # 更新時刻だけが変わって中身が同じ(同じ内容で保存し直されただけ)なら、ぶつかってはいない
+        try:
+            disk_content, _, _ = self.decode_file(filepath)
+        except (OSError, ValueError):
+            disk_content = None
+        if disk_content is None or content_hash(disk_content) != digest:
+            raise SaveConflictError(f"'{filepath.name}' は開いた後に他の場所で更新されています")
+
+    def replace_file(self, filepath, content, sync=True):
+        """
+        内容をいったん同じフォルダの一時ファイルに書き、ディスクまで書き込んだのを確かめてから
+        os.replace() で元のファイルと入れ替える。書いている途中で落ちても、元のファイルは壊れない
+        (他の人から見えるのは「前の内容」か「新しい内容」のどちらかだけ)。
+        一時ファイルは "." で始まる名前にするので、一覧には出ない(is_template_name() を参照)。
+        content がバイト列ならそのまま書く(zip から取り込むとき、元の文字コードのまま書くため)。
+        sync=False なら、ディスクまでの書き込みを待たない(まとめて取り込むときに速くするため)。
+        """
+        # os.replace() で入れ替えられるのは同じドライブの中だけなので、一時ファイルは同じフォルダに作る
+        tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+        try:
+            # O_EXCL … 同じ名前のファイルがあれば作らずにエラーにする(他の人の一時ファイルを壊さない)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            if isinstance(content, bytes):
+                f = open(fd, "wb")
+            else:
+                # 常に utf-8 で保存することで統一(改行コードは write_text() と同じく OS に合わせる)
+                f = open(fd, "w", encoding="utf-8")
+            with f:
+                f.write(content)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())  # OS の中に溜まっている分も、ディスクまで書き込ませる
+            try:
+                # 元のファイルの読み書きの権限を引き継ぐ
+                os.chmod(tmp_path, filepath.stat().st_mode & 0o7777)
+            except OSError:
+                pass  # 新しいファイル、または権限を変えられない共有フォルダ
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        if sync and os.name == "posix":
+            # 入れ替えたこと(フォルダの中身の変更)もディスクまで書き込ませる
+            dir_fd = os.open(filepath.parent, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def create_file(self, filepath):
+        """中身が空のファイルを作る。同じ名前のファイルが既にあれば作らずに False を返す。"""
+        if filepath.exists():
+            return False
+        # 空文字を書き込んで「中身が空のファイル」を作成
+        filepath.write_text("", encoding="utf-8")
+        return True
+
+    def delete_file(self, filepath):
+        """ファイルを削除し、キャッシュと検索の索引からも取り除く。"""
+        filepath.unlink()       # ファイルを実際に削除
+        self.content_cache.invalidate(self.rel_path(filepath))
+        self.search_index.remove(self.rel_path(filepath))
+
+    # ----- 2-5. 全文検索 -----
+    def index_files(self, filenames):
+        """ファイル(template-files から見た位置)を読み込んで、全文検索の索引を更新する(別スレッドから呼ぶ)。"""
+        indexes = set()  # 文字コードを記録した目録(最後にまとめて保存する)
+        for filename in filenames:
+            filepath = self.template_dir / filename
+            try:
+                content, encoding, stat = self.decode_file(filepath)
+            except FileNotFoundError:
+                self.search_index.remove(filename)
+                continue
+            except (OSError, ValueError):
+                continue  # 読めないファイルは検索の対象にしない
+            self.search_index.update(filename, content)
+            index = self.file_index(filepath)
+            with self.lock:
+                index.set_encoding(filepath.name, encoding, stat)
+            indexes.add(index)
+        with self.lock:
+            for index in indexes:
+                index.save()
+
+    def scan_search(self, query, limit=20):
+        """
+        索引を作らずに、すべてのファイルを1回ずつ読んで検索する(コマンドラインのように1回だけ検索するとき用)。
+        1回きりの検索なら、索引を作るより、読みながら探すほうが速い。
+        空白区切りのすべての語を含むファイルを、語の出てくる回数の多い順に
+        (ファイルの位置, 点数, 一致箇所の抜き出し) のリストで返す。
+        """
+        terms = TemplateSearchIndex.normalize(query).split()
+        if not terms:
+            return []
+        found = []
+        for filename in self.walk_templates():
+            try:
+                content, _, _ = self.decode_file(self.template_dir / filename)
+            except (OSError, ValueError):
+                continue  # 読めないファイルは検索の対象にしない
+            text = TemplateSearchIndex.normalize(content)
+            name = TemplateSearchIndex.normalize(filename)
+            counts = [text.count(term) + name.count(term) for term in terms]
+            if all(counts):
+                found.append((sum(counts), filename, content))
+        return [
+            (filename, score, TemplateSearchIndex.snippet(content, terms))
+            for score, filename, content in heapq.nlargest(limit, found, key=lambda item: item[0])
+        ]
+
+    # ----- 2-6. 差し込み項目の展開 -----
+    def render_csv(self, compiled, csv_path, out_dir, name, report=None):
+        """
+        CSV ファイルの1行ごとに、差し込み項目を埋めた文章を作り、out_dir に
+        「テンプレート名-0001.txt」のような名前で書き出す。CSV の1行目(見出し)が項目名になる。
+        (作った件数, CSV に列が無かった項目名のリスト) を返す。
+        """
+        # Excel で保存した CSV は cp932 や BOM 付き UTF-8 のことが多いので、テンプレートと同じ方法で判定する
+        text, _ = decode_text(csv_path.read_bytes())
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        try:
+            rows = list(reader)
+        except csv.Error as ex:
+            # 長すぎる欄・閉じていない引用符などで読めない CSV は、ほかの読み込みエラーと同じく ValueError にする
+            raise ValueError(f"CSV を読めません({reader.reader.line_num} 行目): {ex}") from ex
+        columns = [column.strip() for column in reader.fieldnames or []]
+        base = builtin_values()
+        missing = [n for n in compiled.names if n not in columns and n not in base]
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for count, row in enumerate(rows, start=1):
+            # 列の値が {{today}} などより優先される。空欄の列(None)は {{項目名}} のまま残す
+            values = dict(base)
+            values.update((key.strip(), value) for key, value in row.items() if key is not None and value is not None)
+            (out_dir / f"{name}-{count:04d}.txt").write_text(compiled.render(values), encoding="utf-8")
+            if report:
+                report(count, len(rows))
+        return len(rows), missing
+
+    # ----- 2-7. まとめて書き出し・取り込み(zip) -----
+    def export_archive(self, archive_path, report=None):
+        """
+        template-files の中のすべてのテンプレート(入れ子のフォルダも含む)を、1つの zip ファイルに書き出す。
+        ファイルの中身は文字コードを変えずにそのまま入れ、各ファイルの文字コードは
+        zip の中の目録(ARCHIVE_MANIFEST)に記録する。書き出した件数を返す。
+        """
+        filenames = sorted(self.walk_templates())
+        manifest = {}
+        # 途中で失敗しても壊れた zip が残らないよう、一時ファイルに書いてから置き換える
+        tmp_path = archive_path.with_name(f".{archive_path.name}.tmp")
+        try:
+            # ZIP_DEFLATED … 中身を圧縮する。テキストは小さくなるので、共有フォルダ越しのコピーも速い
+            with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for count, filename in enumerate(filenames, start=1):
+                    filepath = self.template_dir / filename
+                    try:
+                        with open(filepath, "rb") as f:
+                            stat = os.fstat(f.fileno())
+                            data = f.read()
+                    except FileNotFoundError:
+                        continue  # 書き出している間に削除された
+                    # 文字コードは目録の記録を使い、無ければここで判定する
+                    index = self.file_index(filepath)
+                    with self.lock:
+                        encoding = index.cached_encoding(filepath.name, stat)
+                    if encoding is None:
+                        try:
+                            _, encoding = decode_text(data)
+                        except ValueError:
+                            encoding = None  # 判定できないファイルも、中身はそのまま書き出す
+                    info = zipfile.ZipInfo(filename, time.localtime(stat.st_mtime)[:6])
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    zf.writestr(info, data)
+                    manifest[filename] = {"encoding": encoding}
+                    if report:
+                        report(count, len(filenames))
+                zf.writestr(
+                    self.ARCHIVE_MANIFEST,
+                    json.dumps({"version": 1, "files": manifest}, ensure_ascii=False, indent=1),
+                )
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return len(manifest)
+
+    def import_archive(self, archive_path, report=None, overwrite=False):
+        """
+        export_archive() で書き出した zip ファイルのテンプレートを template-files に取り込む。
+        フォルダ分けもそのまま再現し、中身は元の文字コードのまま書く。目録に記録された文字コードは
+        フォルダの目録にも記録するので、取り込んだファイルを開くときに文字コードを判定し直さずに済む。
+        同じ名前のファイルがあれば、overwrite=True のときだけ上書きする。
+        (取り込んだファイルの位置のリスト, 取り込まなかった件数) を返す。
+        """
+        imported = []
+        skipped = 0
+        indexes = set()  # 文字コードを記録した目録(最後にまとめて保存する)
+        with zipfile.ZipFile(archive_path) as zf:
+            try:
+                manifest = json.loads(zf.read(self.ARCHIVE_MANIFEST)).get("files", {})
+            except KeyError:
+                manifest = {}  # 目録の無い zip(手で作った zip など)は、文字コードを開くときに判定する
+            members = [
+                info for info in zf.infolist()
+                if not info.is_dir() and info.filename != self.ARCHIVE_MANIFEST
+            ]
+            for count, info in enumerate(members, start=1):
+                filename = archive_member_path(info.filename)
+                filepath = self.template_dir / filename if filename else None
+                if filepath is None or (not overwrite and filepath.exists()):
+                    skipped += 1  # 危ない名前(../ など)か、同じ名前のファイルが既にある
+                else:
+                    data = zf.read(info)
+                    filepath.parent.mkdir(parents=True, exist_ok=True)
+                    # 1件ずつディスクまでの書き込みを待つと遅いので、入れ替えだけを安全に行う
+                    self.replace_file(filepath, data, sync=False)
+                    self.content_cache.invalidate(filename)
+                    encoding = manifest.get(filename, {}).get("encoding")
+                    if encoding is not None:
+                        index = self.file_index(filepath)
+                        with self.lock:
+                            index.set_encoding(filepath.name, encoding, filepath.stat())
+                        indexes.add(index)
+                    imported.append(filename)
+                if report:
+                    report(count, len(members))
+        with self.lock:
+            for index in indexes:
+                index.save()
+        return imported, skipped
+
+
+# ===== 3. 文字コードの判定とテンプレート一覧の目録(キャッシュ) ====================
+
+class SaveConflictError(Exception):
+    """開いた後に他の場所でファイルが更新・削除されていて、そのまま保存すると相手の変更が消えるときのエラー。"""
+
+
+def default_cache_dir(template_dir):
+    """
+    目録を保存する、利用者ごとのキャッシュフォルダを返す。
+    Windows は %LOCALAPPDATA%\\teikei、それ以外は $XDG_CACHE_HOME/teikei(無ければ ~/.cache/teikei)の下に、
+    テンプレートのフォルダごとに分けて置く。共有フォルダの隣に書かないので、
+    書き込めない共有フォルダでも使え、複数の人の目録が混ざることもない。
+    """
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        base = Path(os.environ["LOCALAPPDATA"])
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    digest = hashlib.sha1(str(Path(template_dir).resolve()).encode("utf-8")).hexdigest()[:16]
+    return base / "teikei" / digest
+
+
+def decode_text(data):
+    """
+    バイト列 data の文字コードを判定して、(文字列, 文字コード名) を返す。
+    同じバイト列を使い回すので、ファイルを読み直す必要はない。判定の順番:
+      utf-8-sig … 先頭に BOM(EF BB BF)が付いた UTF-8(Excel保存のCSVなどに多い)
+      utf-8     … 現代の標準的な文字コード
+      cp932     … Windows特有のShift_JIS(古いメモ帳など)
+    どれでも読めなければ、どこで失敗したかを含めて ValueError を出す。
+    """
+    # BOM が付いていれば、中身を調べるまでもなく BOM 付き UTF-8
+    if data.startswith(b"\xef\xbb\xbf"):
+        return data.decode("utf-8-sig"), "utf-8-sig"
+    try:
+        return data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError as utf8_error:
+        try:
+            return data.decode("cp932"), "cp932"
+        except UnicodeDecodeError as cp932_error:
+            raise ValueError(
+                "文字コードを判定できませんでした"
+                f"(UTF-8: {utf8_error.start}バイト目, cp932: {cp932_error.start}バイト目で読めない文字)"
+            ) from None
+
+
+def is_template_name(name):
+    """
+    一覧に出すファイルかどうか。"." で始まる隠しファイル(保存中の一時ファイルや、
+    OS が作る .DS_Store など)はテンプレートとして扱わない。
+    """
+    return not name.startswith(".")
+
+
+def join_path(folder, name):
+    """template-files から見たフォルダの位置と名前をつなぐ(folder が "" なら name のまま)。"""
+    return f"{folder}/{name}" if folder else name
+
+
+def archive_member_path(name):
+    """
+    zip の中のファイル名を、template-files から見た位置にして返す。
+    template-files の外へ出る名前("../" や "/" で始まる名前)や隠しファイルなど、
+    取り込んではいけない名前なら None を返す。
+    """
+    path = PurePosixPath(name)
+    if path.is_absolute() or "\\" in name or ":" in name:
+        return None
+    if not path.parts or any(part in ("", ".", "..") or not is_template_name(part) for part in path.parts):
+        return None
+    return path.as_posix()
+
+
+def content_hash(content):
+    """内容の「指紋」(SHA-256 のハッシュ値)を返す。1文字でも違えば別の値になる。"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def file_version(stat, content):
+    """ファイルの版 (サイズ, 更新時刻, 内容のハッシュ値) を返す。保存前の衝突チェックに使う。"""
+    return (stat.st_size, stat.st_mtime_ns, content_hash(content))
+
+
+class TemplateIndex:
+    """
+    template-files フォルダの「目録」(ファイル名・サイズ・更新時刻・文字コード)を
+    JSON ファイルに保存しておき、一覧の表示を速くするクラス。
+
+    フォルダ自体の更新時刻(mtime)は、ファイルの追加・削除・名前変更のときに変わる。
+    そこで、フォルダの更新時刻が前回と同じなら、フォルダの中身を読み直さずに目録をそのまま使う。
+    変わっていたときも、1件ずつ情報(stat)を調べるのは新しく増えたファイルだけにする。
+    共有フォルダに何千ものファイルがあっても、起動や更新で全ファイルを調べずに済む。
+    """
+
+    VERSION = 3  # 目録ファイルの形式の番号。形式を変えたら増やし、古い目録は使わない(3: 中のフォルダも記録)
+
+    def __init__(self, folder, cache_path):
+        """
+        - folder     : 目録を作るフォルダ(template-files)
+        - cache_path : 目録を保存する JSON ファイルのパス
+        """
+        self.folder = Path(folder)
+        self.cache_path = Path(cache_path)
+        # {ファイル名: {"size": バイト数, "mtime_ns": 更新時刻, "encoding": 文字コード(未判定なら None)}}
+        self.entries = {}
+        self.names = []            # ファイル名を名前順に並べたリスト(一覧の表示順と同じ)
+        self.dirs = []             # 中のフォルダの名前を名前順に並べたリスト
+        self.dir_mtime_ns = None   # 目録を作ったときのフォルダの更新時刻(ナノ秒)
+        self.dirty = False         # 保存していない変更があるか
+        self.save_failed = False   # 保存に失敗したことがあるか(失敗の知らせを何度も出さないため)
+        self.load()
+
+    def load(self):
+        """保存しておいた目録を読み込む。無い・壊れている・別フォルダのものなら空から始める。"""
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.VERSION or data.get("folder") != str(self.folder):
+            return
+        self.entries = data.get("entries", {})
+        self.names = sorted(self.entries)
+        self.dirs = data.get("dirs", [])
+        self.dir_mtime_ns = data.get("dir_mtime_ns")
+
+    def save(self):
+        """
+        目録に変更があれば JSON ファイルに書き出す。
+        書き出せなくても(キャッシュフォルダに書き込めない・ディスクが満杯など)エラーにはせず、
+        知らせを1回だけ表示して目録はメモリの上で使い続ける(次回の起動が少し遅くなるだけ)。
+        """
+        if not self.dirty:
+            return
+        data = {
+            "version": self.VERSION,
+            "folder": str(self.folder),
+            "dir_mtime_ns": self.dir_mtime_ns,
+            "dirs": self.dirs,
+            "entries": self.entries,
+        }
+        # いったん一時ファイルに書いてから置き換えるので、途中で落ちても目録が壊れない
+        tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.cache_path)
+        except OSError as ex:
+            if not self.save_failed:
+                print(f"目録を保存できません(メモリの上でだけ使います): {ex}", file=sys.stderr)
+                self.save_failed = True
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+            return
+        self.dirty = False
+
+    def refresh(self):
+        """
+        フォルダの中身と目録を突き合わせ、(追加されたファイル名, 削除されたファイル名) を返す。
+        フォルダの更新時刻が前回と同じなら、フォルダを読まずに ([], []) を返す。
+        """
+        # フォルダを読む「前」の時刻を覚えておく。読んでいる途中で変わっても、次回また読み直せる
+        dir_mtime_ns = self.folder.stat().st_mtime_ns
+        if dir_mtime_ns == self.dir_mtime_ns:
+            return [], []
+
+        current = set()
+        added = []
+        dirs = []
+        # os.scandir はファイルかどうかをフォルダの一覧から判断できるので、iterdir + is_file より速い
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not is_template_name(entry.name):
+                    continue
+                if entry.is_dir():
+                    # 中のフォルダは名前だけを覚える(中身は開いたときに読む)
+                    dirs.append(entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+                current.add(entry.name)
+                if entry.name not in self.entries:
+                    # 新しいファイルだけ、サイズと更新時刻を調べる
+                    self.put(entry.name, entry.stat())
+                    added.append(entry.name)
+        removed = [name for name in self.names if name not in current]
+        for name in removed:
+            self.remove(name)
+
+        self.dirs = sorted(dirs)
+        self.dir_mtime_ns = dir_mtime_ns
+        self.dirty = True
+        return sorted(added), removed
+
+    def put(self, name, stat, encoding=None):
+        """ファイル1件の情報を目録に追加(または上書き)する。stat は os.stat() の結果。"""
+        if name not in self.entries:
+            # 名前順を保ったまま挿入する
+            bisect.insort(self.names, name)
+        self.entries[name] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "encoding": encoding,
+        }
+        self.dirty = True
+
+    def remove(self, name):
+        """ファイル1件を目録から取り除く。"""
+        if self.entries.pop(name, None) is None:
+            return
+        self.names.pop(bisect.bisect_left(self.names, name))
+        self.dirty = True
+
+    def set_dir(self, name, exists):
+        """中のフォルダ1件を、目録に加える(exists=True)または目録から取り除く(exists=False)。"""
+        if (name in self.dirs) == exists:
+            return
+        if exists:
+            bisect.insort(self.dirs, name)
+        else:
+            self.dirs.remove(name)
+        self.dirty = True
+
+    def cached_encoding(self, name, stat):
+        """記録したときからサイズも更新時刻も変わっていなければ、判定済みの文字コードを返す。"""
+        entry = self.entries.get(name)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return entry["encoding"]
+
+    def set_encoding(self, name, encoding, stat):
+        """ファイルを読み書きしたときに、判定した文字コードと今のサイズ・更新時刻を記録する。"""
+        entry = self.entries.get(name)
+        if entry is None or entry["encoding"] != encoding or \
+                entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            self.put(name, stat, encoding)
+
+
+# ===== 4. フォルダの見張り ======================================================
+
+class FolderWatcher:
+    """
+    フォルダ内のファイルの追加・削除・変更を見張り、変わったファイルだけを知らせるクラス。
+
+    Linux では inotify(ファイルが変わると OS が知らせてくれる仕組み)を使う。
+    それ以外の OS や inotify が使えないときは、一定間隔でフォルダを調べ直す「ポーリング」に切り替える。
+    ネットワーク上の共有フォルダでは、他のパソコンでの変更は inotify に届かないので、
+    inotify を使うときも長めの間隔でポーリングを併用する。
+    """
+
+    # inotify の知らせの種類(Linux の <sys/inotify.h> と同じ値)
+    IN_CLOSE_WRITE = 0x00000008  # 書き込み用に開かれたファイルが閉じられた(=書き終わった)
+    IN_MOVED_FROM = 0x00000040   # フォルダの外へ移動された(名前変更の「元の名前」)
+    IN_MOVED_TO = 0x00000080     # フォルダの中へ移動された(名前変更の「新しい名前」)
+    IN_CREATE = 0x00000100       # 作成された
+    IN_DELETE = 0x00000200       # 削除された
+    IN_Q_OVERFLOW = 0x00004000   # 知らせが多すぎて取りこぼした
+    IN_ISDIR = 0x40000000        # 対象がフォルダ
+    EVENT_HEADER = struct.Struct("iIII")  # 1件の知らせの先頭部分(wd, mask, cookie, 名前の長さ)
+
+    def __init__(self, folder, on_events, poll_interval=2.0, full_scan_every=5, fallback_interval=30.0):
+        """
+        - folder            : 見張るフォルダ
+        - on_events         : 変化があったときに呼ぶ関数。(種類, ファイル名) のリストを受け取る
+                              (中のフォルダが増えた・消えたときは、種類が "folder" で名前はフォルダ名)
+        - poll_interval     : ポーリングだけで見張るとき、何秒ごとに調べるか
+        - full_scan_every   : ポーリング何回に1回、全ファイルの更新時刻まで調べるか
+        - fallback_interval : inotify を使うときに併用するポーリングの間隔(秒)
+        """
+        self.folder = Path(folder)
+        self.on_events = on_events
+        self.poll_interval = poll_interval
+        self.full_scan_every = full_scan_every
+        self.fallback_interval = fallback_interval
+        self.snapshot = {}         # 前回調べたときの {ファイル名: (サイズ, 更新時刻)}
+        self.subdirs = set()       # 前回調べたときの中のフォルダの名前
+        self.dir_mtime_ns = None   # 前回調べたときのフォルダの更新時刻
+        self.mode = None           # "inotify" または "polling"
+        self._fd = None            # inotify の窓口(ファイル記述子)
+        self._wake = None          # stop() で select の待ちを起こすためのパイプ (読み口, 書き口)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """見張りを別スレッドで始める。"""
+        self._fd = self._open_inotify()
+        self.mode = "inotify" if self._fd is not None else "polling"
+        if self._fd is not None:
+            self._wake = os.pipe()
+        # daemon=True のスレッドは、アプリが終わると一緒に終了する
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """見張りを止める。"""
+        self._stop.set()
+        if self._wake is not None:
+            os.write(self._wake[1], b"x")  # select で待っているスレッドを起こす
+        if self._thread is not None:
+            self._thread.join()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._wake is not None:
+            for fd in self._wake:
+                os.close(fd)
+            self._wake = None
+
+    def _open_inotify(self):
+        """inotify を準備する。使えない環境では None を返す(ポーリングに切り替える)。"""
+        if not sys.platform.startswith("linux"):
+            return None
+        # ctypes(Linux の inotify を呼び出す標準機能)は読み込みに時間がかかるので、見張りを始めるときだけ読み込む。
+        # コマンドライン(list や show)ではフォルダを見張らないので、その分だけ速く起動できる
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            # IN_CLOEXEC / IN_NONBLOCK は os.O_CLOEXEC / os.O_NONBLOCK と同じ値
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd < 0:
+                return None
+            mask = (self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                    | self.IN_CREATE | self.IN_DELETE)
+            if libc.inotify_add_watch(fd, os.fsencode(str(self.folder)), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run(self):
+        """見張り用スレッドの中身。知らせを待ち、変化があれば on_events を呼ぶ。"""
+        # 最初にフォルダの今の状態を覚えておく(ここでは知らせない)
+        self._scan(full=True)
+        interval = self.fallback_interval if self._fd is not None else self.poll_interval
+        polls = 0
+        while not self._stop.is_set():
+            events = {}  # {ファイル名: 種類}。同じファイルの知らせは最後の1件にまとめる
+            ready = []
+            if self._fd is not None:
+                # inotify の知らせが届くか、interval 秒たつまで待つ
+                ready, _, _ = select.select([self._fd, self._wake[0]], [], [], interval)
+                if self._stop.is_set():
+                    break
+            elif self._stop.wait(interval):
+                break
+            if self._fd in ready:
+                events.update(self._read_inotify())
+            else:
+                polls += 1
+                full = self._fd is not None or polls % self.full_scan_every == 0
+                events.update(self._scan(full=full))
+            if events and not self._stop.is_set():
+                self.on_events([(kind, name) for name, kind in sorted(events.items())])
+
+    def _read_inotify(self):
+        """届いている inotify の知らせをすべて読み、{ファイル名: 種類} にして返す。"""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return {}
+        events = {}
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            # 名前の後ろは \0 で埋められているので取り除く
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                # 取りこぼしがあったので、フォルダ全体を調べ直す
+                events.update(self._scan(full=True))
+                continue
+            if not name or not is_template_name(name):
+                continue
+            if mask & self.IN_ISDIR:
+                # 中のフォルダが増えた・消えた(中身は見張らない。開いたときにそのフォルダを見張る)
+                if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    self.subdirs.discard(name)
+                else:
+                    self.subdirs.add(name)
+                events[name] = "folder"
+                continue
+            if mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                if self.snapshot.pop(name, None) is not None:
+                    events[name] = "removed"
+                continue
+            try:
+                stat = (self.folder / name).stat()
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            old = self.snapshot.get(name)
+            if old != signature:
+                self.snapshot[name] = signature
+                events[name] = "added" if old is None else "modified"
+        return events
+
+    def _scan(self, full):
+        """
+        フォルダを調べ、前回との違いを {ファイル名: 種類} にして返す。
+        full=False のときは、フォルダの更新時刻が変わったとき(追加・削除があったとき)だけ読み、
+        新しいファイルだけを調べる。full=True なら全ファイルの更新時刻を調べて変更も見つける。
+        """
+        try:
+            dir_mtime_ns = self.folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if not full and dir_mtime_ns == self.dir_mtime_ns:
+            return {}
+
+        events = {}
+        current = {}
+        subdirs = set()
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not is_template_name(entry.name):
+                    continue
+                if entry.is_dir():
+                    subdirs.add(entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+                old = self.snapshot.get(entry.name)
+                if old is None or full:
+                    stat = entry.stat()
+                    signature = (stat.st_size, stat.st_mtime_ns)
+                    if old is None:
+                        events[entry.name] = "added"
+                    elif old != signature:
+                        events[entry.name] = "modified"
+                else:
+                    signature = old
+                current[entry.name] = signature
+        for name in self.snapshot.keys() - current.keys():
+            events[name] = "removed"
+        for name in subdirs ^ self.subdirs:
+            events[name] = "folder"
+        self.subdirs = subdirs
+        self.snapshot = current
+        self.dir_mtime_ns = dir_mtime_ns
+        return events
+
+
+# ===== 5. 読み込んだ内容のキャッシュ ============================================
+
+class ContentCache:
+    """
+    読み込んで文字列にしたテンプレートの内容を、メモリに置いておくクラス(LRU キャッシュ)。
+    LRU(Least Recently Used)は「いっぱいになったら、最も長く使われていないものから捨てる」方式。
+    合計の大きさ(バイト数)に上限があるので、大きなファイルが多くてもメモリを使いすぎない。
+    ファイルのサイズか更新時刻が変わっていたら、キャッシュの内容は使わない。
+    """
+
+    def __init__(self, max_bytes):
+        """max_bytes : キャッシュに置いておく内容の合計の上限(ファイルのバイト数で数える)"""
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()  # {ファイル名: (サイズ, 更新時刻, 内容)}。後ろほど最近使ったもの
+        self.total_bytes = 0
+        self.hits = 0               # キャッシュから返せた回数
+        self.misses = 0             # ディスクから読む必要があった回数
+        # ボタン操作とフォルダの見張り(別スレッド)の両方から使うので鍵をかける
+        self.lock = threading.Lock()
+
+    def get(self, name, stat):
+        """サイズと更新時刻が同じならキャッシュした内容を返す。無い・古いときは None。"""
+        with self.lock:
+            item = self.items.get(name)
+            if item is None or item[0] != stat.st_size or item[1] != stat.st_mtime_ns:
+                self.misses += 1
+                return None
+            # 使ったものを「最近使った」側(末尾)へ移す
+            self.items.move_to_end(name)
+            self.hits += 1
+            return item[2]
+
+    def put(self, name, stat, content):
+        """内容をキャッシュに入れ、上限を超えたら古いものから捨てる。"""
+        with self.lock:
+            self._discard(name)
+            if stat.st_size > self.max_bytes:
+                return  # 上限より大きいファイルはキャッシュしない
+            self.items[name] = (stat.st_size, stat.st_mtime_ns, content)
+            self.total_bytes += stat.st_size
+            while self.total_bytes > self.max_bytes:
+                # popitem(last=False) で先頭(最も長く使われていないもの)を取り出す
+                _, (size, _, _) = self.items.popitem(last=False)
+                self.total_bytes -= size
+
+    def invalidate(self, name):
+        """そのファイルのキャッシュを捨てる(ファイルが変更・削除されたとき)。"""
+        with self.lock:
+            self._discard(name)
+
+    def _discard(self, name):
+        item = self.items.pop(name, None)
+        if item is not None:
+            self.total_bytes -= item[0]
+
+    def stats(self):
+        """ヒット数・ミス数・件数・合計バイト数を辞書で返す(動作確認用)。"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.items),
+                "bytes": self.total_bytes,
+            }
+
+
+# ===== 6. 全文検索の索引 ========================================================
+
+class TemplateSearchIndex:
+    """
+    テンプレートのファイル名と中身から作る、文字 n-gram の転置インデックス。
+
+    日本語は単語の区切りに空白が無いので、「1文字」と「隣り合う2文字」の並びを見出しにする。
+    例: 「お世話」→ お / 世 / 話 / お世 / 世話
+    見出しごとに「それを含むファイル名と、出てくる回数」を持っておけば、検索のたびに全ファイルを読まずに済む。
+    結果は、語の出てくる回数・語の珍しさ・ファイルの長さから点数(BM25 という計算方法)を付けて並べる。
+    """
+
+    K1 = 1.2   # 同じ語が何度も出てくるときの点数の伸び方(大きいほど回数を重く見る)
+    B = 0.75   # 長いファイルほど点数を割り引く度合い(0 なら長さを気にしない)
+    NAME_BONUS = 2.0  # ファイル名に語が含まれるときに加える点数(語の珍しさに掛ける)
+
+    def __init__(self):
+        self.postings = {}   # {文字の並び: {それを含むファイル名: 出てくる回数}}
+        self.grams = {}      # {ファイル名: そのファイルから取り出した {文字の並び: 出てくる回数}}
+        self.texts = {}      # {ファイル名: 検索用に正規化した中身}
+        self.contents = {}   # {ファイル名: 元の中身}(一致箇所の抜き出しは、書き換える前の文章から作る)
+        self.names = {}      # {ファイル名: 検索用に正規化したファイル名}
+        self.total_length = 0
+        self.built = False   # 全ファイルの索引を作り終えたか
+        # 索引作りのスレッド・見張りのスレッド・画面の操作から同時に使うので鍵をかける
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        """全角英数・半角カナなどをそろえ(NFKC)、大文字と小文字の区別をなくす。"""
+        return unicodedata.normalize("NFKC", text).casefold()
+
+    @staticmethod
+    def split_grams(text):
+        """文字列から、1文字と隣り合う2文字の並びを取り出し、{並び: 出てくる回数} で返す。"""
+        # 1文字ずつの回数と、隣り合う2文字の回数をまとめて数える。
+        # map(str.__add__, text, text[1:]) は「1文字目+2文字目」「2文字目+3文字目」… を作る(ループより速い)
+        grams = Counter(text)
+        # 空白そのものや、空白をまたぐ並びは検索に使わないので取り除く
+        spaces = {ch for ch in grams if ch.isspace()}
+        for ch in spaces:
+            del grams[ch]
+        pairs = Counter(map(str.__add__, text, text[1:]))
+        if spaces:
+            for pair in [pair for pair in pairs if pair[0] in spaces or pair[1] in spaces]:
+                del pairs[pair]
+        grams.update(pairs)
+        return grams
+
+    def update(self, filename, content):
+        """1ファイルの索引を作り直す。変わった文字の並びの分だけを付け替える。"""
+        name = self.normalize(filename)
+        text = self.normalize(content)
+        # 回数は中身の分だけを数える(ファイル名だけに含まれる並びは回数 0 で見出しに加える)
+        new_grams = self.split_grams(text)
+        for gram in self.split_grams(name):
+            new_grams.setdefault(gram, 0)
+        with self.lock:
+            if self.contents.get(filename) == content and self.names.get(filename) == name:
+                return
+            old_grams = self.grams.get(filename, {})
+            # なくなった並びからこのファイルを外す(keys() 同士の - は集合の差)
+            for gram in old_grams.keys() - new_grams.keys():
+                names = self.postings[gram]
+                del names[filename]
+                if not names:
+                    del self.postings[gram]
+            # 新しく現れた並び・回数が変わった並びを書き換える
+            for gram, count in new_grams.items():
+                if old_grams.get(gram) != count:
+                    self.postings.setdefault(gram, {})[filename] = count
+            self.total_length += len(text) - len(self.texts.get(filename, ""))
+            self.grams[filename] = new_grams
+            self.texts[filename] = text
+            self.contents[filename] = content
+            self.names[filename] = name
+
+    def remove(self, filename):
+        """削除されたファイルを索引から取り除く。"""
+        with self.lock:
+            for gram in self.grams.pop(filename, ()):
+                names = self.postings[gram]
+                del names[filename]
+                if not names:
+                    del self.postings[gram]
+            self.total_length -= len(self.texts.pop(filename, ""))
+            self.contents.pop(filename, None)
+            self.names.pop(filename, None)
+
+    def _candidates(self, term):
+        """
+        語 term を含むファイルを {ファイル名: 中身に出てくるおよその回数} で返す(鍵をかけた状態で呼ぶ)。
+        3文字以上の語の回数は、その語の中の2文字の並びの回数のうち最も少ないもので見積もる。
+        """
+        # 1文字の語はその文字、2文字以上の語は隣り合う2文字の並びを見出しにする
+        if len(term) == 1:
+            keys = {term}
+        else:
+            keys = {term[i:i + 2] for i in range(len(term) - 1)}
+        postings = [self.postings.get(key) for key in keys]
+        if any(names is None for names in postings):
+            return {}
+        # 小さいものから順に共通部分をとると速い
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # 3文字以上の語は、2文字の並びが全部あっても順番が違う場合があるので確かめる
+        if len(term) > 2:
+            candidates = {
+                f for f in candidates if term in self.texts[f] or term in self.names[f]
+            }
+        return {f: min(names[f] for names in postings) for f in candidates}
+
+    def search(self, query, limit=100):
+        """
+        検索語をすべて含むファイルを、点数の高い順に (ファイル名, 点数, 一致箇所の抜き出し) で返す。
+        空白で区切った複数の語は、すべてを含むファイルだけを返す(AND 検索)。
+        """
+        terms = self.normalize(query).split()
+        if not terms:
+            return []
+        with self.lock:
+            result = None
+            found = {}  # {語: {その語を含むファイル名: 出てくる回数}}
+            for term in terms:
+                found[term] = self._candidates(term)
+                result = set(found[term]) if result is None else result & found[term].keys()
+                if not result:
+                    return []
+
+            total = len(self.texts) or 1
+            average_length = (self.total_length / total) or 1
+            # 珍しい語(含むファイルが少ない語)ほど大きくなる重み
+            idfs = {
+                term: math.log(1 + (total - len(found[term]) + 0.5) / (len(found[term]) + 0.5))
+                for term in terms
+            }
+            scored = []
+            for filename in result:
+                length_factor = 1 - self.B + self.B * len(self.texts[filename]) / average_length
+                score = 0.0
+                for term in terms:
+                    tf = found[term][filename]
+                    score += idfs[term] * tf * (self.K1 + 1) / (tf + self.K1 * length_factor)
+                    if term in self.names[filename]:
+                        score += idfs[term] * self.NAME_BONUS
+                scored.append((-score, filename))
+            # 点数の高い順に limit 件だけ取り出す(点数を負にしたので「小さい順」。同じ点数ならファイル名順)
+            top = heapq.nsmallest(limit, scored)
+            return [
+                (filename, -negative, self.snippet(self.contents[filename], terms))
+                for negative, filename in top
+            ]
+
+    @classmethod
+    def normalize_with_offsets(cls, content):
+        """
+        content を normalize() と同じようにそろえた文字列と、そろえた後の各文字が
+        元の content の何文字目から来たかのリストを返す。
+        (正規化で文字数が変わることがあるので、見つけた位置を元の文章の位置に戻すのに使う)
+        """
+        parts = []
+        offsets = []
+        i = 0
+        while i < len(content):
+            # 濁点などの結合文字(半角カナの ﾞ ﾟ も)は、前の文字と一緒にそろえる(ｶﾞ → ガ)
+            j = i + 1
+            while j < len(content) and (unicodedata.combining(content[j]) or content[j] in "\uff9e\uff9f"):
+                j += 1
+            part = cls.normalize(content[i:j])
+            parts.append(part)
+            offsets.extend([i] * len(part))
+            i = j
+        return "".join(parts), offsets
+
+    @classmethod
+    def snippet(cls, content, terms, before=15, after=35):
+        """
+        元の中身 content から、最初に見つかった検索語の前後を1行に抜き出す(一覧の2行目に表示する)。
+        探すのは正規化した文字列の上だが、抜き出すのはファイルに書いてあるままの文章。
+        """
+        text, offsets = cls.normalize_with_offsets(content)
+        positions = [text.find(term) for term in terms]
+        positions = [pos for pos in positions if pos >= 0]
+        if not positions:
+            # ファイル名だけに一致したときは、先頭を見せる
+            return content[:before + after].replace("\n", " ")
+        pos = offsets[min(positions)]  # 元の文章での位置
+        start = max(0, pos - before)
+        part = content[start:pos + after].replace("\n", " ")
+        # 途中を切り出したときは「…」を付けて、続きがあることを示す
+        if start > 0:
+            part = "…" + part
+        if pos + after < len(content):
+            part += "…"
+        return part
+
+
+# ===== 7. 差し込み項目(プレースホルダー) ========================================
+
+def builtin_values():
+    """何も入力しなくても使える差し込み項目の値(今日の日付・今の時刻)を返す。"""
+    now = datetime.datetime.now()
+    return {
+        "today": f"{now.year}年{now.month}月{now.day}日",
+        "now": now.strftime("%H:%M"),
+    }
+
+
+class CompiledTemplate:
+    """
+    {{顧客名}} のような差し込み項目を含む文章を、1回だけ解析しておくクラス。
+    文章を「ふつうの文字の部分」と「差し込み項目」に分けて覚えておき、
+    render() では値を当てはめてつなぐだけなので、同じ文章を何度埋めても正規表現で探し直さない。
+    """
+
+    # {{ と }} で囲まれた部分(前後の空白は無視)。{{ 顧客名 }} も {{顧客名}} と同じに扱う
+    PATTERN = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+
+    def __init__(self, source):
+        self.source = source
+        # re.split() は、( ) で囲んだ部分も結果に残すので
+        # [文字, 項目名, 文字, 項目名, ..., 文字] のように交互に並ぶ
+        pieces = self.PATTERN.split(source)
+        self.literals = pieces[0::2]  # ふつうの文字の部分(項目の数より1つ多い)
+        self.slots = pieces[1::2]     # 差し込み項目の名前(出てくる順。同じ名前が何度出てもよい)
+        self.names = list(dict.fromkeys(self.slots))  # 重なりを除いた項目名(入力欄の並び順)
+
+    def render(self, values):
+        """項目名 → 値 の辞書 values で差し込み項目を埋めた文章を返す。値が無い項目は {{項目名}} のまま残す。"""
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            value = values.get(slot)
+            parts.append("{{" + slot + "}}" if value is None else value)
+            parts.append(literal)
+        return "".join(parts)
+
+
+class TemplateCompiler:
+    """
+    CompiledTemplate を、テンプレートの位置とファイルの版(サイズ・更新時刻)ごとにキャッシュするクラス。
+    ファイルが保存し直されると版が変わるので、古い解析結果は使われない。
+    テキスト欄で編集中(保存前)の内容は、キャッシュと違うので、その都度解析する。
+    """
+
+    def __init__(self, max_entries):
+        """max_entries : キャッシュしておくテンプレートの数の上限(最も長く使われていないものから捨てる)"""
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # {テンプレートの位置: (版, CompiledTemplate)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, key, version, source):
+        """source を解析した CompiledTemplate を返す。key と version が同じで内容も同じなら、前回の結果を使う。"""
+        with self.lock:
+            entry = self.entries.get(key) if key is not None else None
+            # 文字列の比較は、長さが違えばすぐ終わり、同じでも解析よりずっと速い
+            if entry is not None and entry[0] == version and entry[1].source == source:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        compiled = CompiledTemplate(source)
+        if key is not None:
+            with self.lock:
+                self.entries[key] = (version, compiled)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return compiled
+
+
+# ===== 8. コマンドライン ========================================================
+
+def parse_values(pairs):
+    """["顧客名=山田", "件番=A1"] のような指定を {"顧客名": "山田", "件番": "A1"} にする。"""
+    values = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise ValueError(f"--set は「項目名=値」の形で指定してください: {pair}")
+        values[name.strip()] = value
+    return values
+
+
+def resolve_template(store, name):
+    """
+    コマンドラインで指定された名前を、template-files の中のファイルのパスにする。
+    Windows の "\\" 区切りも使え、".txt" は省略できる。
+    """
+    name = name.replace("\\", "/").strip("/")
+    filepath = store.template_dir / name
+    if not filepath.exists() and not name.endswith(".txt"):
+        filepath = store.template_dir / (name + ".txt")
+    return filepath
+
+
+def render_template(store, args):
+    """テンプレートを読み、--set の値と {{today}} などで差し込み項目を埋めた文章を返す。"""
+    filepath = resolve_template(store, args.name)
+    content, version = store.read_file(filepath)
+    compiled = store.compiler.compile(store.rel_path(filepath), version[:2], content)
+    return compiled.render({**builtin_values(), **parse_values(args.set)})
+
+
+def main(argv=None):
+    """
+    コマンドラインの入口。argv を省略すると、実行したときの引数(sys.argv)を使う。
+    成功したら 0、失敗したら 1 を返す(終了コードとしてシェルに返す)。
+    """
+    parser = argparse.ArgumentParser(
+        prog="teikei_core.py", description="定型文管理アプリのテンプレートを、画面を開かずに扱う"
+    )
+    parser.add_argument(
+        "--dir", type=Path, default=DEFAULT_TEMPLATE_DIR,
+        help="テンプレートのフォルダ(省略時はこのファイルと同じ場所の template-files)",
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path,
+        help="目録を保存するフォルダ(省略時は利用者ごとのキャッシュフォルダ。例: ~/.cache/teikei)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("list", help="フォルダの中のフォルダとテンプレートを表示する")
+    command.add_argument("folder", nargs="?", default="", help="表示するフォルダ(template-files から見た位置)")
+    command.add_argument("-r", "--recursive", action="store_true", help="入れ子のフォルダの中まですべて表示する")
+
+    command = commands.add_parser("show", help="テンプレートの内容を表示する")
+    command.add_argument("name", help="テンプレート(例: 営業/お礼.txt)")
+
+    command = commands.add_parser("search", help="テンプレートの中身を全文検索する")
+    command.add_argument("query", nargs="+", help="検索する語(複数あればすべてを含むものを探す)")
+    command.add_argument("-n", "--limit", type=int, default=20, help="表示する件数の上限")
+
+    for name, text in (("render", "差し込み項目を埋めた文章を表示する"),
+                       ("copy", "差し込み項目を埋めた文章をクリップボードへコピーする")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument("name", help="テンプレート(例: 営業/お礼.txt)")
+        command.add_argument(
+            "--set", action="append", default=[], metavar="項目名=値", help="差し込む値(何回でも指定できる)"
+        )
+        if name == "render":
+            command.add_argument("--csv", type=Path, help="1行目を項目名にした CSV。行ごとに文章を作る")
+            command.add_argument("--out", type=Path, help="--csv で作った文章を書き出すフォルダ")
+
+    args = parser.parse_args(argv)
+    store = TemplateStore(args.dir, args.cache_dir)
+    try:
+        if args.command == "list":
+            if args.recursive:
+                prefix = args.folder.strip("/")
+                for filename in sorted(store.walk_templates()):
+                    if not prefix or filename.startswith(prefix + "/"):
+                        print(filename)
+            else:
+                dirs, names = store.list_folder(args.folder.strip("/"))
+                for name in dirs:
+                    print(name + "/")  # フォルダは末尾に "/" を付けて区別する
+                for name in names:
+                    print(name)
+        elif args.command == "show":
+            content, _ = store.read_file(resolve_template(store, args.name))
+            sys.stdout.write(content if content.endswith("\n") or not content else content + "\n")
+        elif args.command == "search":
+            for filename, score, snippet in store.scan_search(" ".join(args.query), args.limit):
+                print(f"{filename}\t{snippet}")
+        elif args.command == "render" and args.csv is not None:
+            if args.out is None:
+                parser.error("--csv を使うときは --out で書き出すフォルダを指定してください")
+            filepath = resolve_template(store, args.name)
+            content, version = store.read_file(filepath)
+            compiled = store.compiler.compile(store.rel_path(filepath), version[:2], content)
+            count, missing = store.render_csv(compiled, args.csv, args.out, filepath.stem)
+            print(f"{count} 件の文章を {args.out} に作成しました", file=sys.stderr)
+            if missing:
+                print(f"CSV に列が無い項目: {', '.join(missing)}", file=sys.stderr)
+        elif args.command == "render":
+            sys.stdout.write(render_template(store, args))
+        elif args.command == "copy":
+            # クリップボードを使うときだけ読み込む(ほかのコマンドは pyperclip が無くても動く)
+            try:
+                import pyperclip
+            except ImportError:
+                print("copy には pyperclip が必要です: pip install pyperclip", file=sys.stderr)
+                return 1
+            pyperclip.copy(render_template(store, args))
+    except (OSError, ValueError) as ex:
+        print(f"エラー: {ex}", file=sys.stderr)
+        return 1
+    finally:
+        # 読み込みで判定した文字コードなど、まだ書き出していない目録を終了前に書き出す
+        store.save_indexes()
+    return 0
+
+
+# このファイルを直接実行したときだけコマンドラインとして動く(import したときは何もしない)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,7 @@
 # クリップボードへコピーできるデスクトップアプリ。
 #
 # 画面は左右2ペイン構成:
-#   左側: テンプレート一覧 + [新規作成][更新] ボタン
+#   左側: テンプレート一覧(分類フォルダ + ファイル) + [新規作成][更新] ボタン
 #   右側: 内容の編集エリア + [保存][コピー][削除] ボタン
 #
 # コードを読む順番:
@@ -14,52 +14,120 @@
 #   3) setup_ui()              … 左右2ペインの画面を組み立てる
 #   4) load/select/save 系      … ファイルを読み書きする処理を追う
 #   5) create/delete/copy 系    … ボタン操作ごとのイベント処理を追う
+#   6) AsyncTemplateManager     … ファイルの読み書きを別スレッドで待つ「非同期モード」
+#   7) teikei_core.py           … ファイルの読み書き・目録・検索・差し込み項目など、画面を使わない部分
+#                                  (TemplateManager は teikei_core.TemplateStore を受け継いでいる)
 #
 # 実行方法:
 #   1) 必要ライブラリをインストール: pip install flet pyperclip
 #   2) このファイルを実行:           python teikei_kanri.py
+#      (共有フォルダが遅いとき:       python teikei_kanri.py --async)
 # =============================================================================
 
 
 # ===== 1. ライブラリ(外部の便利機能)を読み込む =================================
 
+import time                 # 起動にかかった時間を測る・進み具合の表示を間引くための標準機能
+STARTED_AT = time.perf_counter()  # 起動時間を測る基準(ほかのライブラリを読み込む前の時刻)
+
 import flet as ft           # GUI(画面)を作るためのライブラリ。以降 "ft" と短縮して呼ぶ
 from pathlib import Path    # ファイル/フォルダのパスをオブジェクトとして扱う Python 標準機能
-import pyperclip            # クリップボード(コピー&ペーストの保管場所)を操作するライブラリ
+# クリップボードを操作する pyperclip は、起動を速くするため最初にコピーするときに読み込む(copy_text)
+import bisect               # 名前順のリストのどこに入れればよいかを高速に探す標準機能
+import threading            # フォルダの見張りや索引作りを画面とは別の流れ(スレッド)で動かす標準機能
+import asyncio              # 非同期モードで、ファイルの読み書きを待つ間も画面を動かし続けるための標準機能
+import argparse             # コマンドライン引数(python teikei_kanri.py --async など)を解釈する標準機能
+import atexit               # 終了するときに、まだ書き出していない目録やトレースを書き出す標準機能
+import os                   # 環境変数(TEIKEI_STARTUP_TIMING)を読むための標準機能
+import sys                  # 起動時間の記録を標準エラー出力へ書くための標準機能
+import json                 # 起動時間の記録を1行ずつファイルへ書き足すための標準機能
+
+# 画面を使わない部分(ファイルの読み書き・目録・見張り・検索・差し込み項目)は teikei_core.py にまとめてある
+from teikei_core import (
+    TemplateStore, FolderWatcher, SaveConflictError, join_path, builtin_values,
+    DEFAULT_TEMPLATE_DIR, default_cache_dir,
+)
+
+IMPORTED_AT = time.perf_counter()  # ライブラリの読み込みが終わった時刻(起動時間の記録に使う)
 
 
 # ===== 2. アプリ本体のクラス(設計図)===========================================
 
-class TemplateManager:
+class TemplateManager(TemplateStore):
     """
     テンプレート管理アプリの本体クラス。
-    「画面を組み立てる」「ファイルを読み書きする」「ボタン操作に応じて動く」など、
-    アプリのすべての機能をこのクラスにまとめている。
+    「画面を組み立てる」「ボタン操作に応じて動く」など、画面に関わる機能をこのクラスにまとめている。
+    ファイルの読み書き(read_file / write_file など)は、受け継いだ TemplateStore(teikei_core.py)のものを使う。
     """
 
+    PAGE_SIZE = 100  # 一覧の行を一度に作る件数(スクロールで下端に近づくたびに、この件数ずつ増やす)
+
     # ----- 2-1. 初期化メソッド(インスタンス生成時に1回だけ自動で呼ばれる)-----
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, timer=None, template_dir=None, cache_dir=None):
         # 引数 page は Flet が用意してくれる「画面そのもの」を表すオブジェクト
         self.page = page  # 後から使えるよう自分自身(self)に保存
+        # 起動にかかった時間の記録係(main() から渡される。渡されなければ記録だけして何も出さない)
+        self.timer = timer if timer is not None else StartupTimer(time.perf_counter())
 
-        # このスクリプトと同じ場所に "template-files" フォルダを作る
+        # template_dir を指定しなければ(ふだんの起動)、このスクリプトと同じ場所に "template-files" フォルダを作る
+        # (指定するのは、ベンチマークなどで別のフォルダを使うとき)
         #   __file__         … このファイル自身のパス
         #   .resolve()       … 絶対パスに変換(例: C:/.../teikei_kanri.py)
         #   .parent          … その親フォルダ(=スクリプトが置いてあるフォルダ)
         #   / "template-files" … その下に "template-files" を連結(/ はパス連結演算子)
-        self.template_dir = Path(__file__).resolve().parent / "template-files"
+        if template_dir is None:
+            template_dir = Path(__file__).resolve().parent / "template-files"
         # フォルダを実際に作る。すでに存在していてもエラーを出さない設定
-        self.template_dir.mkdir(exist_ok=True)
+        template_dir.mkdir(exist_ok=True)
+        # 目録・キャッシュ・検索の索引などを準備する(TemplateStore の __init__ を呼ぶ)。
+        # 目録は cache_dir(省略時は利用者ごとのキャッシュフォルダ。例: ~/.cache/teikei)に保存し、次回起動時に使い回す
+        super().__init__(template_dir, cache_dir)
 
         # 今編集中のファイルパスを覚えておく変数。最初は何も選んでいないので None(空)
         self.current_file = None
+        # 開いたときのファイルの版 (サイズ, 更新時刻, 内容のハッシュ値)。
+        # 保存する前にディスクの版と比べ、他の人が先に保存していたら上書きせずに知らせる
+        self.current_version = None
+
+        # template-files の中は、分類ごとのフォルダ(入れ子も可)に分けられる。
+        # 一覧に出すのは「今開いているフォルダ」の中身だけなので、全体のファイル数が増えても
+        # 一覧を出す手間は開いたフォルダの大きさだけで決まる。
+        # self.folder は template-files から見た今のフォルダ("" は template-files そのもの。例: "営業/挨拶")。
+        # ファイルは「template-files から見た位置」(例: "営業/挨拶/お礼.txt")で区別する
+        self.folder = ""
+        self.index = self.index_for(self.folder)  # 今開いているフォルダの目録(目録はフォルダごとにある)
+        # 一覧に表示中の行 {ファイル名: ListTile}。変わったファイルの行だけを差し替えるために使う。
+        # 行は名前順の先頭から page_limit 件ぶんだけ作り、下までスクロールされたら次の分を足す
+        self.tiles = {}
+        self.page_limit = self.PAGE_SIZE
+        # 一覧の先頭に並べる、中のフォルダの行と、その名前
+        self.folder_tiles = []
+        self.folder_names = []
+        self.watcher = None  # 今開いているフォルダの見張り
 
         # ----- UI 部品(画面パーツ)を準備 -----
 
         # テンプレート一覧を表示するスクロール可能なリスト
         #   expand=1  … 縦方向に最大限広がる
         #   spacing=10 … 各行の間隔(ピクセル)
-        self.template_list = ft.ListView(expand=1, spacing=10)
+        #   on_scroll  … スクロールされたときに呼ぶメソッド(on_scroll_interval ミリ秒に1回まで)
+        self.template_list = ft.ListView(
+            expand=1, spacing=10, on_scroll=self.on_list_scroll, on_scroll_interval=100
+        )
+
+        # 今開いているフォルダの位置(パンくずリスト)。名前をクリックするとそのフォルダへ戻る
+        self.breadcrumb = ft.Row(spacing=0, wrap=True)
+
+        # 全文検索の入力欄。文字を入力するたびに on_search_change() が呼ばれる
+        self.search_field = ft.TextField(
+            hint_text="全文検索(空白区切りで AND)",
+            prefix_icon=ft.Icons.SEARCH,
+            dense=True,
+            on_change=self.on_search_change,
+        )
+        # 検索結果のリスト(検索中だけ、一覧の代わりに表示する)と件数などの表示
+        self.search_results = ft.ListView(expand=1, spacing=5, visible=False)
+        self.search_status = ft.Text("", size=12, color=ft.Colors.GREY_600)
 
         # テンプレート内容を編集するテキスト入力欄(複数行対応)
         self.text_field = ft.TextField(
@@ -69,16 +137,43 @@ class TemplateManager:
             expand=True,                             # 横幅を画面いっぱいに広げる
             hint_text="テンプレートを選択してください"  # 未入力時に薄く表示される案内
         )
+        # 読み込み・保存の途中であることを示す横長の進み具合バー(ふだんは隠しておく)
+        self.progress = ft.ProgressBar(visible=False)
+
+        # まとめて書き出す・取り込む処理(別スレッド)の進み具合バーと件数の表示
+        self.job_progress = ft.ProgressBar(value=0, visible=False)
+        self.job_status = ft.Text("", size=12, color=ft.Colors.GREY_600, visible=False)
+        self.job_running = False  # 書き出し・取り込みは同時に1つだけにする
+        # zip ファイルを選ぶ・保存先を選ぶための画面(OS のファイル選択ダイアログ)
+        self.import_picker = ft.FilePicker(on_result=self.on_import_picked)
+        self.export_picker = ft.FilePicker(on_result=self.on_export_picked)
+
+        self.last_values = {}  # 差し込みダイアログで最後に入力した値(次に開いたときの初期値にする)
+        # CSV 一括作成で、CSV ファイルと書き出し先のフォルダを選ぶ画面
+        self.csv_picker = ft.FilePicker(on_result=self.on_csv_picked)
+        self.batch_dir_picker = ft.FilePicker(on_result=self.on_batch_dir_picked)
+        self.batch_source = None  # CSV 一括作成で使う (テンプレートの位置, 解析結果, CSV のパス)
 
         # 画面組み立てとデータ読み込みを実行
         self.setup_ui()        # 画面パーツを page に配置
-        self.load_templates()  # template-files フォルダの中身を一覧に表示
+        self.timer.mark("shell")
+        # 前回の目録(前回起動時の一覧)をすぐに表示し、フォルダの見張りを開始する。
+        # フォルダの読み直しは、画面が出た後に別スレッドで行い、差分だけを一覧に反映する
+        self.open_folder(self.folder, scan=False)
+        self.timer.mark("first_paint")
+        threading.Thread(target=self.initial_scan, daemon=True).start()
+        # 全文検索の索引を別スレッドで作る(画面はすぐに使える)。すべてのフォルダのファイルが対象
+        self.index_in_background(None, initial=True)
 
     # ----- 2-2. 画面の組み立て -----
     def setup_ui(self):
         """画面(UI)を構築するメソッド。左右2パネル構成のレイアウトを page に追加する。"""
         self.page.title = "テンプレート管理"  # ウィンドウのタイトルバーに表示する文字
         self.page.padding = 20                # 画面全体の余白(ピクセル)
+        # ファイル選択ダイアログは画面に見えない部品なので、オーバーレイ層に置いておく
+        self.page.overlay.extend([
+            self.import_picker, self.export_picker, self.csv_picker, self.batch_dir_picker,
+        ])
 
         # ===== 左側パネル: テンプレート一覧 =====
         left_panel = ft.Container(
@@ -87,8 +182,16 @@ class TemplateManager:
                 # 見出しテキスト
                 ft.Text("テンプレート一覧", size=20, weight=ft.FontWeight.BOLD),
 
-                # 上で作った一覧 ListView をここに配置
+                # 今開いているフォルダの位置
+                self.breadcrumb,
+
+                # 全文検索の入力欄と、件数などの表示
+                self.search_field,
+                self.search_status,
+
+                # 上で作った一覧 ListView をここに配置(検索中は検索結果のリストに切り替わる)
                 self.template_list,
+                self.search_results,
 
                 # ボタンを横一列に並べる
                 ft.Row([                       # Row = 中身を横方向に並べる
@@ -104,7 +207,27 @@ class TemplateManager:
                         # ボタンクリック時に load_templates() を呼んで一覧を再読み込み
                         on_click=lambda _: self.load_templates()
                     ),
-                ]),
+                    ft.ElevatedButton(
+                        "取り込み",
+                        icon=ft.Icons.UPLOAD_FILE,
+                        on_click=lambda _: self.import_picker.pick_files(
+                            dialog_title="取り込む zip ファイル", allowed_extensions=["zip"]
+                        ),
+                    ),
+                    ft.ElevatedButton(
+                        "書き出し",
+                        icon=ft.Icons.DOWNLOAD,
+                        on_click=lambda _: self.export_picker.save_file(
+                            dialog_title="書き出す zip ファイル",
+                            file_name="templates.zip",
+                            allowed_extensions=["zip"],
+                        ),
+                    ),
+                ], wrap=True),  # wrap=True … 横に入りきらないボタンは次の行へ折り返す
+
+                # まとめて書き出す・取り込むときの進み具合
+                self.job_progress,
+                self.job_status,
             ]),
             width=300,    # 左パネルの幅は 300 ピクセル固定
             padding=10,   # 内側の余白
@@ -114,6 +237,7 @@ class TemplateManager:
         right_panel = ft.Container(
             content=ft.Column([
                 ft.Text("テンプレート内容", size=20, weight=ft.FontWeight.BOLD),
+                self.progress,
                 self.text_field,  # 上で作ったテキスト入力欄をここに配置
                 ft.Row([
                     ft.ElevatedButton(
@@ -126,13 +250,18 @@ class TemplateManager:
                         icon=ft.Icons.COPY,
                         on_click=self.copy_content
                     ),
+                    ft.ElevatedButton(
+                        "CSV一括",
+                        icon=ft.Icons.TABLE_ROWS,
+                        on_click=self.start_batch
+                    ),
                     ft.ElevatedButton(
                         "削除",
                         icon=ft.Icons.DELETE,
                         on_click=self.delete_template,
                         bgcolor=ft.Colors.RED_400  # 削除は危険操作なので赤色で目立たせる
                     ),
-                ]),
+                ], wrap=True),
             ]),
             expand=True,  # 右パネルは残り全幅まで広がる
             padding=10,
@@ -146,74 +275,320 @@ class TemplateManager:
 
     # ----- 2-3. テンプレート一覧の読み込み -----
     def load_templates(self):
-        """template-files フォルダ内のファイル名を取得して、左側のリストに並べる。"""
-        # 既存の表示内容をいったん全消去(再描画前のリセット)
-        self.template_list.controls.clear()
-
-        # フォルダ内をスキャンしてファイル名のみを取り出し、ソートする
-        #   self.template_dir.iterdir() … フォルダ内の全エントリを1つずつ列挙
-        #   if f.is_file()              … ファイルだけを残す(サブフォルダは除外)
-        #   f.name                      … ファイル名(パスではなく名前のみ)
-        #   sorted(...)                 … 名前順に並べ替え
-        files = sorted([f.name for f in self.template_dir.iterdir() if f.is_file()])
-
-        # 取り出したファイル名ごとに、クリック可能な行(ListTile)を一覧に追加
-        for filename in files:
-            self.template_list.controls.append(
-                ft.ListTile(
-                    title=ft.Text(filename),  # 行に表示する文字
-                    # ★初学者がハマる罠の回避★
-                    # ループ内で lambda を作る場合、 "f=filename" のようにデフォルト引数で
-                    # 値を固定しないと、すべての行が「最後の filename」を参照してしまう。
-                    # ここでは filename を f に束縛(キャプチャ)している。
-                    on_click=lambda e, f=filename: self.select_template(f),
-                    hover_color=ft.Colors.BLUE_50,  # マウスを乗せたときの背景色
-                )
-            )
+        """
+        template-files フォルダの目録を最新にして、左側のリストに反映する。
+        リストは作り直さず、追加・削除されたファイルの行だけを差し込む/取り除く。
+        行を作るのは画面に出る先頭の page_limit 件だけ(何千件あっても最初の表示が速い)。
+        """
+        try:
+            self.show_scan(*self.scan_folder())
+        except OSError as ex:
+            # 開いていたフォルダが他の場所で削除された、などで読めないとき
+            self.show_snackbar(f"一覧の読み込みエラー: {ex}", ft.Colors.RED)
+
+    def scan_folder(self):
+        """
+        今開いているフォルダを読んで目録を最新にし、
+        (フォルダ, 追加されたファイル名, 削除されたファイル名) を返す。
+        ディスクを読む部分だけをまとめてあるので、非同期モードでは別スレッドで呼ぶ。
+        """
+        with self.lock:
+            folder, index = self.folder, self.index
+        # 目録を最新にする。フォルダが前回から変わっていなければ、フォルダを読み直さない
+        added, removed = index.refresh()
+        with self.lock:
+            # 目録に変化があればファイルに書き残す(次回起動時に使う)
+            index.save()
+        return folder, added, removed
+
+    def show_scan(self, folder, added, removed):
+        """scan_folder() の結果を左側のリストに反映する。"""
+        for filename in removed:
+            self.search_index.remove(join_path(folder, filename))
+        # 増えたファイルは、全文検索の索引にも加える(読み込みは別スレッドで行う)
+        if added:
+            self.index_in_background([join_path(folder, filename) for filename in added])
+        with self.lock:
+            if folder != self.folder:
+                return  # 読んでいる間に別のフォルダが開かれた(目録は更新済みなので、一覧はそのまま)
+            # 中のフォルダが増減していれば、先頭のフォルダの行を作り直す
+            self.render_folders()
+            # 消えたファイルの行を取り除く
+            for filename in removed:
+                self.remove_tile(filename)
+
+            # 追加されたファイルのうち、表示済みの範囲に入るものの行を差し込む
+            for filename in added:
+                self.insert_tile(filename)
+            # 表示する件数に足りなければ、続きの行を作る(初回表示もここで作られる)
+            self.render_more()
+
+        # 画面更新(これを呼ばないと変更が反映されない)。Flet は変わった部品だけを送る
+        self.page.update()
+
+    def remove_tile(self, filename):
+        """一覧からそのファイルの行だけを取り除く。"""
+        tile = self.tiles.pop(filename, None)
+        if tile is not None:
+            self.template_list.controls.remove(tile)
+
+    def insert_tile(self, filename):
+        """
+        新しいファイルの行を、名前順の正しい位置に差し込む。
+        まだ行を作っていない範囲(表示済みの最後の行より後ろ)なら、スクロールしたときに作るので何もしない。
+        """
+        controls = self.template_list.controls
+        if filename in self.tiles or not self.tiles or filename > controls[-1].data:
+            return
+        tile = self.make_tile(filename)
+        self.tiles[filename] = tile
+        # 表示済みの行は目録の names の先頭と同じ順番なので、names での位置がそのままリストの位置になる
+        # (先頭にはフォルダの行が並んでいるので、その数だけずらす)
+        controls.insert(len(self.folder_tiles) + bisect.bisect_left(self.index.names, filename), tile)
+
+    def render_more(self):
+        """目録の先頭から page_limit 件まで行がそろうように、続きの行をリストの末尾に足す。"""
+        names = self.index.names
+        start = len(self.tiles)
+        for filename in names[start:max(self.page_limit, start)]:
+            tile = self.make_tile(filename)
+            self.tiles[filename] = tile
+            self.template_list.controls.append(tile)
+
+    def render_folders(self):
+        """目録の中のフォルダと表示中のフォルダの行が違っていれば、リストの先頭のフォルダの行を作り直す。"""
+        if self.folder_names == self.index.dirs:
+            return
+        tiles = [self.make_folder_tile(name) for name in self.index.dirs]
+        self.template_list.controls[:len(self.folder_tiles)] = tiles
+        self.folder_tiles = tiles
+        self.folder_names = list(self.index.dirs)
+
+    # ----- 2-3-1. フォルダの移動 -----
+    def initial_scan(self):
+        """
+        起動直後、前回の目録で一覧を表示した後に、フォルダを読み直して差分を反映する。
+        画面の表示を待たせないよう、別スレッドで呼ぶ。
+        """
+        self.load_templates()
+        self.timer.mark("scan")
+        self.timer.finish()
+
+    def open_folder(self, folder, scan=True):
+        """
+        folder(template-files から見た位置)を開き、その中身を一覧に表示する。
+        前回の目録があればすぐに表示し、フォルダを読み直した差分はその後で反映する。
+        scan=False なら読み直しは行わない(起動時は initial_scan() が後で行う)。
+        """
+        with self.lock:
+            self.folder = folder
+            self.index = self.index_for(folder)
+            self.tiles = {}
+            self.folder_tiles = []
+            self.folder_names = []
+            self.template_list.controls.clear()
+            self.page_limit = self.PAGE_SIZE
+        self.render_breadcrumb()
+        self.show_scan(folder, [], [])  # 目録にある分をすぐに表示
+        # 見張るのも今開いているフォルダだけにする(一覧を表示してから始める)
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.watcher = FolderWatcher(
+            self.folder_path(folder),
+            lambda events, f=folder: self.on_folder_events(f, events),
+        )
+        self.watcher.start()
+        if scan:
+            self.load_templates()       # フォルダを読み直して差分を反映
+
+    def render_breadcrumb(self):
+        """パンくずリスト(template-files > 営業 > 挨拶 のような今の位置)を作り直す。"""
+        crumbs = [ft.TextButton("template-files", on_click=lambda e: self.open_folder(""))]
+        prefix = ""
+        for part in self.folder.split("/") if self.folder else []:
+            prefix = join_path(prefix, part)
+            crumbs.append(ft.Text(">"))
+            crumbs.append(ft.TextButton(part, on_click=lambda e, f=prefix: self.open_folder(f)))
+        self.breadcrumb.controls = crumbs
+
+    def on_list_scroll(self, e):
+        """一覧がスクロールされたときに呼ばれ、下端が近づいたら次の PAGE_SIZE 件の行を足す。"""
+        # e.pixels は今のスクロール位置、e.max_scroll_extent はスクロールできる一番下の位置
+        if e.pixels < e.max_scroll_extent - 200 or len(self.tiles) >= len(self.index.names):
+            return
+        with self.lock:
+            self.page_limit = len(self.tiles) + self.PAGE_SIZE
+            self.render_more()
+        # 一覧の部品だけを更新する(Flet は足した行の分だけを画面に送る)
+        self.template_list.update()
+
+    def on_folder_events(self, folder, events):
+        """
+        FolderWatcher から(見張り用のスレッドで)呼ばれ、変わったファイルの行だけを更新する。
+        folder は見張っていたフォルダ、events は (種類, 名前) のリスト。
+        種類は "added" / "removed" / "modified"、中のフォルダが増減したときは "folder"。
+        """
+        changed = []  # 中身を読み直して検索の索引を更新するファイル
+        with self.lock:
+            if folder != self.folder:
+                return  # 別のフォルダへ移ったあとに届いた、前のフォルダの知らせ
+            for kind, filename in events:
+                filepath = self.folder_path(folder) / filename
+                if kind == "folder":
+                    self.index.set_dir(filename, filepath.is_dir())
+                    continue
+                rel = join_path(folder, filename)
+                if rel in self.writing:
+                    # このアプリが今保存しているファイル。目録・キャッシュ・索引は write_file() が新しくする
+                    continue
+                try:
+                    stat = filepath.stat() if kind != "removed" else None
+                except FileNotFoundError:
+                    stat = None  # 知らせが届く前に消されていた
+                if stat is None:
+                    self.content_cache.invalidate(rel)
+                    self.index.remove(filename)
+                    self.remove_tile(filename)
+                    self.search_index.remove(rel)
+                    continue
+
+                # 目録のサイズ・更新時刻と同じなら、このアプリ自身が保存した分(目録は更新済み)
+                entry = self.index.entries.get(filename)
+                if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                    # 中身が変わったので、キャッシュした内容と判定済みの文字コードは使わずに目録を更新する
+                    self.content_cache.invalidate(rel)
+                    self.index.put(filename, stat)
+                    changed.append(rel)
+                    if kind == "modified" and self.current_file == filepath:
+                        self.show_snackbar(f"'{rel}' が他の場所で更新されました", ft.Colors.ORANGE)
+                self.insert_tile(filename)
+            self.render_folders()
+            # 削除で表示件数が減ったときは、続きの行で埋める
+            self.render_more()
+            self.index.save()
+        # 見張り用のスレッドの中なので、そのまま読み込んで検索の索引を更新してよい
+        self.index_files(changed)
+        self.page.update()
+
+    def index_files(self, filenames):
+        """ファイルを読み込んで全文検索の索引を更新し、検索中なら結果を出し直す(別スレッドから呼ぶ)。"""
+        super().index_files(filenames)
+        # 検索中なら、索引が変わったので結果を出し直す
+        if self.search_field.value:
+            self.show_search_results()
+
+    def index_in_background(self, filenames, initial=False):
+        """
+        index_files() を別スレッドで動かす。filenames が None なら、すべてのフォルダのファイルが対象。
+        initial=True なら「索引を作成中」を表示する。
+        """
+        def run():
+            # すべてのフォルダを調べるのにも時間がかかるので、これも別スレッドの中で行う
+            self.index_files(self.walk_templates() if filenames is None else filenames)
+            if initial:
+                self.search_index.built = True
+                self.show_search_results()
+
+        if initial:
+            self.search_status.value = "全文検索の索引を作成中…"
+            self.page.update()
+        threading.Thread(target=run, name="search-indexer", daemon=True).start()
+
+    # ----- 2-3-2. 全文検索 -----
+    def on_search_change(self, e):
+        """検索欄の文字が変わるたびに呼ばれ、検索結果を表示し直す。"""
+        self.show_search_results()
+
+    def show_search_results(self):
+        """検索欄の文字で索引を検索し、点数の高い順に結果(ファイル名と一致箇所)を表示する。"""
+        query = self.search_field.value or ""
+        if not query.strip():
+            # 検索していないときは、ふつうの一覧を表示する
+            self.search_results.visible = False
+            self.template_list.visible = True
+            self.search_results.controls.clear()
+            if self.search_index.built:
+                self.search_status.value = ""
+            self.page.update()
+            return
 
-        # 画面更新(これを呼ばないと変更が反映されない)
+        results = self.search_index.search(query, limit=100)
+        self.search_results.controls = [
+            ft.ListTile(
+                title=ft.Text(filename),
+                # 一致した箇所の前後を小さな文字で表示する
+                subtitle=ft.Text(snippet, size=12, max_lines=2),
+                on_click=lambda e, f=filename: self.select_template(f),
+                hover_color=ft.Colors.BLUE_50,
+            )
+            for filename, score, snippet in results
+        ]
+        self.search_results.visible = True
+        self.template_list.visible = False
+        status = f"{len(results)} 件"
+        if not self.search_index.built:
+            status += "(索引を作成中のため、一部のみ)"
+        self.search_status.value = status
         self.page.update()
 
+    def make_tile(self, filename):
+        """一覧の1行(クリック可能な ListTile)を作る。"""
+        return ft.ListTile(
+            title=ft.Text(filename),  # 行に表示する文字
+            data=filename,            # どのファイルの行かを覚えておく(行の差し込み位置を決めるのに使う)
+            # ★初学者がハマる罠の回避★
+            # ループ内で lambda を作る場合、 "f=filename" のようにデフォルト引数で
+            # 値を固定しないと、すべての行が「最後の filename」を参照してしまう。
+            # ここでは filename を(今のフォルダの位置を付けて) f に束縛(キャプチャ)している。
+            on_click=lambda e, f=join_path(self.folder, filename): self.select_template(f),
+            hover_color=ft.Colors.BLUE_50,  # マウスを乗せたときの背景色
+        )
+
+    def make_folder_tile(self, name):
+        """一覧の先頭に並べる、中のフォルダの行を作る。クリックするとそのフォルダを開く。"""
+        return ft.ListTile(
+            leading=ft.Icon(ft.Icons.FOLDER),
+            title=ft.Text(name),
+            on_click=lambda e, f=join_path(self.folder, name): self.open_folder(f),
+            hover_color=ft.Colors.BLUE_50,
+        )
+
     # ----- 2-4. 一覧から選択されたとき -----
     def select_template(self, filename):
-        """選択されたファイルを開き、内容を右側のテキスト欄に表示する。"""
+        """
+        選択されたファイルを開き、内容を右側のテキスト欄に表示する。
+        filename は template-files から見た位置("営業/お礼.txt" など)。
+        """
         # フォルダパス + ファイル名 で完全パスを作る
         filepath = self.template_dir / filename
         try:
             # ファイル内容を読み込む(エンコーディング自動判定は read_file が担当)
-            content = self.read_file(filepath)
+            content, version = self.read_file(filepath)
+        except (OSError, ValueError) as e:
+            self.show_read_error(filename, e)
+            return
+        self.show_content(filepath, content, version)
 
-            # テキスト欄に内容を表示
-            self.text_field.value = content
+    def show_content(self, filepath, content, version):
+        """読み込んだ内容を右側のテキスト欄に表示する。"""
+        # テキスト欄に内容を表示
+        self.text_field.value = content
 
-            # 「現在編集中のファイル」として記憶(保存・削除時に使う)
-            self.current_file = filepath
+        # 「現在編集中のファイル」とその版として記憶(保存・削除時に使う)
+        self.current_file = filepath
+        self.current_version = version
 
-            self.page.update()
-        except Exception as e:
-            # 読み込みに失敗したら赤色のスナックバーでエラー表示
-            self.show_snackbar(f"読み込みエラー: {e}", ft.Colors.RED)
+        self.page.update()
 
-    # ----- 2-5. ファイルの読み込み(文字コード自動判定)-----
-    def read_file(self, filepath):
-        """
-        日本語ファイルは作成環境によって文字コードが異なるため、
-        よく使われる3種類を順に試して読み込む。
-        """
-        # 試す順番:
-        #   utf-8     … 現代の標準的な文字コード
-        #   utf-8-sig … BOM付きUTF-8(Excel保存のCSVなどに多い)
-        #   cp932     … Windows特有のShift_JIS(古いメモ帳など)
-        encodings = ["utf-8", "utf-8-sig", "cp932"]
-        for enc in encodings:
-            try:
-                # 成功したら即その内容を返す
-                return filepath.read_text(encoding=enc)
-            except:
-                # 失敗したら次のエンコーディングを試す
-                continue
-        # 全部失敗した場合はエラーを発生させる(呼び出し元の except に飛ぶ)
-        raise ValueError("ファイルを読み込めませんでした")
+    def show_read_error(self, filename, error):
+        """読み込みに失敗した理由に合わせて、赤色のスナックバーでエラーを表示する。"""
+        if isinstance(error, FileNotFoundError):
+            # 一覧に出ていても、他の人がちょうど削除したなどで無いことがある
+            self.show_snackbar(f"'{filename}' が見つかりません", ft.Colors.RED)
+        elif isinstance(error, PermissionError):
+            self.show_snackbar(f"'{filename}' を読む権限がありません", ft.Colors.RED)
+        else:
+            self.show_snackbar(f"読み込みエラー: {error}", ft.Colors.RED)
 
     # ----- 2-6. 保存ボタンの処理 -----
     def save_template(self, e):
@@ -223,13 +598,59 @@ class TemplateManager:
             self.show_snackbar("保存するファイルを選択してください", ft.Colors.ORANGE)
             return
 
+        self.save_to(self.current_file, self.text_field.value, self.current_version)
+
+    def save_to(self, filepath, content, expected):
+        """
+        内容を filepath に保存する。expected は開いたときの版で、
+        ディスクの版と違っていれば(他の人が先に保存していれば)上書きせずに確認のダイアログを出す。
+        expected が None なら確認せずに上書きする。
+        """
         try:
-            # write_text() でファイルに書き込み。常に utf-8 で保存することで統一
-            self.current_file.write_text(self.text_field.value, encoding="utf-8")
-            self.show_snackbar("保存しました", ft.Colors.GREEN)
+            version = self.write_file(filepath, content, expected)
+        except SaveConflictError as ex:
+            self.show_conflict(filepath, content, ex)
+            return
         except Exception as ex:
             # 書き込み失敗(権限不足・ディスク満杯など)に備える
             self.show_snackbar(f"保存エラー: {ex}", ft.Colors.RED)
+            return
+        self.finish_save(filepath, version)
+
+    def finish_save(self, filepath, version):
+        """保存できたら、次の保存で比べる版を新しくする。"""
+        if self.current_file == filepath:
+            self.current_version = version
+        self.show_snackbar("保存しました", ft.Colors.GREEN)
+
+    def show_conflict(self, filepath, content, error):
+        """他の人の変更とぶつかったときに、どうするかを尋ねるダイアログを出す。"""
+        def close(e):
+            dialog.open = False
+            self.page.update()
+
+        def reload(e):
+            # 手元の変更は捨てて、他の人が保存した内容を開き直す
+            close(e)
+            self.select_template(self.rel_path(filepath))
+
+        def overwrite(e):
+            # 確認せずに上書き保存する(他の人の変更は失われる)
+            close(e)
+            self.save_to(filepath, content, None)
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("保存できませんでした"),
+            content=ft.Text(f"{error}\n上書きすると、他の場所で行われた変更は失われます。"),
+            actions=[
+                ft.TextButton("キャンセル", on_click=close),
+                ft.TextButton("開き直す", on_click=reload),
+                ft.TextButton("上書き保存", on_click=overwrite),
+            ],
+        )
+        self.page.overlay.append(dialog)
+        dialog.open = True
+        self.page.update()
 
     # ----- 2-7. 新規テンプレート作成 -----
     def create_template(self, e):
@@ -243,16 +664,7 @@ class TemplateManager:
                 # 拡張子が .txt でなければ自動で付ける(初学者の入力ミスを救済)
                 if not filename.endswith('.txt'):
                     filename += '.txt'
-
-                filepath = self.template_dir / filename
-                if filepath.exists():
-                    # 同じ名前のファイルが既にある場合は作らずに警告
-                    self.show_snackbar("同名のファイルが存在します", ft.Colors.ORANGE)
-                else:
-                    # 空文字を書き込んで「中身が空のファイル」を作成
-                    filepath.write_text("", encoding="utf-8")
-                    self.load_templates()  # 一覧を更新して新ファイルを表示
-                    self.show_snackbar("作成しました", ft.Colors.GREEN)
+                self.add_template(filename)
 
             # ダイアログを閉じる
             dialog.open = False
@@ -281,6 +693,15 @@ class TemplateManager:
         dialog.open = True
         self.page.update()
 
+    def add_template(self, filename):
+        """空のテンプレートファイルを作り、一覧に表示する。"""
+        if self.create_file(self.folder_path(self.folder) / filename):
+            self.load_templates()  # 一覧を更新して新ファイルを表示
+            self.show_snackbar("作成しました", ft.Colors.GREEN)
+        else:
+            # 同じ名前のファイルが既にある場合は作らずに警告
+            self.show_snackbar("同名のファイルが存在します", ft.Colors.ORANGE)
+
     # ----- 2-8. テンプレート削除 -----
     def delete_template(self, e):
         """現在選択中のファイルを削除する。誤操作防止のため確認ダイアログを表示。"""
@@ -291,14 +712,7 @@ class TemplateManager:
 
         # 確認ダイアログで「削除」が押されたときの処理(内部関数)
         def confirm_delete(e):
-            try:
-                self.current_file.unlink()       # ファイルを実際に削除
-                self.text_field.value = ""       # テキスト欄を空にする
-                self.current_file = None         # 選択状態を解除
-                self.load_templates()            # 一覧を再描画
-                self.show_snackbar("削除しました", ft.Colors.GREEN)
-            except Exception as ex:
-                self.show_snackbar(f"削除エラー: {ex}", ft.Colors.RED)
+            self.remove_template()
 
             # ダイアログを閉じる
             dialog.open = False
@@ -308,7 +722,7 @@ class TemplateManager:
         dialog = ft.AlertDialog(
             title=ft.Text("確認"),
             # f"..." は f-string。{} の中の式が値に置き換わる
-            content=ft.Text(f"'{self.current_file.name}' を削除しますか?"),
+            content=ft.Text(f"'{self.rel_path(self.current_file)}' を削除しますか?"),
             actions=[
                 ft.TextButton(
                     "キャンセル",
@@ -322,16 +736,135 @@ class TemplateManager:
         dialog.open = True
         self.page.update()
 
+    def remove_template(self):
+        """現在選択中のファイルを削除し、テキスト欄と一覧を更新する。"""
+        try:
+            self.delete_file(self.current_file)
+        except Exception as ex:
+            self.show_snackbar(f"削除エラー: {ex}", ft.Colors.RED)
+            return
+        self.text_field.value = ""       # テキスト欄を空にする
+        self.current_file = None         # 選択状態を解除
+        self.current_version = None
+        self.load_templates()            # 一覧を再描画
+        self.show_snackbar("削除しました", ft.Colors.GREEN)
+
     # ----- 2-9. クリップボードへコピー -----
     def copy_content(self, e):
-        """現在のテキスト欄の内容をクリップボードにコピーする(他アプリで Ctrl+V 可能に)。"""
-        if self.text_field.value:
-            # pyperclip.copy() で OS のクリップボードへ書き込む
-            pyperclip.copy(self.text_field.value)
-            self.show_snackbar("コピーしました", ft.Colors.GREEN)
-        else:
+        """
+        現在のテキスト欄の内容をクリップボードにコピーする(他アプリで Ctrl+V 可能に)。
+        {{顧客名}} のような差し込み項目があれば、先に値を入力するダイアログを出す。
+        """
+        if not self.text_field.value:
             # コピー対象が空のときの注意表示
             self.show_snackbar("コピーする内容がありません", ft.Colors.ORANGE)
+            return
+        compiled = self.compile_current()
+        if compiled.names:
+            self.show_fill_dialog(compiled)
+        else:
+            self.copy_text(self.text_field.value)
+
+    def copy_text(self, text):
+        """文字列をクリップボードへ書き込み、知らせを出す。"""
+        # pyperclip は起動時には読み込まず、最初にコピーするときに読み込む
+        # (2回目からは読み込み済みのものが使われるので速い)
+        try:
+            import pyperclip
+        except ImportError:
+            self.show_snackbar("コピーには pyperclip が必要です(pip install pyperclip)", ft.Colors.RED)
+            return
+        # pyperclip.copy() で OS のクリップボードへ書き込む
+        pyperclip.copy(text)
+        self.show_snackbar("コピーしました", ft.Colors.GREEN)
+
+    def compile_current(self):
+        """
+        テキスト欄の内容を解析した結果(CompiledTemplate)を返す。
+        開いたファイルの版(サイズ・更新時刻)ごとにキャッシュするので、同じテンプレートは2回目から解析しない。
+        """
+        if self.current_file is None or self.current_version is None:
+            return self.compiler.compile(None, None, self.text_field.value)
+        return self.compiler.compile(
+            self.rel_path(self.current_file), self.current_version[:2], self.text_field.value
+        )
+
+    def show_fill_dialog(self, compiled):
+        """差し込み項目ごとの入力欄を並べたダイアログを出し、「コピー」で埋めた文章をコピーする。"""
+        # 初期値は「前回入力した値」、無ければ {{today}} などの決まった値
+        defaults = {**builtin_values(), **self.last_values}
+        fields = {
+            name: ft.TextField(label=name, value=defaults.get(name, ""), dense=True)
+            for name in compiled.names
+        }
+
+        def close(e):
+            dialog.open = False
+            self.page.update()
+
+        def copy(e):
+            values = {name: field.value or "" for name, field in fields.items()}
+            self.last_values.update(values)
+            close(e)
+            self.copy_text(compiled.render(values))
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("差し込み項目の入力"),
+            # 項目が多くてもはみ出さないよう、縦にスクロールできる列に並べる
+            content=ft.Column(list(fields.values()), tight=True, scroll=ft.ScrollMode.AUTO),
+            actions=[
+                ft.TextButton("キャンセル", on_click=close),
+                ft.TextButton("コピー", on_click=copy),
+            ],
+        )
+        self.page.overlay.append(dialog)
+        dialog.open = True
+        self.page.update()
+
+    # ----- 2-9-2. CSV 一括作成 -----
+    def start_batch(self, e):
+        """「CSV一括」ボタンが押されたら、差し込む値の CSV ファイルを選ぶ画面を出す。"""
+        if not self.text_field.value:
+            self.show_snackbar("テンプレートを選択してください", ft.Colors.ORANGE)
+            return
+        compiled = self.compile_current()
+        if not compiled.names:
+            self.show_snackbar("このテンプレートには差し込み項目({{項目名}})がありません", ft.Colors.ORANGE)
+            return
+        # ボタンを押した時点の内容を使う(ファイルを選んでいる間に編集しても混ざらない)
+        name = self.current_file.stem if self.current_file is not None else "template"
+        self.batch_source = (name, compiled, None)
+        self.csv_picker.pick_files(dialog_title="差し込む値の CSV ファイル", allowed_extensions=["csv"])
+
+    def on_csv_picked(self, e):
+        """CSV ファイルが選ばれたら、作った文章を書き出すフォルダを選ぶ画面を出す。"""
+        if not e.files or self.batch_source is None:
+            return
+        name, compiled, _ = self.batch_source
+        self.batch_source = (name, compiled, Path(e.files[0].path))
+        self.batch_dir_picker.get_directory_path(dialog_title="作った文章を書き出すフォルダ")
+
+    def on_batch_dir_picked(self, e):
+        """書き出し先のフォルダが選ばれたら、CSV の行ごとに文章を作る処理を別スレッドで始める。"""
+        if not e.path or self.batch_source is None:
+            return
+        name, compiled, csv_path = self.batch_source
+        self.batch_source = None
+        out_dir = Path(e.path)
+
+        def done(result):
+            count, missing = result
+            message = f"{count} 件の文章を '{out_dir.name}' に作成しました"
+            if missing:
+                # CSV に列が無い項目は {{項目名}} のまま残る
+                message += f"(CSV に列が無い項目: {', '.join(missing)})"
+            self.show_snackbar(message, ft.Colors.GREEN if not missing else ft.Colors.ORANGE)
+
+        self.run_job(
+            "一括作成中",
+            lambda report: self.render_csv(compiled, csv_path, out_dir, name, report),
+            done,
+        )
 
     # ----- 2-10. 通知バー表示(共通) -----
     def show_snackbar(self, message, color):
@@ -346,8 +879,418 @@ class TemplateManager:
         self.page.snack_bar.open = True  # 表示状態にする
         self.page.update()
 
+    # ----- 2-11. まとめて書き出し・取り込み(zip) -----
+    def on_export_picked(self, e):
+        """書き出し先が選ばれたら、すべてのテンプレートを zip に書き出す処理を別スレッドで始める。"""
+        if not e.path:
+            return  # キャンセルされた
+        path = Path(e.path)
+        if path.suffix.lower() != ".zip":
+            path = path.with_name(path.name + ".zip")
+        self.run_job(
+            "書き出し中",
+            lambda report: self.export_archive(path, report),
+            lambda count: self.show_snackbar(f"{count} 件を書き出しました", ft.Colors.GREEN),
+        )
+
+    def on_import_picked(self, e):
+        """zip ファイルが選ばれたら、その中のテンプレートを取り込む処理を別スレッドで始める。"""
+        if not e.files:
+            return  # キャンセルされた
+        path = Path(e.files[0].path)
+        self.run_job("取り込み中", lambda report: self.import_archive(path, report), self.finish_import)
+
+    def finish_import(self, result):
+        """取り込みが終わったら、一覧と全文検索の索引に反映して結果を知らせる。"""
+        imported, skipped = result
+        # 取り込んだファイルは文字コードと一緒に目録へ記録済みなので、今のフォルダの一覧は目録から作り直す
+        self.open_folder(self.folder)
+        if imported:
+            self.index_in_background(imported)
+        message = f"{len(imported)} 件を取り込みました"
+        if skipped:
+            message += f"(同じ名前のファイルがあるなどで {skipped} 件は取り込んでいません)"
+        self.show_snackbar(message, ft.Colors.GREEN if not skipped else ft.Colors.ORANGE)
+
+    def run_job(self, label, work, done):
+        """
+        時間のかかる処理 work を別スレッドで動かし、左下の進み具合バーに進み具合を表示する。
+        work(report) は処理の途中で report(済んだ件数, 全体の件数) を呼ぶ。
+        終わったら done(work の戻り値) を呼ぶ。失敗したときはエラーを表示する。
+        """
+        if self.job_running:
+            self.show_snackbar("ほかの書き出し・取り込みが終わるまでお待ちください", ft.Colors.ORANGE)
+            return
+        self.job_running = True
+        self.job_progress.value = 0
+        self.job_progress.visible = True
+        self.job_status.value = f"{label}…"
+        self.job_status.visible = True
+        self.page.update()
+        last_shown = [0.0]  # 最後に進み具合を画面へ送った時刻(内部関数から書き換えるのでリストに入れる)
+
+        def report(count, total):
+            # 1件ごとに画面を更新すると、画面への送信のほうが重くなるので 0.1 秒に1回までにする
+            now = time.monotonic()
+            if count < total and now - last_shown[0] < 0.1:
+                return
+            last_shown[0] = now
+            self.job_progress.value = count / total if total else 1
+            self.job_status.value = f"{label}… {count} / {total} 件"
+            self.page.update()
+
+        def run():
+            try:
+                result = work(report)
+            except Exception as ex:
+                # 読み書きの失敗・壊れた zip だけでなく、パスワード付きの zip(RuntimeError)や
+                # 対応していない圧縮方式(NotImplementedError)、CSV の読み取りエラーなども、
+                # 何も表示されずに終わることのないよう、すべてエラーとして表示する
+                self.show_snackbar(f"{label.removesuffix('中')}エラー: {ex}", ft.Colors.RED)
+            else:
+                done(result)
+            finally:
+                self.job_running = False
+                self.job_progress.visible = False
+                self.job_status.visible = False
+                self.page.update()
+
+        threading.Thread(target=run, name="archive-job", daemon=True).start()
+
+
+# ===== 3. 非同期モード ==========================================================
+
+class AsyncTemplateManager(TemplateManager):
+    """
+    ファイルの読み書き・削除・フォルダの読み込みを、画面を動かしている流れ(イベントループ)の
+    外(別スレッド)で行う TemplateManager。「--async」で起動したときに使う。
+
+    遅いネットワーク上の共有フォルダでも、ディスクを待つ間に画面が固まらない。
+    ディスクを触る処理そのもの(read_file / write_file / delete_file / scan_folder など)は
+    TemplateManager のものをそのまま使い、呼び出し方だけを
+    「asyncio の run_in_executor で別スレッドに渡し、await で結果を待つ」形に変えている。
+
+    読み込み中は進み具合バーを出し、テキスト欄を操作できないようにする。
+    読み込みが終わる前に別のテンプレートがクリックされたら、前の読み込みは取り消す
+    (まだ始まっていなければ読み込み自体を行わず、始まっていても結果を捨てる)。
+    """
+
+    def __init__(self, page: ft.Page, timer=None, template_dir=None, cache_dir=None):
+        self.pending_read = None    # 最後に始めた読み込み(取り消すときと、古い読み込みの結果を見分けるときに使う)
+        self.busy = 0               # 別スレッドで動いている読み書きの数(0 になったらバーを隠す)
+        super().__init__(page, timer, template_dir, cache_dir)
+
+    # ----- 3-1. 別スレッドで動かす共通処理 -----
+    async def run_blocking(self, func, *args):
+        """
+        ディスクを触る関数 func(*args) を別スレッドで動かし、終わるまで待って結果を返す。
+        待っている間は進み具合バーを表示する。
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, func, *args)
+        self.set_busy(+1)
+        try:
+            return await future
+        finally:
+            self.set_busy(-1)
+
+    def set_busy(self, delta):
+        """読み書き中の数を増減し、1 件以上あるあいだだけ進み具合バーを表示する。"""
+        self.busy += delta
+        visible = self.busy > 0
+        if self.progress.visible != visible:
+            self.progress.visible = visible
+            self.page.update()
+
+    # ----- 3-2. 一覧の読み込み -----
+    def load_templates(self):
+        """フォルダの読み込みを非同期で始める(ボタンなど、ふつうの関数からも呼べる)。"""
+        self.page.run_task(self.load_templates_async)
+
+    async def load_templates_async(self):
+        """フォルダを別スレッドで読み、終わったら一覧に反映する。"""
+        try:
+            folder, added, removed = await self.run_blocking(self.scan_folder)
+        except OSError as ex:
+            self.show_snackbar(f"一覧の読み込みエラー: {ex}", ft.Colors.RED)
+            return
+        self.show_scan(folder, added, removed)
+
+    def initial_scan(self):
+        """起動直後のフォルダの読み直しを非同期で始める。"""
+        self.page.run_task(self.initial_scan_async)
+
+    async def initial_scan_async(self):
+        """起動直後にフォルダを別スレッドで読み直し、終わったら起動時間の記録を締める。"""
+        await self.load_templates_async()
+        self.timer.mark("scan")
+        self.timer.finish()
+
+    # ----- 3-3. 一覧から選択されたとき -----
+    def select_template(self, filename):
+        """一覧の行がクリックされたら、そのファイルの読み込みを非同期で始める。"""
+        self.page.run_task(self.select_template_async, filename)
+
+    async def select_template_async(self, filename):
+        """
+        ファイルを別スレッドで読み、読み終わったら右側のテキスト欄に表示する。
+        先に始めた読み込みがまだ終わっていなければ取り消す。
+        """
+        if self.pending_read is not None:
+            # まだ別スレッドで始まっていなければ、読み込み自体が行われない
+            self.pending_read.cancel()
+
+        # 読み込み中は、古い内容を書き換えられないようにテキスト欄を止めておく
+        self.text_field.disabled = True
+        self.text_field.hint_text = "読み込み中…"
+        self.page.update()
+
+        filepath = self.template_dir / filename
+        loop = asyncio.get_running_loop()
+        read = loop.run_in_executor(None, self.read_file, filepath)
+        self.pending_read = read
+        self.set_busy(+1)
+        try:
+            content, version = await read
+        except asyncio.CancelledError:
+            return  # 後から別のテンプレートがクリックされた
+        except (OSError, ValueError) as e:
+            if self.pending_read is read:
+                self.show_read_error(filename, e)
+            return
+        finally:
+            self.set_busy(-1)
+            # この読み込みが最後に始めたものか。ファイル名ではなく読み込みそのもので比べる
+            # (同じテンプレートを2回クリックしたとき、1回目の後始末で2回目の読み込み中の画面を戻さないため)
+            latest = self.pending_read is read
+            if latest:
+                self.pending_read = None
+                self.text_field.disabled = False
+                self.text_field.hint_text = "テンプレートを選択してください"
+                self.page.update()
+
+        # 読み終わる前に別のテンプレートがクリックされていたら、古い結果は捨てる
+        if not latest:
+            return
+        self.show_content(filepath, content, version)
+
+    # ----- 3-4. 保存 -----
+    def save_to(self, filepath, content, expected):
+        """保存ボタンが押されたら、書き込みを非同期で始める。"""
+        # 押した時点のファイルと内容を渡す(書き込み中に別のファイルを開いても混ざらない)
+        self.page.run_task(self.save_to_async, filepath, content, expected)
+
+    async def save_to_async(self, filepath, content, expected):
+        """内容を別スレッドでファイルに書き込む。他の人の変更とぶつかったら確認のダイアログを出す。"""
+        try:
+            version = await self.run_blocking(self.write_file, filepath, content, expected)
+        except SaveConflictError as ex:
+            self.show_conflict(filepath, content, ex)
+            return
+        except Exception as ex:
+            self.show_snackbar(f"保存エラー: {ex}", ft.Colors.RED)
+            return
+        self.finish_save(filepath, version)
+
+    # ----- 3-5. 新規作成・削除 -----
+    def add_template(self, filename):
+        """新規作成ダイアログで「作成」が押されたら、ファイル作成を非同期で始める。"""
+        self.page.run_task(self.add_template_async, filename)
+
+    async def add_template_async(self, filename):
+        """空のファイルを別スレッドで作り、一覧を読み直す。"""
+        try:
+            created = await self.run_blocking(self.create_file, self.folder_path(self.folder) / filename)
+        except OSError as ex:
+            self.show_snackbar(f"作成エラー: {ex}", ft.Colors.RED)
+            return
+        if not created:
+            self.show_snackbar("同名のファイルが存在します", ft.Colors.ORANGE)
+            return
+        await self.load_templates_async()
+        self.show_snackbar("作成しました", ft.Colors.GREEN)
+
+    def remove_template(self):
+        """削除の確認で「削除」が押されたら、ファイル削除を非同期で始める。"""
+        self.page.run_task(self.remove_template_async, self.current_file)
+
+    async def remove_template_async(self, filepath):
+        """ファイルを別スレッドで削除し、テキスト欄と一覧を更新する。"""
+        try:
+            await self.run_blocking(self.delete_file, filepath)
+        except Exception as ex:
+            self.show_snackbar(f"削除エラー: {ex}", ft.Colors.RED)
+            return
+        # 削除を待つ間に別のファイルを開いていたら、そちらの表示は消さない
+        if self.current_file == filepath:
+            self.text_field.value = ""
+            self.current_file = None
+            self.current_version = None
+        await self.load_templates_async()
+        self.show_snackbar("削除しました", ft.Colors.GREEN)
+
+
+# ===== 4. アプリ起動部分 =======================================================
+
+class StartupTimer:
+    """
+    起動にかかった時間を、区切りごとに記録するクラス。
+    記録する区切り(スクリプトを読み込み始めてからのミリ秒):
+      imports     … flet などのライブラリを読み込み終えた
+      main        … Flet がウィンドウを準備して main() が呼ばれた
+      shell       … 画面の枠(左右2ペイン)を表示した
+      first_paint … 前回の目録から一覧を表示した(ここまでがユーザーを待たせる時間)
+      scan        … フォルダを読み直し、差分を一覧に反映し終えた
+    enabled のときだけ、最後に標準エラー出力へ書き、log_path のファイルへ1行ずつ書き足す。
+    """
+
+    def __init__(self, started_at, enabled=False, log_path=None):
+        self.started_at = started_at
+        self.enabled = enabled
+        self.log_path = log_path
+        self.marks = []  # [(区切りの名前, 起動からのミリ秒), ...]
+        self.finished = False
+
+    def mark(self, name, at=None):
+        """区切り name の時刻を記録する(at を渡せばその時刻、なければ今)。"""
+        if at is None:
+            at = time.perf_counter()
+        self.marks.append((name, (at - self.started_at) * 1000))
+
+    def finish(self):
+        """記録を締めくくり、有効なら書き出す(2回目以降は何もしない)。"""
+        if self.finished:
+            return
+        self.finished = True
+        if not self.enabled:
+            return
+        summary = "  ".join(f"{name}={ms:.1f}ms" for name, ms in self.marks)
+        print(f"起動時間: {summary}", file=sys.stderr)
+        if self.log_path is None:
+            return
+        record = {
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "marks": {name: round(ms, 1) for name, ms in self.marks},
+        }
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass  # 記録が書けなくてもアプリは止めない
+
+
+# ----- 処理時間の計測(--profile で起動したときだけ使う) -----
+# 時間を測るメソッドの一覧 {クラス名: [メソッド名, ...]}。ファイルの読み書きと一覧の更新が中心
+PROFILED_METHODS = {
+    "TemplateManager": [
+        "open_folder", "load_templates", "scan_folder", "show_scan", "on_folder_events",
+        "select_template", "read_file", "decode_file", "save_to", "write_file", "replace_file",
+        "add_template", "create_file", "remove_template", "delete_file", "index_files",
+        "scan_search", "export_archive", "import_archive", "render_csv",
+    ],
+    "AsyncTemplateManager": [
+        "load_templates_async", "select_template_async", "save_to_async",
+        "add_template_async", "remove_template_async",
+    ],
+}
+# --profile でファイル名を省略したときのトレースファイル
+PROFILE_TRACE_FILE = Path(__file__).resolve().parent / "teikei_kanri_trace.json"
+profiler = None  # 計測の集計係(計測しないときは None のまま)
+
+
+def start_profiling(trace_path):
+    """
+    PROFILED_METHODS に時間を測る仕掛けを付け、集計係(Instrumentation)を返す。
+    終了時には記録をトレースファイルに書き出す。2回目以降は最初に作った集計係を返す。
+    """
+    global profiler  # 関数の中からモジュールの変数 profiler を書き換える
+    if profiler is None:
+        # 計測のときだけ読み込む(ふだんの起動では読み込まない)
+        from instrumentation import Instrumentation
+        profiler = Instrumentation("定型文管理アプリ", trace_path)
+        for class_name, names in PROFILED_METHODS.items():
+            profiler.instrument(globals()[class_name], names)
+        # atexit に登録した関数は、プログラムが終わるときに呼ばれる
+        atexit.register(lambda: print(f"トレースを {profiler.dump_trace()} に保存しました"))
+    return profiler
+
+
+class ProfilerPanel:
+    """
+    計測結果を表示するダイアログ。画面右下の計測ボタンで開く。
+    開いている間は、別スレッドで1秒ごとに表示を更新する。
+    """
+
+    REFRESH_SECONDS = 1.0
+
+    def __init__(self, page, profiler):
+        self.page = page
+        self.profiler = profiler
+        self.showing = False  # ダイアログを開いているか(更新スレッドはこれが False になったら止まる)
+        # 表の列がそろうよう、等幅フォントで表示する
+        self.text = ft.Text("", font_family="monospace", size=11, selectable=True)
+        self.status = ft.Text("", size=12, color=ft.Colors.GREY_600)
+        self.dialog = ft.AlertDialog(
+            title=ft.Text("計測パネル"),
+            content=ft.Column(
+                [self.status, self.text], scroll=ft.ScrollMode.AUTO, width=680, height=360
+            ),
+            actions=[
+                ft.TextButton("トレースを保存", on_click=self.save_trace),
+                ft.TextButton("リセット", on_click=self.reset),
+                ft.TextButton("閉じる", on_click=self.close),
+            ],
+            on_dismiss=self.close,  # ダイアログの外をクリックして閉じたとき
+        )
+        page.overlay.append(self.dialog)
+        page.floating_action_button = ft.FloatingActionButton(
+            icon=ft.Icons.SPEED, tooltip="計測パネル", mini=True, on_click=self.open
+        )
+        page.update()
+
+    def open(self, e):
+        """ダイアログを開き、表示の更新を始める。"""
+        self.dialog.open = True
+        self.refresh()
+        if not self.showing:
+            self.showing = True
+            threading.Thread(target=self.keep_refreshing, daemon=True).start()
+
+    def close(self, e):
+        """ダイアログを閉じ、表示の更新を止める。"""
+        self.showing = False
+        self.dialog.open = False
+        self.page.update()
+
+    def keep_refreshing(self):
+        """ダイアログを開いている間、REFRESH_SECONDS ごとに表示を更新する(別スレッドで動く)。"""
+        while True:
+            time.sleep(self.REFRESH_SECONDS)
+            if not self.showing:
+                return
+            self.refresh()
+
+    def refresh(self):
+        """集計を表示し直す。"""
+        self.text.value = self.profiler.report()
+        self.page.update()
+
+    def reset(self, e):
+        """集計とトレースを空にする。"""
+        self.profiler.reset()
+        self.refresh()
+
+    def save_trace(self, e):
+        """トレースファイルを書き出し、書き出した場所を表示する。"""
+        try:
+            path = self.profiler.dump_trace()
+        except OSError as ex:
+            self.status.value = f"保存に失敗しました: {ex}"
+        else:
+            self.status.value = f"{path} に保存しました(chrome://tracing などで開けます)"
+        self.page.update()
 
-# ===== 3. アプリ起動部分 =======================================================
 
 def main(page: ft.Page):
     """
@@ -358,9 +1301,67 @@ def main(page: ft.Page):
     page.window.width = 720
     page.window.height = 540
 
-    TemplateManager(page)
+    # コマンドライン引数の読み取り。例: python teikei_kanri.py --async
+    # (Flet が独自の引数を付けて起動しても止まらないよう、知らない引数は無視する)
+    parser = argparse.ArgumentParser(description="定型文管理アプリ")
+    parser.add_argument(
+        "--async",
+        dest="use_async",  # async は Python の予約語なので、別の名前で受け取る
+        action="store_true",
+        help="ファイルの読み書きを別スレッドで行い、遅い共有フォルダでも画面を固まらせない",
+    )
+    parser.add_argument(
+        "--startup-timing",
+        action="store_true",
+        help="起動にかかった時間(最初の表示まで・フォルダの読み直しまで)を表示し、"
+             "目録と同じキャッシュフォルダの startup.jsonl に書き足す(環境変数 TEIKEI_STARTUP_TIMING=1 でも可)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="目録を保存するフォルダ(省略時は利用者ごとのキャッシュフォルダ。例: ~/.cache/teikei)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=str(PROFILE_TRACE_FILE),
+        metavar="TRACE_FILE",
+        help="ファイルの読み書きなどの時間を測って計測パネルに表示し、終了時にトレースファイルへ書き出す"
+             f"(既定: {PROFILE_TRACE_FILE.name}。環境変数 TEIKEI_PROFILE=1 でも可)",
+    )
+    args, _ = parser.parse_known_args()
+
+    # 環境変数 TEIKEI_PROFILE でも計測を有効にできる(1 なら既定のファイル、それ以外はファイル名)
+    trace_path = args.profile
+    env_profile = os.environ.get("TEIKEI_PROFILE")
+    if trace_path is None and env_profile:
+        trace_path = str(PROFILE_TRACE_FILE) if env_profile == "1" else env_profile
+    # 計測の仕掛けは、アプリ本体を作る前に付ける
+    if trace_path:
+        start_profiling(trace_path)
+
+    # 起動時間の記録は、目録と同じキャッシュフォルダに書く(スクリプトの場所は書き込めないことがある)
+    cache_dir = args.cache_dir or default_cache_dir(DEFAULT_TEMPLATE_DIR)
+    timer = StartupTimer(
+        STARTED_AT,
+        enabled=args.startup_timing or os.environ.get("TEIKEI_STARTUP_TIMING") == "1",
+        log_path=cache_dir / "startup.jsonl",
+    )
+    timer.mark("imports", IMPORTED_AT)
+    timer.mark("main")
+
+    if args.use_async:
+        manager = AsyncTemplateManager(page, timer, cache_dir=cache_dir)
+    else:
+        manager = TemplateManager(page, timer, cache_dir=cache_dir)
+    # 目録は読み込みのたびには書き出さず、数秒ごとにまとめて書く。終了するときに残りを書き出す
+    atexit.register(manager.save_indexes)
+    if profiler is not None:
+        ProfilerPanel(page, profiler)
 
 
 # ft.app() を呼ぶとウィンドウが立ち上がり、target に渡した main() が実行される
-# このスクリプトを直接実行したときに動き出すエントリーポイント
-ft.app(target=main)
+# このスクリプトを直接実行したときだけ動き出すエントリーポイント
+# (ほかのスクリプトから import したときは、ウィンドウを開かない)
+if __name__ == "__main__":
+    ft.app(target=main)
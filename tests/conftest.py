@@ -0,0 +1,5 @@
+# テストから、リポジトリの一番上にあるアプリ(teikei_core.py など)を import できるようにする
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,895 @@
+# =============================================================================
+# sticky_notes.py のテスト(画面を使わないので、どの環境でも python -m pytest で動く)
+# -----------------------------------------------------------------------------
+# 保存の予約(SaveScheduler)や保存先のクラス(AtomicJsonStore / JournalJsonStore / SqliteNoteStore)、
+# 検索の索引(NoteSearchIndex)など、画面を持たない部分の動きを確かめる。
+# tkinter のウィンドウが必要なところは、after() などだけを持つ小さな偽物で代わりにする。
+# =============================================================================
+
+import json
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import sticky_notes
+from sticky_notes import (
+    AtomicJsonStore,
+    BackgroundWriter,
+    JournalJsonStore,
+    NoteSearchIndex,
+    SaveScheduler,
+    SqliteNoteStore,
+    StickyNote,
+    StickyNotesApp,
+    VirtualNoteList,
+)
+
+
+class FakeRoot:
+    """after() で予約された関数を覚えておき、テストから呼べるようにする偽の root。"""
+
+    def __init__(self):
+        self.timers = {}   # {予約ID: (待ち時間, 関数)}
+        self.count = 0
+
+    def after(self, ms, func):
+        self.count += 1
+        after_id = f"after#{self.count}"
+        self.timers[after_id] = (ms, func)
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.timers.pop(after_id, None)
+
+    def run_timers(self):
+        """予約されている関数を、予約された順にすべて呼ぶ。"""
+        while self.timers:
+            after_id = next(iter(self.timers))
+            _, func = self.timers.pop(after_id)
+            func()
+
+
+# ===== 1. 保存の予約(SaveScheduler) ==========================================
+
+def test_requests_are_merged_into_one_save():
+    root = FakeRoot()
+    saved = []
+    scheduler = SaveScheduler(root, saved.append, idle_ms=800)
+
+    scheduler.request(1)
+    scheduler.request(2)
+    scheduler.request(1)
+    # 予約は前のものを取り消して延長するので、いつも1つだけ
+    assert len(root.timers) == 1
+    assert saved == []
+
+    root.run_timers()
+    assert saved == [{1, 2}]
+    assert scheduler.request_count == 3
+    assert scheduler.merged_count == 2
+    assert scheduler.save_count == 1
+    assert not scheduler.pending
+
+
+def test_delay_is_shortened_by_max_wait(monkeypatch):
+    root = FakeRoot()
+    scheduler = SaveScheduler(root, lambda ids: None, idle_ms=800, max_wait_ms=1000)
+    now = [100.0]
+    monkeypatch.setattr(sticky_notes.time, "monotonic", lambda: now[0])
+
+    scheduler.request(1)
+    assert [ms for ms, _ in root.timers.values()] == [800]
+    # 最初の要求から 0.75 秒たった → 残りは 250 ミリ秒だけ
+    now[0] = 100.75
+    scheduler.request(1)
+    assert [ms for ms, _ in root.timers.values()] == [250]
+    # max_wait_ms を過ぎたら、すぐに保存する
+    now[0] = 102.0
+    scheduler.request(1)
+    assert [ms for ms, _ in root.timers.values()] == [0]
+
+
+def test_flush_saves_only_when_pending():
+    root = FakeRoot()
+    saved = []
+    scheduler = SaveScheduler(root, saved.append)
+
+    assert scheduler.flush() is False
+    assert saved == []
+
+    scheduler.request(3)
+    assert scheduler.flush() is True
+    assert saved == [{3}]
+    # flush したら予約は取り消される
+    assert root.timers == {}
+
+    # force=True なら保存待ちがなくても保存する
+    assert scheduler.flush(force=True) is True
+    assert saved == [{3}, set()]
+
+
+def test_mark_dirty_is_saved_with_the_next_request():
+    root = FakeRoot()
+    saved = []
+    scheduler = SaveScheduler(root, saved.append)
+
+    scheduler.mark_dirty(5)
+    # mark_dirty だけでは保存を予約しない
+    assert root.timers == {}
+    scheduler.request(6)
+    root.run_timers()
+    assert saved == [{5, 6}]
+
+
+# ===== 2. 壊れにくい保存(AtomicJsonStore) ====================================
+
+def test_atomic_store_round_trip(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = AtomicJsonStore(path)
+    assert store.load() is None
+
+    store.save({"next_id": 2, "notes": [{"id": 1, "title": "買い物"}]})
+    assert AtomicJsonStore(path).load() == {"next_id": 2, "notes": [{"id": 1, "title": "買い物"}]}
+    # 一時ファイルは残らない
+    assert sorted(os.listdir(tmp_path)) == ["notes.json"]
+
+
+def test_atomic_store_keeps_previous_generation(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = AtomicJsonStore(path)
+    store.save({"next_id": 1, "notes": []})
+    store.save({"next_id": 2, "notes": []})
+
+    with open(path + ".bak", encoding="utf-8") as f:
+        assert json.load(f) == {"next_id": 1, "notes": []}
+    assert sorted(os.listdir(tmp_path)) == ["notes.json", "notes.json.bak"]
+
+
+def test_atomic_store_falls_back_to_backup(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = AtomicJsonStore(path)
+    store.save({"next_id": 1, "notes": []})
+    store.save({"next_id": 2, "notes": []})
+    # 書き込み途中で切れた本体ファイルのつもり
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"next_id": 3, "no')
+
+    store = AtomicJsonStore(path)
+    assert store.load() == {"next_id": 1, "notes": []}
+    assert store.loaded_from_backup
+
+    # 壊れた本体は .bak に回さず、正常な .bak を残したまま本体を書き直す
+    store.save({"next_id": 4, "notes": []})
+    with open(path + ".bak", encoding="utf-8") as f:
+        assert json.load(f) == {"next_id": 1, "notes": []}
+    assert AtomicJsonStore(path).load() == {"next_id": 4, "notes": []}
+
+
+def test_atomic_store_reports_broken_file_without_backup(tmp_path):
+    path = tmp_path / "notes.json"
+    path.write_text("[1, 2", encoding="utf-8")
+    with pytest.raises(ValueError):
+        AtomicJsonStore(str(path)).load()
+
+
+# ===== 3. SQLite への保存(SqliteNoteStore) ===================================
+
+def write_old_json(path, notes, next_id):
+    """本文をそのまま入れていた、これまでの形式の sticky_notes_data.json を作る。"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"next_id": next_id, "notes": notes}, f, ensure_ascii=False)
+
+
+def test_sqlite_store_migrates_json_once(tmp_path):
+    json_path = str(tmp_path / "notes.json")
+    write_old_json(json_path, [
+        {"id": 1, "title": "買い物", "content": "牛乳\nパン", "color": "#FFFF99", "x": 10, "y": 20, "timestamp": "t1"},
+        {"id": 3, "title": "会議", "content": "10時から", "color": "#99CCFF", "x": 30, "y": 40, "timestamp": "t2"},
+    ], next_id=4)
+
+    store = SqliteNoteStore(str(tmp_path / "notes.db"), legacy_json_path=json_path)
+    data = store.load()
+    assert data["next_id"] == 4
+    assert [note["title"] for note in data["notes"]] == ["買い物", "会議"]
+    # 起動時の読み込みには本文を含めず、プレビューだけを持つ
+    assert "content" not in data["notes"][0]
+    assert data["notes"][0]["preview"] == sticky_notes.make_preview("牛乳\nパン")
+    assert store.load_body(1) == "牛乳\nパン"
+    assert store.load_body(3) == "10時から"
+    store.close()
+
+    # 2回目からは JSON を取り込まない（JSON 側が変わっても上書きしない）
+    write_old_json(json_path, [], next_id=1)
+    store = SqliteNoteStore(str(tmp_path / "notes.db"), legacy_json_path=json_path)
+    assert [note["id"] for note in store.load()["notes"]] == [1, 3]
+    store.close()
+
+
+def test_sqlite_store_updates_only_given_columns(tmp_path):
+    store = SqliteNoteStore(str(tmp_path / "notes.db"))
+    assert store.load() is None
+    store.save_changes(2, {1: {"id": 1, "title": "買い物", "content": "牛乳", "x": 10, "y": 20}}, set())
+
+    # 位置だけの変更では、タイトルや本文はそのまま
+    store.save_changes(2, {1: {"id": 1, "x": 50, "y": 60}}, set())
+    note = store.load()["notes"][0]
+    assert (note["title"], note["x"], note["y"]) == ("買い物", 50, 60)
+    assert store.load_body(1) == "牛乳"
+
+    # 本文の変更はプレビューも書き換える
+    store.save_changes(2, {1: {"id": 1, "content": "卵"}}, set())
+    assert store.load()["notes"][0]["preview"] == "卵"
+    assert store.load_body(1) == "卵"
+    store.close()
+
+    # 開き直しても同じ内容が読める
+    store = SqliteNoteStore(str(tmp_path / "notes.db"))
+    assert store.load()["notes"][0]["title"] == "買い物"
+    assert store.load_body(1) == "卵"
+    store.close()
+
+
+def test_sqlite_store_deletes_notes(tmp_path):
+    store = SqliteNoteStore(str(tmp_path / "notes.db"))
+    store.save_changes(3, {
+        1: {"id": 1, "title": "a", "content": "本文a"},
+        2: {"id": 2, "title": "b", "content": "本文b"},
+    }, set())
+    store.save_changes(3, {}, {1})
+    assert [note["id"] for note in store.load()["notes"]] == [2]
+    assert store.load_body(1) == ""
+
+    # 全件保存では、渡されなかった付箋が消える
+    store.save({"next_id": 5, "notes": [{"id": 4, "title": "d", "content": "本文d"}]})
+    data = store.load()
+    assert data["next_id"] == 5
+    assert [note["id"] for note in data["notes"]] == [4]
+    store.close()
+
+
+def test_sqlite_store_upgrades_old_schema(tmp_path):
+    path = str(tmp_path / "notes.db")
+    # 本文を notes 表に入れていた古いデータベースを作る
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE notes (id INTEGER PRIMARY KEY, title TEXT, content TEXT, "
+        "color TEXT, x INTEGER, y INTEGER, timestamp TEXT)"
+    )
+    conn.execute("INSERT INTO notes VALUES (1, '古い付箋', '古い本文', '#FFFF99', 1, 2, 't')")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("INSERT INTO meta VALUES ('next_id', '2')")
+    conn.commit()
+    conn.close()
+
+    store = SqliteNoteStore(path)
+    note = store.load()["notes"][0]
+    assert (note["title"], note["preview"]) == ("古い付箋", "古い本文")
+    assert store.load_body(1) == "古い本文"
+    store.close()
+
+
+# ===== 4. 変更点の記録とジャーナル(StickyNote / JournalJsonStore) ==============
+
+class FakeApp:
+    """StickyNote が呼ぶ auto_save() と store だけを持つ、偽のアプリ本体。"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.requests = []   # auto_save() に渡された付箋IDの記録
+
+    def auto_save(self, note_id=None):
+        self.requests.append(note_id)
+
+
+def test_note_reports_only_changed_fields():
+    app = FakeApp()
+    note = StickyNote(app, 1, title="買い物", content="牛乳", x=10, y=20, timestamp="t0")
+
+    # まだ保存していない付箋は全項目を保存する
+    version, record = note.pending_changes()
+    assert set(record) == {"id", "title", "content", "color", "x", "y", "timestamp"}
+    note.mark_saved(version)
+
+    note.title_text = "買い物リスト"
+    note.mark_dirty("title")
+    version, record = note.pending_changes()
+    assert record == {"id": 1, "title": "買い物リスト", "timestamp": note.timestamp}
+    assert note.timestamp != "t0"
+    assert app.requests == [1]
+
+    note.mark_saved(version)
+    assert note.pending_changes()[1] == {"id": 1}
+
+
+def test_edit_during_save_stays_dirty():
+    note = StickyNote(FakeApp(), 1, content="牛乳")
+    note.mark_saved(note.saved_version())
+
+    note.mark_dirty("content")
+    version, _ = note.pending_changes()
+    # 保存している間にもう一度書き換えられた
+    note.mark_dirty("content")
+    note.mark_saved(version)
+    assert note.dirty_fields == {"content"}
+
+
+def test_move_does_not_change_version_or_timestamp():
+    note = StickyNote(FakeApp(), 1, content="牛乳", timestamp="t0")
+    note.mark_saved(note.saved_version())
+
+    note.x = 200
+    note.mark_moved("x")
+    version, record = note.pending_changes()
+    assert record == {"id": 1, "x": 200, "timestamp": "t0"}
+    assert note.version == 0
+
+    # 位置を保存している間に本文が変わっても、本文の変更は残る
+    note.mark_dirty("content")
+    note.mark_saved(version)
+    assert note.dirty_fields == {"content"}
+
+
+def test_journal_is_replayed_on_load(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = JournalJsonStore(path)
+    store.save_changes(3, {
+        1: {"id": 1, "title": "買い物", "content": "牛乳"},
+        2: {"id": 2, "title": "会議", "content": "10時"},
+    }, set())
+    store.save_changes(3, {1: {"id": 1, "x": 50}}, {2})
+    # まだコンパクションしていないので、ジャーナルに追記されているだけ
+    assert not os.path.exists(path)
+    with open(path + ".journal", encoding="utf-8") as f:
+        assert len(f.readlines()) == 5
+
+    reopened = JournalJsonStore(path)
+    data = reopened.load()
+    assert data["next_id"] == 3
+    assert data["notes"] == [
+        {"id": 1, "title": "買い物", "x": 50, "preview": "牛乳"},
+    ]
+    assert reopened.load_body(1) == "牛乳"
+    assert reopened.load_body(2) == ""
+
+
+def test_torn_journal_line_is_ignored_and_compacted(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = JournalJsonStore(path)
+    store.save_changes(2, {1: {"id": 1, "title": "買い物", "content": "牛乳"}}, set())
+    # 追記の途中で落ちて、最後の行が途中で切れたつもり
+    with open(path + ".journal", "a", encoding="utf-8") as f:
+        f.write('{"op":"put","id":1,"fields":{"title":"途')
+
+    reopened = JournalJsonStore(path)
+    data = reopened.load()
+    assert [note["title"] for note in data["notes"]] == ["買い物"]
+    # 切れた行の後ろに追記しないよう、読み込み時にまとめ直してジャーナルを空にする
+    assert os.path.getsize(path + ".journal") == 0
+    assert reopened.load_body(1) == "牛乳"
+
+    reopened.save_changes(2, {1: {"id": 1, "title": "買い物リスト"}}, set())
+    assert JournalJsonStore(path).load()["notes"][0]["title"] == "買い物リスト"
+
+
+def test_journal_is_compacted_after_compact_every_entries(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = JournalJsonStore(path, compact_every=4)
+    # 1回目は next_id の変更と付箋の追加で2行、その後は1回につき1行
+    store.save_changes(2, {1: {"id": 1, "content": "1回目"}}, set())
+    store.save_changes(2, {1: {"id": 1, "content": "2回目"}}, set())
+    assert store.bodies_gen == 0
+    store.save_changes(2, {1: {"id": 1, "content": "3回目"}}, set())
+
+    assert store.journal_entries == 0
+    assert store.bodies_gen == 1
+    assert os.path.getsize(path + ".journal") == 0
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["bodies_gen"] == 1
+    assert JournalJsonStore(path).load() is not None
+    assert store.load_body(1) == "3回目"
+
+
+# ===== 5. 一覧の差分更新(StickyNotesApp.update_note_list) ======================
+
+class FakeTree:
+    """ttk.Treeview の代わり。行の並びと、呼ばれた操作を記録する。"""
+
+    def __init__(self):
+        self.rows = []       # 上から順の行ID
+        self.values = {}     # {行ID: 各列の値}
+        self.calls = []      # 呼ばれた操作の名前
+        self.count = 0
+
+    def insert(self, parent, index, values, tags):
+        self.calls.append("insert")
+        self.count += 1
+        item = f"I{self.count}"
+        self.rows.insert(index, item)
+        self.values[item] = values
+        return item
+
+    def item(self, item, values, tags):
+        self.calls.append("item")
+        self.values[item] = values
+
+    def delete(self, item):
+        self.calls.append("delete")
+        self.rows.remove(item)
+        del self.values[item]
+
+    def tag_configure(self, tag, background):
+        self.calls.append("tag_configure")
+
+    def titles(self):
+        return [self.values[item][1] for item in self.rows]
+
+
+def make_list_app(notes):
+    """画面を作らずに、一覧の更新に使う属性だけを持つ StickyNotesApp を作る。"""
+    app = object.__new__(StickyNotesApp)  # __init__ を呼ばずに実体だけを作る
+    app.note_tree = FakeTree()
+    app.virtual_list = None
+    app.filter_ids = None
+    app.tree_items = {}
+    app.row_values = {}
+    app.row_order = []
+    app.color_tags = set()
+    app.notes = {}
+    for note_id, title in notes:
+        app.notes[note_id] = StickyNote(
+            FakeApp(), note_id, title=title, content="本文", timestamp="2026-01-15T14:23:45"
+        )
+    return app
+
+
+def test_note_list_adds_rows_in_id_order():
+    app = make_list_app([(3, "c"), (1, "a")])
+    app.update_note_list()
+    assert app.note_tree.titles() == ["a", "c"]
+
+    # 間のIDの付箋は、途中の正しい位置に1行だけ追加する
+    app.notes[2] = StickyNote(FakeApp(), 2, title="b", content="", timestamp="2026-01-15T14:23:45")
+    app.note_tree.calls.clear()
+    app.update_note_list({2})
+    assert app.note_tree.titles() == ["a", "b", "c"]
+    assert app.note_tree.calls == ["insert"]
+
+
+def test_note_list_touches_only_changed_rows():
+    app = make_list_app([(1, "a"), (2, "b"), (3, "c")])
+    app.update_note_list()
+    # 同じ色のタグは1回だけ設定する
+    assert app.note_tree.calls.count("tag_configure") == 1
+
+    app.note_tree.calls.clear()
+    app.update_note_list()
+    assert app.note_tree.calls == []
+
+    app.notes[2].title_text = "B"
+    app.update_note_list()
+    assert app.note_tree.calls == ["item"]
+    assert app.note_tree.titles() == ["a", "B", "c"]
+
+
+def test_note_list_removes_deleted_and_filtered_rows():
+    app = make_list_app([(1, "a"), (2, "b"), (3, "c")])
+    app.update_note_list()
+
+    del app.notes[2]
+    app.note_tree.calls.clear()
+    app.update_note_list({2})
+    assert app.note_tree.calls == ["delete"]
+    assert app.note_tree.titles() == ["a", "c"]
+    assert app.row_order == [1, 3]
+
+    # 検索に一致しない付箋の行も消え、検索をやめると元の位置に戻る
+    app.filter_ids = {3}
+    app.update_note_list()
+    assert app.note_tree.titles() == ["c"]
+    app.filter_ids = None
+    app.update_note_list()
+    assert app.note_tree.titles() == ["a", "c"]
+
+
+# ===== 6. 仮想スクロールの一覧(VirtualNoteList) ===============================
+
+class FakeSlotTree:
+    """VirtualNoteList が使い回す行だけを持つ、ttk.Treeview の代わり。"""
+
+    def __init__(self):
+        self.shown = []      # 画面に出ている行ID（上から順）
+        self.values = {}     # {行ID: 各列の値}
+        self.item_calls = 0  # 行の値を書き換えた回数
+        self.selection = []
+        self.count = 0
+
+    def insert(self, parent, index, values):
+        self.count += 1
+        item = f"S{self.count}"
+        self.shown.append(item)
+        return item
+
+    def detach(self, item):
+        self.shown.remove(item)
+
+    def move(self, item, parent, index):
+        self.shown.insert(index, item)
+
+    def delete(self, item):
+        if item in self.shown:
+            self.shown.remove(item)
+
+    def item(self, item, values, tags):
+        self.item_calls += 1
+        self.values[item] = values
+
+    def tag_configure(self, tag, background):
+        pass
+
+    def selection_set(self, items):
+        self.selection = list(items)
+
+    def visible_ids(self):
+        return [self.values[item][0] for item in self.shown]
+
+
+class FakeScrollbar:
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+def make_virtual_list(rows, notes):
+    """画面を作らずに、rows 行ぶんの行を使い回す VirtualNoteList を作る。"""
+    def get_row(note_id):
+        if note_id not in notes:
+            return None
+        return (note_id, notes[note_id]), "#FFFF99"
+
+    vlist = object.__new__(VirtualNoteList)  # __init__（Tk の部品を作る）を呼ばない
+    vlist.get_row = get_row
+    vlist.order = []
+    vlist.offset = 0
+    vlist.selected = set()
+    vlist.anchor = None
+    vlist.slots = []
+    vlist.slot_index = {}
+    vlist.slot_ids = []
+    vlist.slot_values = []
+    vlist.color_tags = set()
+    vlist.scrollbar = FakeScrollbar()
+    vlist.tree = FakeSlotTree()
+    vlist.resize(rows)
+    return vlist
+
+
+def test_virtual_list_shows_only_visible_rows():
+    notes = {note_id: f"付箋{note_id}" for note_id in range(1, 1001)}
+    vlist = make_virtual_list(3, notes)
+    vlist.set_ids(notes)
+    # 1000件あっても、行は3行だけ
+    assert vlist.tree.count == 3
+    assert vlist.tree.visible_ids() == [1, 2, 3]
+    assert vlist.scrollbar.position == (0.0, 0.003)
+
+    vlist.scroll_by(10)
+    assert vlist.tree.visible_ids() == [11, 12, 13]
+    # 末尾より先にはスクロールしない
+    vlist.yview("moveto", "1.0")
+    assert vlist.tree.visible_ids() == [998, 999, 1000]
+    assert vlist.tree.count == 3
+
+
+def test_virtual_list_refresh_redraws_changed_rows_only():
+    notes = {1: "a", 2: "b", 3: "c", 4: "d"}
+    vlist = make_virtual_list(3, notes)
+    vlist.set_ids(notes)
+    vlist.tree.item_calls = 0
+
+    notes[2] = "B"
+    vlist.refresh([2])
+    assert vlist.tree.item_calls == 1
+
+    # 削除された付箋は並びから外れ、後ろの付箋が繰り上がる
+    del notes[1]
+    vlist.refresh([1])
+    assert vlist.order == [2, 3, 4]
+    assert vlist.tree.visible_ids() == [2, 3, 4]
+
+    notes[0] = "z"
+    vlist.refresh([0])
+    assert vlist.order == [0, 2, 3, 4]
+    assert vlist.tree.visible_ids() == [0, 2, 3]
+
+
+def test_virtual_list_keeps_selection_outside_the_view():
+    notes = {note_id: str(note_id) for note_id in range(1, 21)}
+    vlist = make_virtual_list(5, notes)
+    vlist.set_ids(notes)
+    vlist.select_only(2)
+    vlist.move_selection(10)
+    # 画面外の付箋を選ぶと、見える位置までスクロールする
+    assert vlist.selected == {12}
+    assert vlist.tree.visible_ids() == [8, 9, 10, 11, 12]
+    assert len(vlist.tree.selection) == 1
+
+    # 選択した付箋が消えたら、選択からも外す
+    del notes[12]
+    vlist.set_ids(notes)
+    assert vlist.selected == set()
+
+
+# ===== 7. 全文検索の索引(NoteSearchIndex) =====================================
+
+@pytest.fixture
+def search_index():
+    index = NoteSearchIndex()
+    index.build([
+        (1, "買い物", "牛乳とパン"),
+        (2, "会議", "10時から 買い出しの相談"),
+        (3, "ＡＢＣ商事", "ｶﾀｶﾅの資料"),
+    ])
+    return index
+
+
+def test_search_finds_words_and_single_characters(search_index):
+    assert search_index.search("買い") == {1, 2}
+    assert search_index.search("パン") == {1}
+    assert search_index.search("買") == {1, 2}
+    assert search_index.search("存在しない") == set()
+    assert search_index.search("") == set()
+
+
+def test_search_requires_all_terms(search_index):
+    # 空白で区切った語は、すべてを含む付箋だけ（AND 検索）
+    assert search_index.search("買い 相談") == {2}
+    assert search_index.search("買い 牛乳") == {1}
+    assert search_index.search("牛乳 相談") == set()
+
+
+def test_search_ignores_width_and_case(search_index):
+    assert search_index.search("abc") == {3}
+    assert search_index.search("カタカナ") == {3}
+    assert search_index.matches(3, "ａｂｃ カタカナ")
+    assert not search_index.matches(1, "abc")
+
+
+def test_search_checks_order_of_longer_terms():
+    index = NoteSearchIndex()
+    # 「東京」「京都」の2文字の並びはどちらにもあるが、「東京都」はつながっていない
+    index.build([(1, "", "京都と東京"), (2, "", "東京都")])
+    assert index.search("東京都") == {2}
+
+
+def test_search_index_update_and_remove(search_index):
+    search_index.update(1, "買い物", "卵")
+    assert search_index.search("牛乳") == set()
+    assert search_index.search("卵") == {1}
+
+    search_index.remove(2)
+    assert search_index.search("買い") == {1}
+    # 付箋が消えたら、その付箋だけが使っていた見出しも残さない
+    assert "相談" not in search_index.postings
+    assert 2 not in search_index.texts
+
+
+# ===== 8. 本文の遅延読み込み(本文ファイルと load_body) ==========================
+
+def test_old_json_is_rewritten_with_separate_bodies(tmp_path):
+    path = str(tmp_path / "notes.json")
+    long_body = "長い本文です。" * 10
+    write_old_json(path, [
+        {"id": 1, "title": "買い物", "content": "牛乳\nパン"},
+        {"id": 2, "title": "メモ", "content": long_body},
+        {"id": 3, "title": "空", "content": ""},
+    ], next_id=4)
+
+    store = JournalJsonStore(path)
+    data = store.load()
+    # 起動時に返すのはプレビューだけで、本文は含めない
+    assert [note.get("content") for note in data["notes"]] == [None, None, None]
+    assert data["notes"][0]["preview"] == "牛乳 パン"
+    assert data["notes"][1]["preview"] == long_body[:25] + "..."
+
+    # 次回からは本文を読まずに起動できる形式で書き直されている
+    with open(path, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot["version"] == JournalJsonStore.FORMAT_VERSION
+    assert all("content" not in note for note in snapshot["notes"])
+
+    # 本文ファイルの [位置, バイト数] は UTF-8 のバイト単位
+    with open(store.bodies_path(snapshot["bodies_gen"]), "rb") as f:
+        bodies = f.read()
+    for note in snapshot["notes"]:
+        offset, length = note["body"]
+        assert bodies[offset:offset + length].decode("utf-8") == store.load_body(note["id"])
+    assert store.load_body(1) == "牛乳\nパン"
+    assert store.load_body(2) == long_body
+    assert store.load_body(3) == ""
+    store.close()
+
+
+def test_unchanged_bodies_survive_compaction(tmp_path):
+    path = str(tmp_path / "notes.json")
+    store = JournalJsonStore(path)
+    store.save({"next_id": 3, "notes": [
+        {"id": 1, "title": "a", "content": "変えない本文"},
+        {"id": 2, "title": "b", "content": "変える本文"},
+    ]})
+    store.save_changes(3, {2: {"id": 2, "content": "変えた本文"}}, set())
+    store.compact()
+    store.close()
+
+    store = JournalJsonStore(path)
+    store.load()
+    assert store.load_body(1) == "変えない本文"
+    assert store.load_body(2) == "変えた本文"
+    store.close()
+
+
+def test_note_reads_its_body_only_when_needed():
+    class CountingStore:
+        calls = 0
+
+        def load_body(self, note_id):
+            self.calls += 1
+            return "保存先の本文"
+
+    app = FakeApp(CountingStore())
+    note = StickyNote(app, 1, content=None, preview="保存先の")
+    assert not note.content_loaded
+    assert note.preview == "保存先の"
+    assert app.store.calls == 0
+
+    assert note.content_text == "保存先の本文"
+    assert note.content_text == "保存先の本文"
+    assert app.store.calls == 1
+
+
+# ===== 9. 位置の記録(StickyNote.on_configure) ==================================
+
+class FakeWindow:
+    """geometry() だけを返す、付箋ウィンドウ（Toplevel）の代わり。"""
+
+    def __init__(self, geometry):
+        self.geometry_text = geometry
+
+    def geometry(self):
+        return self.geometry_text
+
+
+def open_note_window(app, x, y):
+    """create_window() 直後と同じ状態（まだ <Configure> が届いていない）の付箋を作る。"""
+    note = StickyNote(app, 1, content="牛乳", x=x, y=y, timestamp="t0")
+    note.mark_saved(note.saved_version())
+    note.window = FakeWindow(f"300x400+{x}+{y}")
+    note.configured = False
+    return note
+
+
+def test_opening_a_note_is_not_a_change():
+    app = FakeApp()
+    note = open_note_window(app, 100, 100)
+    # ウィンドウマネージャーが少しずらして置いても、最初の Configure は記録しない
+    note.window.geometry_text = "300x400+108+130"
+    note.on_configure(SimpleNamespace(widget=note.window))
+    assert (note.x, note.y) == (100, 100)
+    assert app.requests == []
+    assert note.dirty_fields == set()
+
+
+def test_moving_a_note_saves_only_its_position():
+    app = FakeApp()
+    note = open_note_window(app, 100, 100)
+    note.on_configure(SimpleNamespace(widget=note.window))
+
+    # 中の部品（入力欄など）の Configure は無視する
+    note.window.geometry_text = "300x400+250+-5"
+    note.on_configure(SimpleNamespace(widget=object()))
+    assert app.requests == []
+
+    note.on_configure(SimpleNamespace(widget=note.window))
+    assert (note.x, note.y) == (250, -5)
+    assert app.requests == [1]
+    version, record = note.pending_changes()
+    assert record == {"id": 1, "x": 250, "y": -5, "timestamp": "t0"}
+    assert note.version == 0
+
+    # 大きさだけの変更（位置が同じ）では保存しない
+    note.mark_saved(version)
+    note.window.geometry_text = "500x600+250+-5"
+    note.on_configure(SimpleNamespace(widget=note.window))
+    assert app.requests == [1]
+    assert note.dirty_fields == set()
+
+
+# ===== 10. 別スレッドでの書き込み(BackgroundWriter) ============================
+
+def test_writer_runs_jobs_in_order_and_reports_on_close():
+    writer = BackgroundWriter(FakeRoot())
+    written = []
+    results = []
+    main_thread = threading.current_thread()
+
+    def fail():
+        raise OSError("ディスクがいっぱい")
+
+    writer.submit(lambda: written.append(1), done=lambda: results.append("done1"))
+    writer.submit(fail, failed=lambda e: results.append(str(e)))
+    writer.submit(lambda: written.append(3), done=lambda: results.append(threading.current_thread()))
+    writer.close()
+
+    assert written == [1, 3]
+    # 結果の関数は、close() を呼んだメインスレッドで順番に呼ばれる
+    assert results == ["done1", "ディスクがいっぱい", main_thread]
+    assert writer.outstanding == 0
+
+
+def test_writer_polls_results_with_after():
+    root = FakeRoot()
+    writer = BackgroundWriter(root, poll_ms=10)
+    finished = threading.Event()
+    results = []
+
+    writer.submit(finished.set, done=lambda: results.append("done"))
+    assert [ms for ms, _ in root.timers.values()] == [10]
+    assert finished.wait(5)
+    # 書き込みスレッドが結果を置くまで、予約し直しながら待つ
+    while writer.outstanding:
+        root.run_timers()
+    assert results == ["done"]
+    assert root.timers == {}
+    writer.close()
+
+
+def test_writer_runs_jobs_inline_after_close():
+    writer = BackgroundWriter(FakeRoot())
+    writer.close()
+    results = []
+    writer.submit(lambda: results.append("write"), done=lambda: results.append("done"))
+    # スレッドはもう無いので、その場で書いて結果も受け取る
+    assert results == ["write", "done"]
+    assert writer.outstanding == 0
+
+
+def load_body_while_locked(store, note_id):
+    """保存用の鍵（lock）を別の処理が持っている間に load_body() を呼び、待たされずに読めるか確かめる。"""
+    result = []
+    reader = threading.Thread(target=lambda: result.append(store.load_body(note_id)))
+    with store.lock:
+        reader.start()
+        reader.join(5)
+        assert not reader.is_alive(), "load_body が保存用の鍵を待っている"
+    return result[0]
+
+
+def test_json_body_read_does_not_wait_for_writer(tmp_path):
+    store = JournalJsonStore(str(tmp_path / "notes.json"))
+    store.save({"next_id": 3, "notes": [
+        {"id": 1, "title": "a", "content": "本文ファイルの本文"},
+    ]})
+    store.save_changes(3, {2: {"id": 2, "title": "b", "content": "ジャーナルの本文"}}, set())
+    assert load_body_while_locked(store, 1) == "本文ファイルの本文"
+    assert load_body_while_locked(store, 2) == "ジャーナルの本文"
+    store.close()
+
+
+def test_json_body_read_follows_new_generations(tmp_path):
+    store = JournalJsonStore(str(tmp_path / "notes.json"))
+    store.save({"next_id": 2, "notes": [{"id": 1, "title": "a", "content": "本文"}]})
+    assert store.load_body(1) == "本文"
+    # 読み込み用に開いている世代のファイルが、2回のコンパクションで消えても読める
+    store.compact()
+    store.compact()
+    assert store.load_body(1) == "本文"
+    assert store.reader[0] == store.bodies_gen
+    store.close()
+
+
+def test_sqlite_body_read_does_not_wait_for_writer(tmp_path):
+    store = SqliteNoteStore(str(tmp_path / "notes.db"))
+    store.save_changes(2, {1: {"id": 1, "title": "a", "content": "データベースの本文"}}, set())
+    assert load_body_while_locked(store, 1) == "データベースの本文"
+    store.close()
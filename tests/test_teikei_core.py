@@ -0,0 +1,223 @@
+# =============================================================================
+# teikei_core.py のテスト(画面を使わないので、どの環境でも python -m pytest で動く)
+# -----------------------------------------------------------------------------
+# 他の人の変更を消さないための保存前の確認(check_conflict)と、
+# zip の取り込みで template-files の外へ書かせないための名前の確認(archive_member_path)を中心に確かめる。
+# =============================================================================
+
+import os
+import zipfile
+
+import pytest
+
+from teikei_core import SaveConflictError, TemplateStore, archive_member_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    """一時フォルダの template-files を使う TemplateStore。"""
+    template_dir = tmp_path / "template-files"
+    template_dir.mkdir()
+    return TemplateStore(template_dir, tmp_path / "cache")
+
+
+def open_template(store, name, content):
+    """ファイルを作って開き、(パス, 開いたときの版) を返す。"""
+    filepath = store.template_dir / name
+    filepath.write_text(content, encoding="utf-8")
+    _, version = store.read_file(filepath)
+    return filepath, version
+
+
+# ===== 1. 保存前の確認(check_conflict) ========================================
+
+def test_save_without_changes_elsewhere(store):
+    filepath, version = open_template(store, "a.txt", "元の内容")
+    new_version = store.write_file(filepath, "新しい内容", expected=version)
+    assert filepath.read_text(encoding="utf-8") == "新しい内容"
+    # 続けて保存するときは、書いた版と比べる
+    store.write_file(filepath, "さらに新しい内容", expected=new_version)
+    assert filepath.read_text(encoding="utf-8") == "さらに新しい内容"
+
+
+def test_same_content_rewrite_is_not_a_conflict(store):
+    filepath, version = open_template(store, "a.txt", "元の内容")
+    # 他の人が同じ内容で保存し直した(更新時刻だけが変わった)
+    filepath.write_text("元の内容", encoding="utf-8")
+    os.utime(filepath, ns=(1, 1))
+    store.write_file(filepath, "自分の変更", expected=version)
+    assert filepath.read_text(encoding="utf-8") == "自分の変更"
+
+
+def test_real_change_elsewhere_is_a_conflict(store):
+    filepath, version = open_template(store, "a.txt", "元の内容")
+    filepath.write_text("他の人の変更", encoding="utf-8")
+    with pytest.raises(SaveConflictError):
+        store.write_file(filepath, "自分の変更", expected=version)
+    # 他の人の変更は残っている
+    assert filepath.read_text(encoding="utf-8") == "他の人の変更"
+
+
+def test_deleted_elsewhere_is_a_conflict(store):
+    filepath, version = open_template(store, "a.txt", "元の内容")
+    filepath.unlink()
+    with pytest.raises(SaveConflictError):
+        store.write_file(filepath, "自分の変更", expected=version)
+    assert not filepath.exists()
+
+
+def test_save_without_expected_overwrites(store):
+    filepath, _ = open_template(store, "a.txt", "元の内容")
+    filepath.write_text("他の人の変更", encoding="utf-8")
+    # 「上書き保存」を選んだとき(版を渡さない)は確かめずに書く
+    store.write_file(filepath, "自分の変更")
+    assert filepath.read_text(encoding="utf-8") == "自分の変更"
+    # 一時ファイルは残らない
+    assert sorted(p.name for p in store.template_dir.iterdir()) == ["a.txt"]
+
+
+# ===== 2. zip の中の名前の確認(archive_member_path) ============================
+
+@pytest.mark.parametrize("name, expected", [
+    ("a.txt", "a.txt"),
+    ("営業/挨拶/お礼.txt", "営業/挨拶/お礼.txt"),
+    ("../a.txt", None),
+    ("営業/../../a.txt", None),
+    ("./a.txt", "a.txt"),
+    ("/etc/passwd", None),
+    ("..\\a.txt", None),
+    ("営業\\a.txt", None),
+    ("C:/a.txt", None),
+    ("C:a.txt", None),
+    (".hidden.txt", None),
+    ("営業/.a.txt.1234.tmp", None),
+    ("", None),
+])
+def test_archive_member_path(name, expected):
+    assert archive_member_path(name) == expected
+
+
+def test_import_archive_skips_unsafe_names(store, tmp_path):
+    archive = tmp_path / "in.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("営業/お礼.txt", "ありがとうございました".encode("cp932"))
+        zf.writestr("../evil.txt", "x")
+        zf.writestr("/abs.txt", "x")
+        zf.writestr("..\\evil2.txt", "x")
+    imported, skipped = store.import_archive(archive)
+    assert imported == ["営業/お礼.txt"]
+    assert skipped == 3
+    assert not (tmp_path / "evil.txt").exists()
+    assert not (tmp_path / "evil2.txt").exists()
+    assert not (tmp_path / "template-files" / "evil.txt").exists()
+    content, _ = store.read_file(store.template_dir / "営業" / "お礼.txt")
+    assert content == "ありがとうございました"
+
+
+def test_export_import_round_trip(store, tmp_path):
+    (store.template_dir / "営業").mkdir()
+    (store.template_dir / "営業" / "お礼.txt").write_bytes("お礼".encode("cp932"))
+    (store.template_dir / "a.txt").write_text("あ", encoding="utf-8")
+    archive = tmp_path / "out.zip"
+    assert store.export_archive(archive) == 2
+
+    other = TemplateStore(tmp_path / "other", tmp_path / "other-cache")
+    other.template_dir.mkdir()
+    imported, skipped = other.import_archive(archive)
+    assert sorted(imported) == ["a.txt", "営業/お礼.txt"]
+    assert skipped == 0
+    # 中身は元の文字コードのまま書かれる
+    assert (other.template_dir / "営業" / "お礼.txt").read_bytes() == "お礼".encode("cp932")
+    # 同じ名前のファイルがあるときは、overwrite=True でなければ取り込まない
+    assert other.import_archive(archive) == ([], 2)
+
+
+# ===== 3. CSV からの差し込み(render_csv) ========================================
+
+def render(store, tmp_path, csv_text):
+    filepath, version = open_template(store, "a.txt", "{{name}} 様")
+    compiled = store.compiler.compile("a.txt", version[:2], "{{name}} 様")
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text(csv_text, encoding="utf-8")
+    return store.render_csv(compiled, csv_path, tmp_path / "out", "a")
+
+
+def test_render_csv(store, tmp_path):
+    assert render(store, tmp_path, "name\n山田\n佐藤\n") == (2, [])
+    assert (tmp_path / "out" / "a-0002.txt").read_text(encoding="utf-8") == "佐藤 様"
+
+
+def test_render_csv_unreadable_csv_is_value_error(store, tmp_path):
+    # csv の欄の長さの上限(131072 文字)を超える行は csv.Error になる。ほかの読み込みエラーと同じ ValueError で返す
+    with pytest.raises(ValueError, match="3 行目"):
+        render(store, tmp_path, "name\n山田\n" + "x" * 140_000 + "\n")
+    assert not (tmp_path / "out").exists()
+
+
+# ===== 4. 目録の保存先 ==========================================================
+
+def test_unwritable_cache_is_not_fatal(tmp_path, capsys):
+    template_dir = tmp_path / "template-files"
+    template_dir.mkdir()
+    (template_dir / "a.txt").write_text("あ", encoding="utf-8")
+    # キャッシュフォルダの場所に、同じ名前のファイルがあって書き込めない
+    cache_dir = tmp_path / ".teikei_cache"
+    cache_dir.write_text("")
+    store = TemplateStore(template_dir, cache_dir)
+    assert store.list_folder() == ([], ["a.txt"])
+    assert store.read_file(template_dir / "a.txt")[0] == "あ"
+    # 知らせは1回だけ出し、目録はメモリの上で使い続ける
+    assert capsys.readouterr().err.count("目録を保存できません") == 1
+    assert store.index_for("").entries["a.txt"]["encoding"] is not None
+
+
+def test_default_cache_dir_is_per_user(tmp_path, monkeypatch):
+    monkeypatch.setattr("sys.platform", "linux")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    template_dir = tmp_path / "shared" / "template-files"
+    template_dir.mkdir(parents=True)
+    (template_dir / "a.txt").write_text("あ", encoding="utf-8")
+    store = TemplateStore(template_dir)
+    store.list_folder()
+    assert store.cache_dir.parent == tmp_path / "xdg" / "teikei"
+    assert (store.cache_dir / "index.json").exists()
+    # 共有フォルダの側には何も書かない
+    assert sorted(p.name for p in (tmp_path / "shared").iterdir()) == ["template-files"]
+    # フォルダが違えば保存先も分ける
+    assert TemplateStore(tmp_path / "other").cache_dir != store.cache_dir
+
+
+# ===== 5. 目録をまとめて書き出す ================================================
+
+def test_read_file_does_not_rewrite_index_each_time(tmp_path):
+    template_dir = tmp_path / "template-files"
+    template_dir.mkdir()
+    (template_dir / "a.txt").write_bytes("あいさつ".encode("cp932"))
+    store = TemplateStore(template_dir, tmp_path / "cache")
+    store.INDEX_SAVE_DELAY = 60  # テストの間にタイマーで書き出されないようにする
+    store.list_folder()
+    saved = (tmp_path / "cache" / "index.json").read_text(encoding="utf-8")
+
+    assert store.read_file(template_dir / "a.txt")[0] == "あいさつ"
+    # 判定した文字コードはメモリの上にだけ記録し、書き出しは予定しておく
+    assert (tmp_path / "cache" / "index.json").read_text(encoding="utf-8") == saved
+    assert store.index_for("").dirty and store.save_timer is not None
+
+    store.save_indexes()
+    assert store.save_timer is None
+    # 次に起動したときは、記録した文字コードを使える
+    again = TemplateStore(template_dir, tmp_path / "cache")
+    assert again.index_for("").entries["a.txt"]["encoding"] == "cp932"
+
+
+def test_cli_saves_index_before_exit(tmp_path, capsys):
+    from teikei_core import main
+
+    template_dir = tmp_path / "template-files"
+    template_dir.mkdir()
+    (template_dir / "a.txt").write_bytes("あいさつ".encode("cp932"))
+    args = ["--dir", str(template_dir), "--cache-dir", str(tmp_path / "cache")]
+    assert main(args + ["show", "a"]) == 0
+    assert capsys.readouterr().out == "あいさつ\n"
+    store = TemplateStore(template_dir, tmp_path / "cache")
+    assert store.index_for("").entries["a.txt"]["encoding"] == "cp932"